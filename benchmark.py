@@ -0,0 +1,38 @@
+import argparse
+import json
+
+from doorDashDelivery import benchmark
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description = 'Benchmark the pipeline on seeded synthetic orders'
+    )
+    parser.add_argument('--orders', type = int, default = 2000)
+    parser.add_argument('--regions', type = int, default = 3)
+    parser.add_argument('--hours', type = float, default = 1.0)
+    parser.add_argument('--seed', type = int, default = 42)
+    parser.add_argument('--result-dir', default = './benchmarks')
+    parser.add_argument('--label', default = 'baseline')
+    parser.add_argument(
+        '--config', default = '{}',
+        help = 'json object of Config parameters to override'
+    )
+    parser.add_argument('--no-trace-memory', action = 'store_true')
+    args = parser.parse_args()
+
+    benchmark.run_generated_benchmark(
+        i_num_orders       = args.orders,
+        s_result_dir       = args.result_dir,
+        s_label            = args.label,
+        i_num_regions      = args.regions,
+        f_time_span_hours  = args.hours,
+        i_seed             = args.seed,
+        d_config_overrides = json.loads(args.config),
+        b_trace_memory     = not args.no_trace_memory
+    )
+
+    print(benchmark.load_results(args.result_dir)[[
+        'time', 'label', 'num_orders', 'wall_sec', 'peak_traced_mb',
+        'objective', 'efficiency', 'passed'
+    ]].to_string(index = False))
\ No newline at end of file
@@ -0,0 +1,139 @@
+import glob
+import json
+import os
+import time
+import tracemalloc
+import pandas as pd
+
+from doorDashDelivery import pipeline
+from doorDashDelivery.utils import data_utils, order_generator, run_metrics
+
+
+def run_generated_benchmark(
+    i_num_orders, s_result_dir, s_label = 'baseline', i_num_regions = 3,
+    f_time_span_hours = 1.0, i_seed = 42, d_config_overrides = None,
+    b_trace_memory = True
+):
+
+    ### the generated input is kept next to the results for reruns
+    os.makedirs(s_result_dir, exist_ok = True)
+    s_input_csv_path = os.path.join(
+        s_result_dir,
+        'orders_{}_{}_{}_{}.csv'.format(i_num_orders, i_num_regions, f_time_span_hours, i_seed)
+    )
+    if not os.path.exists(s_input_csv_path):
+        order_generator.generate_orders(
+            i_num_orders, i_num_regions, f_time_span_hours, i_seed
+        ).to_csv(s_input_csv_path, index = False)
+
+    d_generator = {
+        'num_orders': i_num_orders,
+        'num_regions': i_num_regions,
+        'time_span_hours': f_time_span_hours,
+        'seed': i_seed
+    }
+    return run_benchmark(
+        s_input_csv_path, s_result_dir, s_label, d_config_overrides,
+        b_trace_memory, d_generator
+    )
+
+
+def run_benchmark(
+    s_input_csv_path, s_result_dir, s_label = 'baseline', d_config_overrides = None,
+    b_trace_memory = True, d_generator = None
+):
+    """
+    Runs the pipeline once on the input and saves stage seconds, peak
+    memory, solver objective and validator metrics to a JSON file in
+    s_result_dir, results of every run are compared with load_results.
+    tracemalloc only sees this process, so b_trace_memory solves the
+    batches here one after another instead of in worker processes
+    """
+    os.makedirs(s_result_dir, exist_ok = True)
+    s_output_csv_path = os.path.join(s_result_dir, 'output_{}.csv'.format(s_label))
+    d_config_overrides = dict(d_config_overrides or {})
+    if b_trace_memory:
+        d_config_overrides['b_parallel_batches'] = False
+
+    metrics = run_metrics.reset_metrics()
+    if b_trace_memory:
+        tracemalloc.start()
+
+    f_start_sec = time.perf_counter()
+    df_results = pipeline.run_pipeline(
+        s_input_csv_path, s_output_csv_path,
+        dict(d_config_overrides, b_validate_solution = False)
+    )
+    f_wall_sec = time.perf_counter() - f_start_sec
+
+    i_peak_traced_bytes = None
+    if b_trace_memory:
+        i_peak_traced_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    ### validated outside the timed run
+    config = pipeline.create_config(
+        s_input_csv_path, s_output_csv_path,
+        dict(d_config_overrides, b_validate_solution = True)
+    )
+    d_report = pipeline.validate_results(config, df_results)
+
+    d_metrics = metrics.to_dict()
+    d_result = {
+        'label': s_label,
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'input': s_input_csv_path,
+        'generator': d_generator,
+        'config_overrides': d_config_overrides,
+        'num_orders': d_report['num_deliveries'],
+        'num_routes': d_report['num_routes'],
+        'wall_sec': f_wall_sec,
+        'stage_sec': d_metrics['stage_sec'],
+        'stage_count': d_metrics['stage_count'],
+        'peak_traced_mb': (
+            None if i_peak_traced_bytes is None else i_peak_traced_bytes / 2 ** 20
+        ),
+        'max_rss_mb': get_max_rss_mb(),
+        'objective': d_metrics['values'].get('objective'),
+        'efficiency': d_report['efficiency'],
+        'average_delivery_min': d_report['average_delivery_min'],
+        'passed': d_report['passed']
+    }
+
+    s_result_path = os.path.join(
+        s_result_dir,
+        'benchmark_{}_{}.json'.format(s_label, time.strftime('%Y%m%d_%H%M%S'))
+    )
+    data_utils.saveJson(d_result, s_result_path)
+    metrics.log(1, 'Benchmark result saved to {}'.format(s_result_path))
+
+    return d_result
+
+
+def get_max_rss_mb():
+
+    ### peak resident memory of this process and its finished workers
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    i_max_rss_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+    return i_max_rss_kb / 1024
+
+
+def load_results(s_result_dir):
+
+    ### one row per saved run, nested fields become dotted columns
+    l_results = []
+    for s_path in sorted(glob.glob(os.path.join(s_result_dir, 'benchmark_*.json'))):
+        with open(s_path) as file:
+            l_results.append(json.load(file))
+
+    if not l_results:
+        return pd.DataFrame()
+
+    return pd.json_normalize(l_results).sort_values('time', kind = 'stable')
\ No newline at end of file
@@ -1,7 +1,8 @@
 import os
+import numpy as np
 import pandas as pd
 
-from doorDashDelivery.utils import data_utils as du
+from doorDashDelivery.utils import travel_time
 
 class Config:
 
@@ -21,25 +22,236 @@ class Config:
         self.i_available_dasher_each_batch = 2
         self.i_num_order_each_batch = 6
         self.i_num_clusters = 20
+
+        # console output: 0 quiet, 1 run summaries, 2 batch progress and
+        # solver logs, 3 every route. s_trace_path writes nested stage
+        # spans and solver counters as a Chrome trace (chrome://tracing),
+        # s_profile_path the cProfile stats of the main process
+        self.i_verbosity = 1
+        self.s_trace_path = None
+        self.s_profile_path = None
+
+        # the input is read this many rows at a time into the order store
+        self.i_input_chunk_rows = 100000
+
+        # result rows are appended to the output batch by batch and the
+        # finished batches recorded in a manifest next to it, a run with
+        # b_resume keeps the batches an interrupted run finished
+        self.b_resume = False
+
+        # once every batch is solved, a route is chained after the route of
+        # another batch whose dasher reaches its first pickup on time, at
+        # most f_chain_max_idle_sec after the last drop-off, so fewer
+        # dashers drive the same routes. Candidate pairs are checked
+        # i_chain_chunk_pairs at a time and each route end keeps the
+        # i_chain_max_candidates next routes of least idle time
+        self.b_chain_routes = True
+        self.f_chain_max_idle_sec = 3600
+        self.i_chain_max_candidates = 20
+        self.i_chain_chunk_pairs = 1000000
+
+        # 'kmeans_slice' clusters pickups then cuts fixed slices,
+        # 'spatio_temporal' groups pickup, drop-off and food ready time
+        # into capacity-bounded batches inside each region
+        self.s_batching = 'spatio_temporal'
+        self.f_batching_time_weight = 1.0
+        self.i_batching_cell_orders = 600
+
+        # above this many orders the full travel-time matrix is not kept in
+        # memory, each batch then computes its own block vectorized. The
+        # full matrix is float32, filled i_travel_time_chunk_rows origins
+        # at a time so the float64 temporaries stay small
+        self.i_max_orders_full_matrix = 4000
+        self.i_travel_time_chunk_rows = 256
+
+        # travel time between locations: 'haversine' straight line at
+        # f_drive_speed_mps, 'speed_profile' straight line at the
+        # l_speed_profile_mps speed (24 hourly, UTC) of each batch's
+        # departure, its start or first food ready time if later,
+        # 'road_graph' shortest paths over the edges csv s_road_graph_path.
+        # Road graph pairs are kept in a memory-mapped cache under
+        # s_travel_time_cache_dir shared by batches, route chaining and
+        # runs, keyed by coordinates rounded to i_travel_time_cache_decimals
+        self.s_travel_time_provider = 'haversine'
+        self.l_speed_profile_mps = None
+        self.s_road_graph_path = None
+        self.s_travel_time_cache_dir = './travel_time_cache'
+        self.i_travel_time_cache_decimals = 5
         self.df_0_time_unix = (
             pd.to_datetime(['2015-02-03 02:00:00'])
         ).astype(int) // 10 ** 9
 
+        # solve time: one wall-clock budget for all batches, handed out
+        # adaptively by hardness (orders ** exponent) when enabled, a
+        # solve stops early at the mip gap or once the incumbent stalls
+        self.f_total_solving_sec = 60
+        self.b_adaptive_time_budget = True
+        self.f_budget_hardness_exponent = 2
+        self.f_min_solving_sec = 0.05
+        self.f_mip_gap = 1e-4
+        self.f_stall_sec = 1.0
+
+        # seconds each backend needs per unit of batch hardness, a batch
+        # holds at most i_num_order_each_batch orders and fewer when its
+        # share of the solve time could not finish a batch that size, but
+        # no fewer than i_min_order_each_batch, below which the dashers of
+        # a batch have too little to share
+        self.i_min_order_each_batch = 3
+        self.d_backend_sec_per_hardness = {
+            'gurobi': 0.02,
+            'highs': 0.05,
+            'set_partitioning': 0.015,
+            'heuristic': 0.0005
+        }
+
+        # rolling horizon dispatch: orders are re-optimized every epoch and
+        # routes whose first pickup is within the commit lead are committed
+        self.f_dispatch_epoch_sec = 120
+        self.f_dispatch_commit_lead_sec = 300
+        self.f_dispatch_solving_sec = 0.5
+
+        # parallel batch solving, i_num_cores = 0 means every available core
+        self.b_parallel_batches = True
+        self.i_num_cores = 0
+        self.i_min_threads_each_solve = 1
+        self.i_num_workers = 1
+        self.i_solver_threads = 8
+
+        # 'gurobi' solves each batch as a MIP, 'highs' solves the same MIP
+        # (its matrix build) with HiGHS through scipy, no gurobi license
+        # needed, 'heuristic' with the solver-free insertion and local
+        # search engine, 'set_partitioning'
+        # over scheduled routes, every route of each order subset up to
+        # i_sp_max_enumeration_orders orders and column generation above,
+        # pricing keeps the i_sp_max_labels_per_layer cheapest partial routes
+        self.s_solver_backend = 'gurobi'
+        self.i_local_search_max_rounds = 50
+        self.i_sp_max_enumeration_orders = 8
+        self.i_sp_max_labels_per_layer = 500
+        self.i_sp_max_columns_per_pricing = 20
+        self.i_sp_max_iterations = 50
+
+        # 'expression' builds the MIP with gurobipy expressions,
+        # 'matrix' with addMVar / addMConstr over sparse coefficient arrays
+        self.s_model_build = 'expression'
+        self.b_variable_names = True
+
+        # with the matrix build, one model per batch shape is built once and
+        # every later batch of that shape only updates bounds, right-hand
+        # sides and coefficients in place, the least recently used of more
+        # than i_max_template_models shapes is disposed
+        self.b_template_model = False
+        self.i_max_template_models = 4
+
+        # big-M of the travel time and stop order rows: per arc from the
+        # batch's time windows, or the old constants 1000000 and len(nodes).
+        # Indicator constraints replace both big-M rows, template models
+        # are then not used since indicators can not be updated in place
+        self.b_tight_big_m = True
+        self.b_indicator_constraints = False
+
+        # optional strengthening rows, each switchable to benchmark it:
+        # dashers are used in order, orders go to dashers lexicographically
+        # with the earliest ready order on the first dasher, at most one
+        # direction between two stops is used, and a drop-off follows its
+        # pickup by at least the shortest trip between them
+        self.b_symmetry_dasher_usage = True
+        self.b_symmetry_order_assignment = True
+        self.b_two_cycle_cuts = True
+        self.b_precedence_cuts = True
+
+        # start every solve from a greedy insertion solution
+        self.b_warm_start = True
+
+        # flag identical constraint rows while building each MIP, a
+        # diagnostic that costs build time, so off in production runs
+        self.b_check_duplicate_constraints = False
+
+        # check the routes of every run against its orders
+        self.b_validate_solution = True
+
+        # per-batch model and solution files: 'off', 'plain' (.lp / .json)
+        # or 'compressed' (.mps.bz2 / .json.gz), async writes json files
+        # and compresses models from a background thread through a bounded
+        # queue, the model itself is still written uncompressed in the solve
         self.l_solution_dir = './raw_solutions'
-        try:
-            os.mkdir(self.l_solution_dir)
-        except:
-            pass
+        self.s_artifact_mode = 'plain'
+        self.b_artifact_async = False
+        self.i_artifact_queue_size = 8
 
     def get_solving_time_each_batch(self, i_num_orders):
         self.f_solving_sec = round(
-            60 / (i_num_orders / self.i_num_order_each_batch),
+            self.f_total_solving_sec / (i_num_orders / self.get_batch_capacity(i_num_orders)),
             2
         )
 
-    def create_important_data(self, l_input_data, i_batch_idx):
+    def get_batch_capacity(self, i_num_orders = None):
+        """
+        The most orders of a batch the backend finishes within the time
+        the batch gets: f_total_solving_sec shared by i_num_orders orders
+        cut into batches of that size, or f_solving_sec per batch when no
+        order count is given. Never below i_min_order_each_batch
+        """
+        f_sec_per_hardness = self.d_backend_sec_per_hardness[self.s_solver_backend]
+        i_min_capacity = min(self.i_min_order_each_batch, self.i_num_order_each_batch)
+        for i_capacity in range(self.i_num_order_each_batch, i_min_capacity, -1):
+            if i_num_orders is None:
+                f_slice_sec = self.f_solving_sec
+            else:
+                f_slice_sec = (
+                    self.f_total_solving_sec * i_capacity / max(i_num_orders, i_capacity)
+                )
+            if f_sec_per_hardness * i_capacity ** self.f_budget_hardness_exponent <= f_slice_sec:
+                return i_capacity
+
+        return i_min_capacity
+
+    def get_batch_hardness(self, orders_batch):
+        return len(orders_batch) ** self.f_budget_hardness_exponent
+
+    def get_strengthening_families(self):
+
+        ### in the order every MIP build adds them
+        return [
+            s_family
+            for s_family, b_enabled in [
+                ('symmetry_dasher_usage', self.b_symmetry_dasher_usage),
+                ('symmetry_order_assignment', self.b_symmetry_order_assignment),
+                ('two_cycle_cuts', self.b_two_cycle_cuts),
+                ('precedence_cuts', self.b_precedence_cuts)
+            ]
+            if b_enabled
+        ]
 
-        self.l_input_data = l_input_data
+    def get_parallel_plan(self, i_num_batches):
+
+        ### split the cores between concurrent solves and gurobi threads
+        if self.i_num_cores > 0:
+            i_num_cores = self.i_num_cores
+        elif hasattr(os, 'sched_getaffinity'):
+            i_num_cores = len(os.sched_getaffinity(0))
+        else:
+            i_num_cores = os.cpu_count() or 1
+
+        if self.b_parallel_batches:
+            self.i_num_workers = max(
+                1,
+                min(
+                    i_num_batches,
+                    i_num_cores // self.i_min_threads_each_solve
+                )
+            )
+        else:
+            self.i_num_workers = 1
+
+        self.i_solver_threads = max(1, i_num_cores // self.i_num_workers)
+
+    def create_important_data(self, orders, i_batch_idx, f_start_sec = 0):
+
+        self.orders = orders
+
+        # dashers leave source no earlier than this
+        self.f_start_sec = f_start_sec
 
         ### this is the worst case, that means every dash handles one order
         self.l_dashers = [
@@ -49,54 +261,283 @@ class Config:
                 self.i_available_dasher_each_batch * i_batch_idx
             )
         ]
-        self.d_pickup_time_for_customers = {
-            # the lower bound for customer x, is the food ready time
-            'c{:03d}'.format(d['delivery_id']): d['food_ready_time']
-            for d in l_input_data
-        }
-        self.d_order_create_time_for_customers = {
-            'c{:03d}'.format(d['delivery_id']): d['created_at']
-            for d in l_input_data
-        }
 
-        d_r_coords = {
-            'r{:03d}'.format(d['delivery_id']): (
-                (d['pickup_lat'], d['pickup_long'])
-            )
-            for d in l_input_data
+        self.arr_delivery_id = orders['delivery_id']
+        # the lower bound for customer x, is the food ready time
+        self.arr_food_ready_sec = orders['food_ready_time'].astype(np.float64)
+        self.arr_created_sec = orders['created_at'].astype(np.float64)
+
+        self.l_restaurants = [
+            'r{:03d}'.format(i_delivery_id) for i_delivery_id in self.arr_delivery_id.tolist()
+        ]
+        self.l_customers = [
+            'c{:03d}'.format(i_delivery_id) for i_delivery_id in self.arr_delivery_id.tolist()
+        ]
+        self.l_physical_locations = (
+            self.l_restaurants
+            +
+            self.l_customers
+        )
+        self.l_nodes = self.l_physical_locations + ['target', 'source']
+        self.d_node_idx = {
+            s_node: i for i, s_node in enumerate(self.l_nodes)
         }
 
-        d_c_coords = {
-            'c{:03d}'.format(d['delivery_id']): (
-                [d['dropoff_lat'], d['dropoff_long']]
+        ### travel time between nodes, indexed like l_nodes,
+        ### source and target are 0 seconds away from everything
+        i_num_locations = len(self.l_physical_locations)
+        self.arr_time_sec = np.zeros(
+            (len(self.l_nodes), len(self.l_nodes))
+        )
+        self.arr_time_sec[: i_num_locations, : i_num_locations] = (
+            self.get_travel_time_block(
+                orders['position'],
+                ### no dasher leaves a restaurant before the start or the
+                ### batch's first food ready time, whichever is later
+                max(f_start_sec, self.arr_food_ready_sec.min()) if len(orders)
+                else f_start_sec
             )
-            for d in l_input_data
-        }
+        )
 
-        d_coords = {
-            **d_r_coords, **d_c_coords
-        }
+        # orders from the earliest food ready time, ties by batch position
+        self.arr_order_by_ready = np.argsort(self.arr_food_ready_sec, kind = 'stable')
+        self._create_feasible_arcs()
+        self._create_time_bounds()
 
+    def _create_feasible_arcs(self):
 
-        self.l_restaurants = list(d_r_coords.keys())
-        self.l_customers   = list(d_c_coords.keys())
-        self.l_physical_locations = (
-            self.l_restaurants
+        i_num_orders = len(self.l_restaurants)
+        arr_direct_sec = np.diagonal(
+            self.arr_time_sec[: i_num_orders, i_num_orders : 2 * i_num_orders]
+        )
+        # legs are rounded to the second, a detour can undercut the direct
+        # trip by at most half a second per leg
+        self.arr_min_pickup_to_dropoff_sec = np.maximum(
+            1, arr_direct_sec - i_num_orders
+        )
+
+        ### latest plausible arrival: with every food ready, any stop of an
+        ### earliest schedule is reached within one longest leg of the previous
+        self.f_latest_sec = (
+            max(self.f_start_sec, self.arr_food_ready_sec.max())
             +
-            self.l_customers
+            (2 * i_num_orders - 1) * (self.arr_time_sec.max() + 1)
         )
-        self.l_nodes = self.l_physical_locations + ['target', 'source']
 
-        self.d_time_sec =  {
-            (s_orig, s_dest): round(du.haversine(
-                d_coords[s_orig], d_coords[s_dest]
-            ) / 4.5, 0)
-            for s_orig in self.l_physical_locations
-            for s_dest in self.l_physical_locations
+        ### earliest time a dasher can leave each node
+        self.d_earliest_departure_sec = {
+            'source': self.f_start_sec, 'target': self.f_start_sec
         }
+        for i, (s_restaurant_id, s_customer_id) in enumerate(
+            zip(self.l_restaurants, self.l_customers)
+        ):
+            self.d_earliest_departure_sec[s_restaurant_id] = max(
+                self.f_start_sec, self.arr_food_ready_sec[i]
+            )
+            self.d_earliest_departure_sec[s_customer_id] = (
+                self.d_earliest_departure_sec[s_restaurant_id]
+                +
+                self.arr_min_pickup_to_dropoff_sec[i]
+            )
+
+        set_own_restaurant_arcs = set(
+            zip(self.l_customers, self.l_restaurants)
+        )
+        d_restaurant_order = {
+            s_restaurant_id: i
+            for i, s_restaurant_id in enumerate(self.l_restaurants)
+        }
+        set_restaurants = set(self.l_restaurants)
+        set_customers   = set(self.l_customers)
+
+        # a template model needs the same arcs for every batch of a shape,
+        # arcs ruled out by time are then kept and fixed to 0 by the model
+        b_keep_time_infeasible_arcs = (
+            self.b_template_model
+            and self.s_model_build == 'matrix'
+            and not self.b_indicator_constraints
+        )
+
+        self.l_arcs = []
+        self.set_time_infeasible_arcs = set()
+        for s_arc_orig in self.l_nodes:
+
+            if s_arc_orig == 'target':
+                continue
+
+            for s_arc_dest in self.l_nodes:
+
+                if (
+                    s_arc_dest == s_arc_orig
+                    or
+                    s_arc_dest == 'source'
+                    or
+                    (s_arc_orig in set_restaurants and s_arc_dest == 'target')
+                    or
+                    (s_arc_orig == 'source' and s_arc_dest in set_customers)
+                    or
+                    (s_arc_orig, s_arc_dest) in set_own_restaurant_arcs
+                ):
+                    continue
+
+                # time windows: the stop, or the drop-off it still owes,
+                # can not be reached before the latest plausible arrival
+                f_arrival_sec = (
+                    self.d_earliest_departure_sec[s_arc_orig]
+                    +
+                    self.arr_time_sec[
+                        self.d_node_idx[s_arc_orig], self.d_node_idx[s_arc_dest]
+                    ]
+                )
+                if s_arc_dest in set_restaurants:
+                    i = d_restaurant_order[s_arc_dest]
+                    f_arrival_sec = (
+                        max(f_arrival_sec, self.arr_food_ready_sec[i])
+                        +
+                        self.arr_min_pickup_to_dropoff_sec[i]
+                    )
+                if f_arrival_sec > self.f_latest_sec:
+                    if not b_keep_time_infeasible_arcs:
+                        continue
+                    self.set_time_infeasible_arcs.add((s_arc_orig, s_arc_dest))
+
+                self.l_arcs.append((s_arc_orig, s_arc_dest))
+
+        self.d_arcs_out = {s_node: [] for s_node in self.l_nodes}
+        self.d_arcs_in  = {s_node: [] for s_node in self.l_nodes}
+        for (s_arc_orig, s_arc_dest) in self.l_arcs:
+            self.d_arcs_out[s_arc_orig].append(s_arc_dest)
+            self.d_arcs_in[s_arc_dest].append(s_arc_orig)
+
+    def _create_time_bounds(self):
+
+        ### bounds of t, w and u per node, the big-M of every arc follows
+        i_num_orders = len(self.l_restaurants)
+        i_num_nodes  = len(self.l_nodes)
+        i_source = self.d_node_idx['source']
+        i_target = self.d_node_idx['target']
+        arr_arc_orig = np.array(
+            [self.d_node_idx[s_arc_orig] for (s_arc_orig, _) in self.l_arcs],
+            dtype = np.int64
+        )
+        arr_arc_dest = np.array(
+            [self.d_node_idx[s_arc_dest] for (_, s_arc_dest) in self.l_arcs],
+            dtype = np.int64
+        )
+
+        self.arr_t_lb = np.zeros(i_num_nodes)
+        self.arr_t_lb[i_num_orders : 2 * i_num_orders] = self.arr_food_ready_sec
+        self.arr_t_lb[i_source] = self.f_start_sec
+        self.arr_t_ub = np.full(i_num_nodes, np.inf)
+        self.arr_w_ub = np.full(i_num_nodes, np.inf)
+        self.arr_u_ub = np.full(i_num_nodes, np.inf)
+
+        if not self.b_tight_big_m:
+            self.arr_arc_travel_big_m = np.full(len(self.l_arcs), 1000000.0)
+            self.arr_arc_order_big_m  = np.full(len(self.l_arcs), float(i_num_nodes))
+            return
+
+        # an earliest schedule starts at the start time, reaches a customer
+        # no sooner than its shortest trip after the food is picked up and
+        # every node by the latest plausible arrival
+        self.arr_t_lb = np.maximum(self.arr_t_lb, self.f_start_sec)
+        self.arr_t_lb[i_num_orders : 2 * i_num_orders] = (
+            np.maximum(self.f_start_sec, self.arr_food_ready_sec)
+            + self.arr_min_pickup_to_dropoff_sec
+        )
+        self.arr_t_ub[:] = self.f_latest_sec
+
+        # only restaurants are waited at, until the food is ready
+        self.arr_w_ub[:] = 0
+        self.arr_w_ub[: i_num_orders] = np.maximum(
+            0, self.arr_food_ready_sec - self.f_start_sec
+        )
+
+        # stops are numbered from 0 at source, a restaurant is always
+        # followed by its customer
+        self.arr_u_ub[: i_num_orders] = 2 * i_num_orders - 1
+        self.arr_u_ub[i_num_orders : 2 * i_num_orders] = 2 * i_num_orders
+        self.arr_u_ub[i_target] = 2 * i_num_orders + 1
+        self.arr_u_ub[i_source] = 0
+
+        ### the least M that leaves an unused arc's row slack over the bounds
+        self.arr_arc_travel_big_m = (
+            self.arr_t_ub[arr_arc_orig]
+            + self.arr_w_ub[arr_arc_orig]
+            + self.arr_time_sec[arr_arc_orig, arr_arc_dest]
+            - self.arr_t_lb[arr_arc_dest]
+        )
+        self.arr_arc_order_big_m = self.arr_u_ub[arr_arc_orig] + 1
+
+    def create_travel_time_matrix(self, orders):
+
+        ### computed once per run, restaurants take rows [0, n),
+        ### customers take rows [n, 2n), n in order of position
+        self.i_num_all_orders = len(orders)
+        self.arr_location_lat = np.empty(2 * self.i_num_all_orders)
+        self.arr_location_long = np.empty(2 * self.i_num_all_orders)
+        for i_offset, s_prefix in [(0, 'pickup'), (self.i_num_all_orders, 'dropoff')]:
+            self.arr_location_lat[orders['position'] + i_offset] = orders[s_prefix + '_lat']
+            self.arr_location_long[orders['position'] + i_offset] = orders[s_prefix + '_long']
+
+        self.travel_time_provider = travel_time.create_provider(self)
+        self.travel_time_cache = travel_time.create_cache(self, self.travel_time_provider)
+
+        # time dependent and cached providers answer batch by batch
+        if (
+            self.i_num_all_orders <= self.i_max_orders_full_matrix
+            and
+            not self.travel_time_provider.b_time_dependent
+            and
+            self.travel_time_cache is None
+        ):
+            self.arr_all_time_sec = self._compute_full_travel_time()
+        else:
+            self.arr_all_time_sec = None
+
+    def get_travel_time_block(self, arr_order_idx, f_depart_sec = 0):
+
+        ### restaurants of the orders first, then their customers
+        arr_location_idx = np.concatenate(
+            [arr_order_idx, arr_order_idx + self.i_num_all_orders]
+        )
+        if self.arr_all_time_sec is None:
+            return self._compute_travel_time(arr_location_idx, f_depart_sec)
+
+        return self.arr_all_time_sec[
+            np.ix_(arr_location_idx, arr_location_idx)
+        ]
+
+    def _compute_full_travel_time(self):
+
+        ### same seconds as _compute_travel_time, a chunk of rows at a time
+        i_num_locations = 2 * self.i_num_all_orders
+        arr_time_sec = np.empty((i_num_locations, i_num_locations), dtype = np.float32)
+        for i_row_start in range(0, i_num_locations, self.i_travel_time_chunk_rows):
+            rows = slice(i_row_start, i_row_start + self.i_travel_time_chunk_rows)
+            arr_time_sec[rows] = np.round(
+                self.travel_time_provider.get_pair_time_sec(
+                    self.arr_location_lat[rows, np.newaxis],
+                    self.arr_location_long[rows, np.newaxis],
+                    self.arr_location_lat[np.newaxis, :],
+                    self.arr_location_long[np.newaxis, :],
+                    int(self.df_0_time_unix[0])
+                ),
+                0
+            )
+
+        return arr_time_sec
+
+    def _compute_travel_time(self, arr_location_idx, f_depart_sec = 0):
+
+        arr_lat  = self.arr_location_lat[arr_location_idx]
+        arr_long = self.arr_location_long[arr_location_idx]
 
-        for s_loc in self.l_nodes:
-            self.d_time_sec['source', s_loc] = 0
-            self.d_time_sec['target', s_loc] = 0
-            self.d_time_sec[s_loc, 'source'] = 0
-            self.d_time_sec[s_loc, 'target'] = 0
+        return np.round(
+            travel_time.get_time_matrix_sec(
+                self.travel_time_provider, arr_lat, arr_long,
+                f_depart_sec + int(self.df_0_time_unix[0]),
+                self.travel_time_cache, self.i_travel_time_cache_decimals
+            ),
+            0
+        ).astype(np.float32)
\ No newline at end of file
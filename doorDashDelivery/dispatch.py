@@ -0,0 +1,127 @@
+import time
+import numpy as np
+
+from doorDashDelivery import pipeline
+from doorDashDelivery.utils import artifact_writer, result_writer, run_metrics
+
+
+def run_rolling_horizon(s_input_csv_path, s_output_csv_path, d_config_overrides = None):
+
+    f_start_time = time.time()
+
+    ### initalize configuration
+    config = pipeline.create_config(
+        s_input_csv_path, s_output_csv_path, d_config_overrides
+    )
+    config.f_solving_sec = config.f_dispatch_solving_sec
+    metrics = run_metrics.configure_metrics(config)
+    config.get_parallel_plan(1)
+
+    ### orders are replayed in the order they were created,
+    ### open orders are rows of that store
+    orders = pipeline.parse_input(config)
+    config.create_travel_time_matrix(orders)
+    orders = orders.sort_by(['created_at'])
+
+    l_results = []
+    arr_open = np.empty(0, dtype = np.int64)
+    l_epoch_sec = []
+    i_next_order = 0
+    i_batch_idx = 1
+    f_epoch_time_sec = orders['created_at'][0] if len(orders) else 0
+    while i_next_order < len(orders) or len(arr_open):
+
+        f_epoch_start_time = time.time()
+
+        ### release the orders created up to this epoch
+        i_released = int(
+            np.searchsorted(orders['created_at'], f_epoch_time_sec, side = 'right')
+        )
+        arr_open = np.concatenate([arr_open, np.arange(i_next_order, i_released)])
+        i_next_order = max(i_next_order, i_released)
+
+        # once every order has arrived there is nothing to wait for
+        b_commit_all = i_next_order == len(orders)
+
+        set_committed_ids = set()
+        for orders_batch in split_open_orders(config, orders[arr_open]):
+
+            l_batch_results = pipeline.solve_batch(
+                config, orders_batch, i_batch_idx, f_epoch_time_sec
+            )
+            i_batch_idx += 1
+
+            for l_route in group_routes(l_batch_results):
+                if b_commit_all or is_route_starting(
+                    config, l_route, f_epoch_time_sec
+                ):
+                    l_results += l_route
+                    set_committed_ids.update(l_row[2] for l_row in l_route)
+
+        arr_open = arr_open[
+            ~ np.isin(orders['delivery_id'][arr_open], list(set_committed_ids))
+        ]
+        l_epoch_sec.append(time.time() - f_epoch_start_time)
+        f_epoch_time_sec += config.f_dispatch_epoch_sec
+
+        # with nothing open, the epochs before the next order are empty
+        if not len(arr_open) and i_next_order < len(orders):
+            f_epoch_time_sec = max(
+                f_epoch_time_sec, orders['created_at'][i_next_order]
+            )
+    pipeline.dispose_solver_resources(config)
+    artifact_writer.close_writer()
+
+    f_end_time = time.time()
+    metrics.log(1, '---------------------------------------------')
+    metrics.log(1, '{} epochs, mean {} second, max {} second per epoch'.format(
+        len(l_epoch_sec),
+        round(sum(l_epoch_sec) / max(1, len(l_epoch_sec)), 3),
+        round(max(l_epoch_sec, default = 0), 3)
+    ))
+    metrics.log(1, 'The program takes {} second to run'.format(
+        round(f_end_time - f_start_time, 0)
+    ))
+
+    df_results = pipeline.save_results(l_results, s_output_csv_path)
+    if config.b_chain_routes:
+        df_results = pipeline.chain_results(config, df_results, orders)
+        result_writer.replace_results(s_output_csv_path, df_results)
+
+    if config.s_trace_path is not None:
+        metrics.write_trace(config.s_trace_path)
+    pipeline.validate_results(config, df_results)
+
+    return df_results
+
+
+def split_open_orders(config, open_orders):
+
+    ### nearby and similarly timed orders share a batch, as many as
+    ### the backend solves within each batch's f_solving_sec
+    return pipeline.slice_batches(
+        config, open_orders.sort_by(['region_id', 'food_ready_time', 'delivery_id']),
+        config.get_batch_capacity()
+    )
+
+
+def group_routes(l_batch_results):
+
+    ### result rows are ordered by route, then by route point index
+    d_routes = {}
+    for l_row in l_batch_results:
+        d_routes.setdefault(l_row[0], []).append(l_row)
+
+    return list(d_routes.values())
+
+
+def is_route_starting(config, l_route, f_epoch_time_sec):
+
+    ### the first row of a route is its first pickup
+    f_first_pickup_sec = l_route[0][4] - int(config.df_0_time_unix[0])
+
+    return (
+        f_first_pickup_sec
+        <=
+        f_epoch_time_sec + config.f_dispatch_commit_lead_sec
+    )
@@ -0,0 +1,44 @@
+import json
+
+
+class MIPBuildStats():
+
+    def __init__(self, i_batch_idx):
+
+        self.i_batch_idx = i_batch_idx
+
+        ### one entry per construction step, in build order
+        self.l_families = []
+
+    def add_family(
+        self, s_family, f_build_sec, i_num_vars, i_num_constrs,
+        i_num_duplicate_rows = None
+    ):
+
+        self.l_families.append({
+            'family': s_family,
+            'build_sec': round(f_build_sec, 6),
+            'num_vars': i_num_vars,
+            'num_constrs': i_num_constrs,
+            'num_duplicate_rows': i_num_duplicate_rows
+        })
+
+    def get_total_build_sec(self):
+        return sum(d['build_sec'] for d in self.l_families)
+
+    def get_num_duplicate_rows(self):
+        return sum(d['num_duplicate_rows'] or 0 for d in self.l_families)
+
+    def to_dict(self):
+
+        return {
+            'batch': self.i_batch_idx,
+            'total_build_sec': round(self.get_total_build_sec(), 6),
+            'num_vars': sum(d['num_vars'] for d in self.l_families),
+            'num_constrs': sum(d['num_constrs'] for d in self.l_families),
+            'num_duplicate_rows': self.get_num_duplicate_rows(),
+            'families': self.l_families
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent = 4)
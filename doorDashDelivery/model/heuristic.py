@@ -0,0 +1,393 @@
+import numpy as np
+
+from doorDashDelivery.model import solution
+
+
+def schedule_route(config, l_route):
+    """
+    Earliest schedule of a route, a list of node indices into
+    config.l_nodes without source and target. Returns arrival and
+    waiting seconds of every stop and the route's delivery seconds
+    """
+    i_num_orders = len(config.l_restaurants)
+
+    arr_arrival_sec = np.zeros(len(l_route))
+    arr_wait_sec    = np.zeros(len(l_route))
+    d_pickup_departure_sec = {}
+    f_cost_sec = 0
+
+    i_prev_node = None
+    f_departure_sec = config.f_start_sec
+    for i, i_node in enumerate(l_route):
+
+        # source is 0 seconds away from every stop
+        if i_prev_node is None:
+            f_arrival_sec = f_departure_sec
+        else:
+            f_arrival_sec = (
+                f_departure_sec + config.arr_time_sec[i_prev_node, i_node]
+            )
+
+        if i_node < i_num_orders:
+            # wait at restaurant if the food is not ready yet
+            arr_wait_sec[i] = max(
+                0, config.arr_food_ready_sec[i_node] - f_arrival_sec
+            )
+            d_pickup_departure_sec[i_node] = f_arrival_sec + arr_wait_sec[i]
+        else:
+            i_order = i_node - i_num_orders
+            f_arrival_sec = max(
+                f_arrival_sec,
+                d_pickup_departure_sec[i_order] + 1,
+                config.arr_food_ready_sec[i_order]
+            )
+            f_cost_sec += f_arrival_sec - config.arr_created_sec[i_order]
+
+        arr_arrival_sec[i] = f_arrival_sec
+        f_departure_sec = f_arrival_sec + arr_wait_sec[i]
+        i_prev_node = i_node
+
+    return arr_arrival_sec, arr_wait_sec, f_cost_sec
+
+
+class RouteSchedule():
+    """
+    Earliest schedule of a route on existing arcs kept per position:
+    departure and delivery seconds after each stop and the departure of
+    every pickup. A changed copy of the route is checked and scheduled
+    from its first changed position only, and where it joins the tail
+    of the route again the rest is taken from here when its departures
+    and the pickups on board are unchanged
+    """
+
+    def __init__(self, config, arr_arc_exists, l_route):
+
+        ### plain lists, a schedule reads them one stop at a time
+        self.l_time_sec = config.arr_time_sec.tolist()
+        self.l_food_ready_sec = config.arr_food_ready_sec.tolist()
+        self.l_created_sec = config.arr_created_sec.tolist()
+        self.l_arc_exists = arr_arc_exists.tolist()
+        self.i_num_orders = len(config.l_restaurants)
+        self.i_source = config.d_node_idx['source']
+        self.i_target = config.d_node_idx['target']
+        self.l_route = list(l_route)
+
+        l_path = [self.i_source] + self.l_route + [self.i_target]
+        self.b_on_arcs = all(
+            self.l_arc_exists[i_orig][i_dest]
+            for i_orig, i_dest in zip(l_path[: -1], l_path[1 :])
+        )
+
+        ### index k holds the state after the first k stops
+        self.l_departure_sec = [config.f_start_sec]
+        self.l_cost_sec = [0]
+        self.d_pickup_departure_sec = {}
+        self.d_pickup_position = {}
+        self.l_on_board = [[]]
+        for i, i_node in enumerate(self.l_route):
+            (f_departure_sec, f_cost_sec) = self._visit(
+                self.l_route[i - 1] if i > 0 else None, i_node,
+                self.l_departure_sec[-1], self.l_cost_sec[-1],
+                self.d_pickup_departure_sec
+            )
+            l_on_board = list(self.l_on_board[-1])
+            if i_node < self.i_num_orders:
+                self.d_pickup_departure_sec[i_node] = f_departure_sec
+                self.d_pickup_position[i_node] = i
+                l_on_board.append(i_node)
+            else:
+                l_on_board.remove(i_node - self.i_num_orders)
+            self.l_departure_sec.append(f_departure_sec)
+            self.l_cost_sec.append(f_cost_sec)
+            # orders picked up before position k and dropped off at k or later
+            self.l_on_board.append(l_on_board)
+        self.f_cost_sec = self.l_cost_sec[-1]
+
+    def _visit(self, i_prev_node, i_node, f_departure_sec, f_cost_sec, d_pickup_departure_sec):
+
+        ### one step of schedule_route, None if the order is not picked up
+        f_arrival_sec = f_departure_sec
+        if i_prev_node is not None:
+            f_arrival_sec += self.l_time_sec[i_prev_node][i_node]
+
+        if i_node < self.i_num_orders:
+            return max(f_arrival_sec, self.l_food_ready_sec[i_node]), f_cost_sec
+
+        i_order = i_node - self.i_num_orders
+        if i_order not in d_pickup_departure_sec:
+            return None
+        f_arrival_sec = max(
+            f_arrival_sec,
+            d_pickup_departure_sec[i_order] + 1,
+            self.l_food_ready_sec[i_order]
+        )
+        return f_arrival_sec, f_cost_sec + f_arrival_sec - self.l_created_sec[i_order]
+
+    def get_cost(self, l_candidate, f_cost_bound = None, b_check_arcs = True):
+        """
+        Delivery seconds of l_candidate as schedule_route counts them,
+        None if it leaves the arcs (when b_check_arcs), drops an order
+        off before its pickup or costs f_cost_bound or more
+        """
+        l_route = self.l_route
+        i_num_stops = len(l_candidate)
+        i_num_common = min(len(l_route), i_num_stops)
+        i_prefix = 0
+        while i_prefix < i_num_common and l_route[i_prefix] == l_candidate[i_prefix]:
+            i_prefix += 1
+        i_suffix = 0
+        while i_suffix < i_num_common - i_prefix and (
+            l_route[-1 - i_suffix] == l_candidate[-1 - i_suffix]
+        ):
+            i_suffix += 1
+        i_join = i_num_stops - i_suffix
+
+        ### only arcs touching a changed stop can be missing, unless this
+        ### route already left the arcs
+        if b_check_arcs:
+            l_arc_exists = self.l_arc_exists
+            for j in range(
+                i_prefix - 1 if self.b_on_arcs else -1,
+                i_join if self.b_on_arcs else i_num_stops
+            ):
+                i_orig = self.i_source if j < 0 else l_candidate[j]
+                i_dest = self.i_target if j + 1 == i_num_stops else l_candidate[j + 1]
+                if not l_arc_exists[i_orig][i_dest]:
+                    return None
+
+        # pickups of the common prefix keep their departures
+        d_pickup_departure_sec = {
+            i_order: self.d_pickup_departure_sec[i_order]
+            for i_order in self.l_on_board[i_prefix]
+        }
+        f_departure_sec = self.l_departure_sec[i_prefix]
+        f_cost_sec = self.l_cost_sec[i_prefix]
+        for j in range(i_prefix, i_num_stops):
+
+            if j == i_join + 1:
+                # past the first stop of the tail the legs are the route's,
+                # so the rest never gets earlier than it was, it costs at
+                # least what it did and exactly that when nothing it
+                # depends on moved
+                i_route_pos = len(l_route) - i_suffix + 1
+                f_shift_sec = f_departure_sec - self.l_departure_sec[i_route_pos]
+                l_pickup_shift_sec = [
+                    d_pickup_departure_sec[i_order] - self.d_pickup_departure_sec[i_order]
+                    for i_order in self.l_on_board[i_route_pos]
+                    if i_order in d_pickup_departure_sec
+                ]
+                if len(l_pickup_shift_sec) < len(self.l_on_board[i_route_pos]):
+                    return None
+                f_tail_cost_sec = self.f_cost_sec - self.l_cost_sec[i_route_pos]
+                if f_shift_sec == 0 and not any(l_pickup_shift_sec):
+                    f_cost_sec += f_tail_cost_sec
+                    break
+                if (
+                    f_cost_bound is not None
+                    and f_shift_sec >= 0
+                    and min(l_pickup_shift_sec, default = 0) >= 0
+                    and f_cost_sec + f_tail_cost_sec >= f_cost_bound
+                ):
+                    return None
+
+            i_node = l_candidate[j]
+            t_state = self._visit(
+                l_candidate[j - 1] if j > 0 else None, i_node,
+                f_departure_sec, f_cost_sec, d_pickup_departure_sec
+            )
+            if t_state is None:
+                return None
+            (f_departure_sec, f_cost_sec) = t_state
+            if i_node < self.i_num_orders:
+                d_pickup_departure_sec[i_node] = f_departure_sec
+            if f_cost_bound is not None and f_cost_sec >= f_cost_bound:
+                return None
+
+        if f_cost_bound is not None and f_cost_sec >= f_cost_bound:
+            return None
+
+        return f_cost_sec
+
+
+def get_arc_exists(config):
+
+    arr_arc_exists = np.zeros((len(config.l_nodes), len(config.l_nodes)), dtype = bool)
+    for (s_arc_orig, s_arc_dest) in config.l_arcs:
+        if (s_arc_orig, s_arc_dest) in config.set_time_infeasible_arcs:
+            continue
+        arr_arc_exists[
+            config.d_node_idx[s_arc_orig], config.d_node_idx[s_arc_dest]
+        ] = True
+
+    return arr_arc_exists
+
+
+def greedy_insertion(config):
+    """
+    Insert orders by food ready time, each pickup/drop-off pair at the
+    cheapest position over every dasher's route
+    """
+    arr_arc_exists = get_arc_exists(config)
+
+    l_routes = [[] for _ in config.l_dashers]
+    l_route_cost_sec = [0.0 for _ in config.l_dashers]
+
+    for i_order in np.argsort(config.arr_food_ready_sec, kind = 'stable'):
+
+        t_best = best_insertion(
+            config, arr_arc_exists, l_routes, l_route_cost_sec, int(i_order)
+        )
+        if t_best is None:
+            return None
+
+        (f_added_sec, i_dasher, l_candidate) = t_best
+        l_routes[i_dasher] = l_candidate
+        l_route_cost_sec[i_dasher] += f_added_sec
+
+    return l_routes
+
+
+def best_insertion(
+    config, arr_arc_exists, l_routes, l_route_cost_sec, i_order,
+    l_dasher_indices = None
+):
+    """
+    Cheapest (added seconds, dasher, new route) to insert an order's
+    pickup and drop-off, None if no position uses existing arcs
+    """
+    i_restaurant = i_order
+    i_customer   = i_order + len(config.l_restaurants)
+
+    if l_dasher_indices is None:
+        l_dasher_indices = range(len(l_routes))
+
+    t_best = None
+    for i_dasher in l_dasher_indices:
+        l_route = l_routes[i_dasher]
+        schedule = RouteSchedule(config, arr_arc_exists, l_route)
+        for i_pickup_pos in range(len(l_route) + 1):
+            for i_dropoff_pos in range(i_pickup_pos + 1, len(l_route) + 2):
+
+                l_candidate = list(l_route)
+                l_candidate.insert(i_pickup_pos, i_restaurant)
+                l_candidate.insert(i_dropoff_pos, i_customer)
+
+                # positions no cheaper than the best so far are cut short
+                f_cost_sec = schedule.get_cost(
+                    l_candidate,
+                    None if t_best is None else l_route_cost_sec[i_dasher] + t_best[0]
+                )
+                if f_cost_sec is None:
+                    continue
+
+                f_added_sec = f_cost_sec - l_route_cost_sec[i_dasher]
+                if t_best is None or f_added_sec < t_best[0]:
+                    t_best = (f_added_sec, i_dasher, l_candidate)
+
+    return t_best
+
+
+def sort_routes_by_earliest_order(config, l_routes):
+
+    ### the dasher labels the MIP's symmetry breaking rows keep: routes by
+    ### their earliest ready order, idle dashers last
+    i_num_orders = len(config.l_restaurants)
+    arr_rank = np.empty(i_num_orders, dtype = np.int64)
+    arr_rank[config.arr_order_by_ready] = np.arange(i_num_orders)
+
+    return sorted(
+        l_routes,
+        key = lambda l_route: min(
+            (arr_rank[i_node] for i_node in l_route if i_node < i_num_orders),
+            default = i_num_orders
+        )
+    )
+
+
+def routes_to_start_values(config, l_routes):
+    """
+    Full assignment of the MIP variables, keyed like the MIP's
+    d_var_x / d_var_t / d_var_w / d_var_u, for the given routes
+    """
+    i_num_orders = len(config.l_restaurants)
+
+    d_start = {'x': {}, 't': {}, 'w': {}, 'u': {}}
+    for s_dasher_id, l_route in zip(config.l_dashers, l_routes):
+
+        # stops a dasher does not visit still have to satisfy
+        # the food ready and pick-up before drop-off rows
+        for i_order in range(i_num_orders):
+            s_restaurant_id = config.l_restaurants[i_order]
+            s_customer_id   = config.l_customers[i_order]
+            d_start['t'][s_dasher_id, s_restaurant_id] = config.f_start_sec
+            d_start['w'][s_dasher_id, s_restaurant_id] = max(
+                0, config.arr_food_ready_sec[i_order] - config.f_start_sec
+            )
+            d_start['t'][s_dasher_id, s_customer_id] = max(
+                config.arr_t_lb[config.d_node_idx[s_customer_id]],
+                max(config.f_start_sec, config.arr_food_ready_sec[i_order])
+                + config.arr_min_pickup_to_dropoff_sec[i_order]
+            )
+            d_start['w'][s_dasher_id, s_customer_id] = 0
+
+        for s_node in config.l_nodes:
+            d_start['u'][s_dasher_id, s_node] = 0
+        for (s_arc_orig, s_arc_dest) in config.l_arcs:
+            d_start['x'][s_dasher_id, s_arc_orig, s_arc_dest] = 0
+
+        arr_arrival_sec, arr_wait_sec, _ = schedule_route(config, l_route)
+        l_stops = [config.l_nodes[i_node] for i_node in l_route]
+        for i, s_stop in enumerate(l_stops):
+            d_start['t'][s_dasher_id, s_stop] = arr_arrival_sec[i]
+            d_start['w'][s_dasher_id, s_stop] = arr_wait_sec[i]
+            d_start['u'][s_dasher_id, s_stop] = i + 1
+
+        d_start['t'][s_dasher_id, 'source'] = config.f_start_sec
+        d_start['w'][s_dasher_id, 'source'] = 0
+        d_start['t'][s_dasher_id, 'target'] = (
+            arr_arrival_sec[-1] + arr_wait_sec[-1] if l_route
+            else config.f_start_sec
+        )
+        d_start['w'][s_dasher_id, 'target'] = 0
+        d_start['u'][s_dasher_id, 'target'] = len(l_stops) + 1
+
+        l_path = ['source'] + l_stops + ['target']
+        for s_arc_orig, s_arc_dest in zip(l_path[: -1], l_path[1 :]):
+            d_start['x'][s_dasher_id, s_arc_orig, s_arc_dest] = 1
+
+    return d_start
+
+
+def routes_to_solution(config, l_routes):
+
+    d_values = routes_to_start_values(config, l_routes)
+
+    i_num_dashers = len(config.l_dashers)
+    arr_value = {
+        s_name: np.zeros((i_num_dashers, len(config.l_nodes)))
+        for s_name in ('t', 'w', 'u')
+    }
+    for s_name in ('t', 'w', 'u'):
+        for (s_dasher_id, s_node), f_value in d_values[s_name].items():
+            arr_value[s_name][
+                config.l_dashers.index(s_dasher_id), config.d_node_idx[s_node]
+            ] = f_value
+
+    d_arc_idx = {t_arc: i for i, t_arc in enumerate(config.l_arcs)}
+    arr_arc_used = np.zeros((i_num_dashers, len(config.l_arcs)))
+    for (s_dasher_id, s_arc_orig, s_arc_dest), f_value in d_values['x'].items():
+        arr_arc_used[
+            config.l_dashers.index(s_dasher_id), d_arc_idx[s_arc_orig, s_arc_dest]
+        ] = f_value
+
+    # same objective as the MIP: t - created_at over every dasher and customer
+    arr_customer_idx = [config.d_node_idx[s_node] for s_node in config.l_customers]
+    f_obj = float(
+        arr_value['t'][:, arr_customer_idx].sum()
+        -
+        i_num_dashers * config.arr_created_sec.sum()
+    )
+
+    return solution.BatchSolution(
+        config, f_obj, arr_value['t'], arr_value['w'], arr_value['u'], arr_arc_used
+    )
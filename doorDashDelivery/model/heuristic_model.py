@@ -0,0 +1,213 @@
+import time
+
+from doorDashDelivery.model import heuristic
+from doorDashDelivery.utils import artifact_writer
+
+
+class HeuristicSolver():
+    """
+    Solver-free engine for a batch: greedy insertion followed by
+    relocate, exchange and 2-opt local search, every move checked by a
+    heuristic.RouteSchedule of the route it changes. A batch greedy
+    insertion cannot route goes to the set-partitioning search instead.
+    Same interface as mip_model.MIP
+    """
+
+    def __init__(self, config, i_batch_idx):
+
+        self.i_batch_idx = i_batch_idx
+        self.config = config
+        self.f_solving_sec = config.f_solving_sec
+        self.i_max_rounds = config.i_local_search_max_rounds
+        self.i_num_orders = len(config.l_restaurants)
+        self.arr_arc_exists = heuristic.get_arc_exists(config)
+
+    def solve(self):
+
+        f_deadline = time.perf_counter() + self.f_solving_sec
+
+        self.l_routes = heuristic.greedy_insertion(self.config)
+        if self.l_routes is None:
+            self.l_routes = self._solve_without_greedy_routes()
+        self._set_schedules()
+
+        for _ in range(self.i_max_rounds):
+            b_improved = False
+            for fn_move in [self._relocate, self._exchange, self._two_opt]:
+                b_improved = fn_move() or b_improved
+            if not b_improved or time.perf_counter() > f_deadline:
+                break
+
+    def _solve_without_greedy_routes(self):
+
+        ### its own import, set_partitioning_model imports this module
+        from doorDashDelivery.model import set_partitioning_model
+
+        solver = set_partitioning_model.SetPartitioningSolver(self.config, self.i_batch_idx)
+        solver.solve()
+        return solver.l_routes
+
+    def _set_schedules(self):
+
+        self.l_schedules = [
+            heuristic.RouteSchedule(self.config, self.arr_arc_exists, l_route)
+            for l_route in self.l_routes
+        ]
+        self.l_route_cost_sec = [schedule.f_cost_sec for schedule in self.l_schedules]
+
+    def _set_route(self, i_dasher, l_route):
+
+        self.l_routes[i_dasher] = l_route
+        self.l_schedules[i_dasher] = heuristic.RouteSchedule(
+            self.config, self.arr_arc_exists, l_route
+        )
+        self.l_route_cost_sec[i_dasher] = self.l_schedules[i_dasher].f_cost_sec
+
+    def _route_without(self, l_route, i_order):
+
+        return [
+            i_node for i_node in l_route
+            if i_node != i_order and i_node != i_order + self.i_num_orders
+        ]
+
+    def _get_dasher_of_order(self, i_order):
+
+        for i_dasher, l_route in enumerate(self.l_routes):
+            if i_order in l_route:
+                return i_dasher
+
+    def _relocate(self):
+
+        ### move one pickup/drop-off pair to its cheapest position
+        b_improved = False
+        for i_order in range(self.i_num_orders):
+
+            i_dasher = self._get_dasher_of_order(i_order)
+            l_removed = self._route_without(self.l_routes[i_dasher], i_order)
+            f_removed_cost_sec = self.l_schedules[i_dasher].get_cost(l_removed)
+            if f_removed_cost_sec is None:
+                continue
+
+            l_routes = list(self.l_routes)
+            l_routes[i_dasher] = l_removed
+            l_route_cost_sec = list(self.l_route_cost_sec)
+            l_route_cost_sec[i_dasher] = f_removed_cost_sec
+
+            t_best = heuristic.best_insertion(
+                self.config, self.arr_arc_exists, l_routes, l_route_cost_sec, i_order
+            )
+            if t_best is None:
+                continue
+
+            (f_added_sec, i_new_dasher, l_candidate) = t_best
+            f_new_cost_sec = sum(l_route_cost_sec) + f_added_sec
+            if f_new_cost_sec < sum(self.l_route_cost_sec) - 1e-6:
+                self._set_route(i_dasher, l_removed)
+                self._set_route(i_new_dasher, l_candidate)
+                b_improved = True
+
+        return b_improved
+
+    def _exchange(self):
+
+        ### swap two orders between dashers, each at its cheapest position
+        b_improved = False
+        for i_order in range(self.i_num_orders):
+            for i_other_order in range(i_order + 1, self.i_num_orders):
+
+                i_dasher       = self._get_dasher_of_order(i_order)
+                i_other_dasher = self._get_dasher_of_order(i_other_order)
+                if i_dasher == i_other_dasher:
+                    continue
+
+                ### the removals are scheduled even off the arcs, the
+                ### insertions check every arc of such a route
+                l_routes = list(self.l_routes)
+                l_routes[i_dasher] = self._route_without(
+                    l_routes[i_dasher], i_order
+                )
+                l_routes[i_other_dasher] = self._route_without(
+                    l_routes[i_other_dasher], i_other_order
+                )
+                l_route_cost_sec = list(self.l_route_cost_sec)
+                for i in (i_dasher, i_other_dasher):
+                    l_route_cost_sec[i] = self.l_schedules[i].get_cost(
+                        l_routes[i], b_check_arcs = False
+                    )
+
+                b_feasible = True
+                for (i_move_order, i_to_dasher) in [
+                    (i_other_order, i_dasher), (i_order, i_other_dasher)
+                ]:
+                    t_best = heuristic.best_insertion(
+                        self.config, self.arr_arc_exists, l_routes,
+                        l_route_cost_sec, i_move_order, [i_to_dasher]
+                    )
+                    if t_best is None:
+                        b_feasible = False
+                        break
+                    l_routes[i_to_dasher] = t_best[2]
+                    l_route_cost_sec[i_to_dasher] += t_best[0]
+
+                if (
+                    b_feasible
+                    and
+                    sum(l_route_cost_sec) < sum(self.l_route_cost_sec) - 1e-6
+                ):
+                    for i in (i_dasher, i_other_dasher):
+                        self._set_route(i, l_routes[i])
+                    b_improved = True
+
+        return b_improved
+
+    def _two_opt(self):
+
+        ### reverse a segment of a route when no order has both stops in it
+        b_improved = False
+        for i_dasher, l_route in enumerate(self.l_routes):
+            for i_start in range(len(l_route) - 1):
+                set_picked_in_segment = set()
+                for i_end in range(i_start + 1, len(l_route)):
+
+                    i_node = l_route[i_end]
+                    if i_node < self.i_num_orders:
+                        set_picked_in_segment.add(i_node)
+                    if i_node - self.i_num_orders in set_picked_in_segment:
+                        break
+
+                    l_candidate = (
+                        l_route[: i_start]
+                        + l_route[i_start : i_end + 1][:: -1]
+                        + l_route[i_end + 1 :]
+                    )
+
+                    # None also when a drop-off comes before its pickup
+                    f_cost_sec = self.l_schedules[i_dasher].get_cost(
+                        l_candidate, self.l_route_cost_sec[i_dasher] - 1e-6
+                    )
+                    if f_cost_sec is not None:
+                        self._set_route(i_dasher, l_candidate)
+                        l_route = l_candidate
+                        b_improved = True
+
+        return b_improved
+
+    def get_solve_stats(self):
+        return {'num_routes': sum(1 for l_route in self.l_routes if l_route)}
+
+    def release(self):
+        pass
+
+    def produce_solution_file(self, config):
+
+        solution_batch = self.get_solution(config)
+
+        artifact_writer.get_writer(config).write_json(
+            solution_batch.to_dict,
+            'heuristic_solution_batch_{:03d}'.format(self.i_batch_idx)
+        )
+
+        return solution_batch
+
+    def get_solution(self, config):
+        return heuristic.routes_to_solution(config, self.l_routes)
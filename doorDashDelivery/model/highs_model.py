@@ -0,0 +1,164 @@
+import time
+import numpy as np
+from scipy import sparse
+from scipy.optimize import Bounds, LinearConstraint, milp
+
+from doorDashDelivery.model import build_stats, mip_formulation, solution
+from doorDashDelivery.utils import artifact_writer, run_metrics
+
+
+class HighsMIP():
+    """
+    The MatrixFormulation of a batch solved with HiGHS through
+    scipy.optimize.milp, same interface as mip_model.MIP and no gurobipy
+    needed. Time limit and mip gap map onto the HiGHS options, indicator
+    rows become big-M rows. milp takes no start, so the warm start is
+    kept as the incumbent whenever HiGHS does not beat it, and no thread
+    count since the HiGHS MIP search runs on one thread
+    """
+
+    def __init__(self, config, i_batch_idx):
+
+        run_metrics.log(2, 'Start to construct HiGHS MIP {}'.format(i_batch_idx))
+        self.i_batch_idx = i_batch_idx
+        self.f_solving_sec = config.f_solving_sec
+        self.f_mip_gap = config.f_mip_gap
+        self.b_solver_log = config.i_verbosity >= 2
+
+        self.build_stats = build_stats.MIPBuildStats(self.i_batch_idx)
+        f_start_sec = time.perf_counter()
+        self.formulation = mip_formulation.MatrixFormulation(
+            config, b_indicator_constraints = False
+        )
+        self._create_arrays()
+        self.build_stats.add_family(
+            'matrix', time.perf_counter() - f_start_sec,
+            self.formulation.i_num_vars, self.A.shape[0]
+        )
+        self.formulation.create_variable_keys(config)
+
+        self.writer = artifact_writer.get_writer(config)
+        self.writer.write_json(
+            self.build_stats.to_dict,
+            'mip_build_stats_{:03d}'.format(self.i_batch_idx)
+        )
+        self.arr_start = None
+        self.result = None
+
+    def _create_arrays(self):
+
+        ### every block as lb <= A x <= ub rows of one matrix
+        formulation = self.formulation
+        l_lb, l_ub = [], []
+        for (_, A, s_sense, arr_rhs) in formulation.l_blocks:
+            l_lb.append(
+                np.full(len(arr_rhs), - np.inf)
+                if s_sense == mip_formulation.S_LESS_EQUAL else arr_rhs
+            )
+            l_ub.append(
+                np.full(len(arr_rhs), np.inf)
+                if s_sense == mip_formulation.S_GREATER_EQUAL else arr_rhs
+            )
+
+        self.A = sparse.vstack(
+            [A for (_, A, _, _) in formulation.l_blocks], format = 'csr'
+        )
+        self.arr_row_lb = np.concatenate(l_lb)
+        self.arr_row_ub = np.concatenate(l_ub)
+        self.arr_integrality = (
+            formulation.arr_vtype == mip_formulation.S_BINARY
+        ).astype(np.int64)
+
+    def set_warm_start(self, d_start):
+
+        arr_start = self.formulation.get_start(d_start, 0.0)
+
+        # only a start every row and bound accepts can stand in for a solve
+        if self._is_feasible(arr_start):
+            self.arr_start = arr_start
+
+    def _is_feasible(self, arr_value, f_tol = 1e-6):
+
+        formulation = self.formulation
+        arr_row = self.A @ arr_value
+        return bool(
+            np.all(arr_value >= formulation.arr_lb - f_tol)
+            and np.all(arr_value <= formulation.arr_ub + f_tol)
+            and np.all(arr_row >= self.arr_row_lb - f_tol)
+            and np.all(arr_row <= self.arr_row_ub + f_tol)
+        )
+
+    def solve(self):
+
+        formulation = self.formulation
+        f_start_sec = time.perf_counter()
+        self.result = milp(
+            formulation.arr_obj,
+            integrality = self.arr_integrality,
+            bounds = Bounds(formulation.arr_lb, formulation.arr_ub),
+            constraints = LinearConstraint(self.A, self.arr_row_lb, self.arr_row_ub),
+            options = {
+                'time_limit': self.f_solving_sec,
+                'mip_rel_gap': self.f_mip_gap,
+                'disp': self.b_solver_log
+            }
+        )
+        self.f_runtime_sec = time.perf_counter() - f_start_sec
+
+        self.arr_value = self.result.x
+        if self.arr_start is not None and (
+            self.arr_value is None
+            or
+            formulation.arr_obj @ self.arr_start < formulation.arr_obj @ self.arr_value
+        ):
+            self.arr_value = self.arr_start
+        if self.arr_value is None:
+            raise RuntimeError('HiGHS found no solution for batch {}: {}'.format(
+                self.i_batch_idx, self.result.message
+            ))
+
+    def get_solve_stats(self):
+
+        ### size and search effort of the last solve
+        d_stats = {
+            'num_vars': self.formulation.i_num_vars,
+            'num_constrs': self.A.shape[0],
+            'node_count': getattr(self.result, 'mip_node_count', 0),
+            'runtime_sec': self.f_runtime_sec
+        }
+        if self.result.x is not None and getattr(self.result, 'mip_gap', None) is not None:
+            d_stats['mip_gap'] = self.result.mip_gap
+
+        return d_stats
+
+    def release(self):
+        pass
+
+    def produce_solution_file(self, config):
+
+        solution_batch = self.get_solution(config)
+
+        self.writer.write_json(
+            solution_batch.to_dict,
+            'mip_solution_batch_{:03d}'.format(self.i_batch_idx)
+        )
+
+        return solution_batch
+
+    def get_solution(self, config):
+
+        ### columns are grouped per dasher, as BatchSolution wants them
+        formulation = self.formulation
+        i_num_dashers = formulation.i_num_dashers
+        arr_value = self.arr_value
+
+        return solution.BatchSolution(
+            config,
+            float(formulation.arr_obj @ arr_value + formulation.f_obj_constant),
+            arr_value[formulation.i_t_start : formulation.i_w_start].reshape(i_num_dashers, -1),
+            arr_value[formulation.i_w_start : formulation.i_u_start].reshape(i_num_dashers, -1),
+            arr_value[formulation.i_u_start :].reshape(i_num_dashers, -1),
+            np.round(
+                arr_value[formulation.i_x_start : formulation.i_t_start]
+            ).reshape(i_num_dashers, -1)
+        )
\ No newline at end of file
@@ -0,0 +1,211 @@
+import collections
+import numpy as np
+from multiprocessing import util
+from scipy import sparse
+
+from doorDashDelivery.model import build_stats, mip_formulation, mip_model
+from doorDashDelivery.utils import run_metrics
+
+from gurobipy import GRB, LinExpr
+
+
+class MatrixMIP(mip_model.MIP):
+    """
+    mip_model.MIP built from a MatrixFormulation. A template model is
+    kept after its batch and turned into the model of the next batch of
+    the same shape by update_batch
+    """
+
+    def __init__(self, config, i_batch_idx, b_template = False):
+
+        self.b_template = b_template
+        super().__init__(config, i_batch_idx)
+
+    def _build_model(self, config):
+
+        self.formulation = mip_formulation.MatrixFormulation(config)
+        self.d_block_constrs = {}
+        self._record_family('variables', self._create_variables, config)
+
+        l_families = []
+        for t_block in self.formulation.l_blocks + self.formulation.l_indicator_blocks:
+            if t_block[0] not in l_families:
+                l_families.append(t_block[0])
+
+        for s_family in l_families:
+            self._record_family(
+                s_family,
+                lambda config, s_family = s_family: self._add_family(s_family),
+                config
+            )
+
+    def _create_variables(self, config):
+
+        formulation = self.formulation
+        self.mvar = self.model.addMVar(
+            formulation.i_num_vars,
+            lb    = formulation.arr_lb,
+            ub    = formulation.arr_ub,
+            obj   = formulation.arr_obj,
+            vtype = formulation.arr_vtype
+        )
+        self.model.ObjCon = formulation.f_obj_constant
+        self._create_variable_keys(config)
+
+        # a template serves many batches, names would only fit the first
+        if config.b_variable_names and not self.b_template:
+            l_names = [None] * formulation.i_num_vars
+            for s_name, d_var in [
+                ('x', self.d_var_x),
+                ('t', self.d_var_t),
+                ('w', self.d_var_w),
+                ('u', self.d_var_u)
+            ]:
+                for var_key, i_col in d_var.items():
+                    l_names[i_col] = s_name + '_' + '_'.join(var_key)
+            self.model.update()
+            self.model.setAttr('VarName', self.mvar.tolist(), l_names)
+
+    def _create_variable_keys(self, config):
+
+        ### only the column positions are kept, names are optional
+        formulation = self.formulation
+        formulation.create_variable_keys(config)
+        self.d_var_x = formulation.d_var_x
+        self.d_var_t = formulation.d_var_t
+        self.d_var_w = formulation.d_var_w
+        self.d_var_u = formulation.d_var_u
+
+    def update_batch(self, config, i_batch_idx):
+
+        run_metrics.log(2, 'Start to update template MIP for batch {}'.format(i_batch_idx))
+        self.i_batch_idx = i_batch_idx
+        self._load_solve_settings(config)
+
+        self.build_stats = build_stats.MIPBuildStats(self.i_batch_idx)
+        self._record_family('template_update', self._update_formulation, config)
+
+        self._write_build_artifacts(config)
+
+    def _update_formulation(self, config):
+
+        ### same shape, so only bounds, rhs and changed coefficients are set
+        formulation = mip_formulation.MatrixFormulation(config)
+        self.mvar.LB = formulation.arr_lb
+        self.mvar.UB = formulation.arr_ub
+        self.model.ObjCon = formulation.f_obj_constant
+
+        l_vars = None
+        for i_block, (_, A, _, arr_rhs) in enumerate(formulation.l_blocks):
+            mconstr = self.d_block_constrs[i_block]
+            mconstr.RHS = arr_rhs
+
+            arr_row, arr_col = (A != self.formulation.l_blocks[i_block][1]).nonzero()
+            if len(arr_row) == 0:
+                continue
+            if l_vars is None:
+                l_vars = self.mvar.tolist()
+            l_constrs = mconstr.tolist()
+            for (i_row, i_col) in zip(arr_row, arr_col):
+                self.model.chgCoeff(
+                    l_constrs[i_row], l_vars[i_col], float(A[i_row, i_col])
+                )
+
+        self.formulation = formulation
+        self._create_variable_keys(config)
+
+        # nothing of the previous batch may leak into this solve
+        self.model.reset()
+        self.mvar.Start = np.full(formulation.i_num_vars, GRB.UNDEFINED)
+
+    def set_warm_start(self, d_start):
+        self.mvar.Start = self.formulation.get_start(d_start, GRB.UNDEFINED)
+
+    def _get_family_rows(self, s_family, i_num_constrs_before):
+
+        ### the family's blocks are already coefficient arrays
+        l_blocks = [
+            (A, s_sense, arr_rhs)
+            for (s_block_family, A, s_sense, arr_rhs) in self.formulation.l_blocks
+            if s_block_family == s_family
+        ]
+        if not l_blocks:
+            return sparse.csr_matrix((0, self.formulation.i_num_vars)), [], []
+
+        return (
+            sparse.vstack([A for (A, _, _) in l_blocks], format = 'csr'),
+            [s_sense for (A, s_sense, _) in l_blocks for _ in range(A.shape[0])],
+            np.concatenate([arr_rhs for (_, _, arr_rhs) in l_blocks])
+        )
+
+    def _add_family(self, s_family):
+
+        for i_block, (s_block_family, A, s_sense, arr_rhs) in enumerate(
+            self.formulation.l_blocks
+        ):
+            if s_block_family == s_family:
+                self.d_block_constrs[i_block] = self.model.addMConstr(
+                    A, self.mvar, s_sense, arr_rhs
+                )
+
+        l_vars = None
+        for (s_block_family, arr_x, A, s_sense, arr_rhs) in (
+            self.formulation.l_indicator_blocks
+        ):
+            if s_block_family != s_family:
+                continue
+            if l_vars is None:
+                l_vars = self.mvar.tolist()
+            for i_row in range(A.shape[0]):
+                arr_cols = A.indices[A.indptr[i_row] : A.indptr[i_row + 1]]
+                self.model.addGenConstrIndicator(
+                    l_vars[arr_x[i_row]],
+                    True,
+                    LinExpr(
+                        A.data[A.indptr[i_row] : A.indptr[i_row + 1]].tolist(),
+                        [l_vars[i_col] for i_col in arr_cols]
+                    ),
+                    s_sense,
+                    float(arr_rhs[i_row])
+                )
+
+    def release(self):
+
+        ### a template stays alive for the next batch of its shape
+        if not self.b_template:
+            self.dispose()
+
+    def _get_group_values(self, d_var, l_keys, i_num_dashers):
+
+        arr_sol = self.mvar.X
+        return arr_sol[
+            [d_var[var_key] for var_key in l_keys]
+        ].reshape(i_num_dashers, -1)
+
+
+### template models of this process by batch shape, least recently used first
+_d_templates = collections.OrderedDict()
+
+def get_template_mip(config, i_batch_idx):
+
+    t_shape = (len(config.l_restaurants), len(config.l_dashers))
+    template = _d_templates.pop(t_shape, None)
+    if template is None:
+        if not _d_templates:
+            util.Finalize(None, dispose_templates, exitpriority = 6)
+        template = MatrixMIP(config, i_batch_idx, b_template = True)
+    else:
+        template.update_batch(config, i_batch_idx)
+    _d_templates[t_shape] = template
+
+    while len(_d_templates) > config.i_max_template_models:
+        _, old_template = _d_templates.popitem(last = False)
+        old_template.dispose()
+
+    return template
+
+def dispose_templates():
+
+    while _d_templates:
+        _, template = _d_templates.popitem()
+        template.dispose()
\ No newline at end of file
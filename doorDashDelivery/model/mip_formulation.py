@@ -0,0 +1,473 @@
+import numpy as np
+from scipy import sparse
+
+### variable types and row senses, the characters gurobipy uses as well
+S_CONTINUOUS = 'C'
+S_BINARY = 'B'
+S_LESS_EQUAL = '<'
+S_GREATER_EQUAL = '>'
+S_EQUAL = '='
+
+
+class MatrixFormulation():
+    """
+    The formulation of mip_model.MIP as flat arrays: one column per
+    variable, one sparse coefficient block per constraint family, free of
+    solver objects so that matrix_model and highs_model both solve it.
+    b_indicator_constraints False turns indicators into big-M rows
+    """
+
+    def __init__(self, config, b_indicator_constraints = None):
+
+        if b_indicator_constraints is None:
+            b_indicator_constraints = config.b_indicator_constraints
+        self.b_indicator_constraints = b_indicator_constraints
+
+        self.i_num_dashers = len(config.l_dashers)
+        self.i_num_nodes   = len(config.l_nodes)
+        self.i_num_arcs    = len(config.l_arcs)
+        self.i_num_orders  = len(config.l_restaurants)
+
+        self.arr_arc_orig = np.array(
+            [config.d_node_idx[s_arc_orig] for (s_arc_orig, _) in config.l_arcs],
+            dtype = np.int64
+        )
+        self.arr_arc_dest = np.array(
+            [config.d_node_idx[s_arc_dest] for (_, s_arc_dest) in config.l_arcs],
+            dtype = np.int64
+        )
+        self.arr_arc_time_sec = config.arr_time_sec[
+            self.arr_arc_orig, self.arr_arc_dest
+        ].astype(np.float64)
+        self.arr_arc_time_infeasible = np.array(
+            [t_arc in config.set_time_infeasible_arcs for t_arc in config.l_arcs],
+            dtype = bool
+        )
+
+        # restaurants come first in l_nodes, then customers, target, source
+        self.arr_restaurant = np.arange(self.i_num_orders)
+        self.arr_customer   = np.arange(self.i_num_orders, 2 * self.i_num_orders)
+        self.i_target = config.d_node_idx['target']
+        self.i_source = config.d_node_idx['source']
+
+        ### column layout: x per (dasher, arc), then t, w, u per (dasher, node)
+        self.i_x_start = 0
+        self.i_t_start = self.i_num_dashers * self.i_num_arcs
+        self.i_w_start = self.i_t_start + self.i_num_dashers * self.i_num_nodes
+        self.i_u_start = self.i_w_start + self.i_num_dashers * self.i_num_nodes
+        self.i_num_vars = self.i_u_start + self.i_num_dashers * self.i_num_nodes
+
+        self._create_columns(config)
+
+        ### (family, A, sense, rhs), in the order mip_model.MIP adds them,
+        ### indicator rows also hold the x column that switches each row on
+        self.l_blocks = []
+        self.l_indicator_blocks = []
+        self._add_rows_flow(config)
+        self._add_rows_order_must_be_picked_by_1()
+        self._add_rows_customer_must_be_served_by_1()
+        self._add_rows_enforce_stop_order(config)
+        for s_family in config.get_strengthening_families():
+            getattr(self, '_add_rows_' + s_family)(config)
+
+    def x_idx(self, arr_dasher, arr_arc):
+        return self.i_x_start + arr_dasher * self.i_num_arcs + arr_arc
+
+    def t_idx(self, arr_dasher, arr_node):
+        return self.i_t_start + arr_dasher * self.i_num_nodes + arr_node
+
+    def w_idx(self, arr_dasher, arr_node):
+        return self.i_w_start + arr_dasher * self.i_num_nodes + arr_node
+
+    def u_idx(self, arr_dasher, arr_node):
+        return self.i_u_start + arr_dasher * self.i_num_nodes + arr_node
+
+    def create_variable_keys(self, config):
+
+        ### column of every variable, keyed like mip_model.MIP's
+        self.d_var_x = {
+            (s_dasher_id, s_arc_orig, s_arc_dest): int(self.x_idx(i_dasher, i_arc))
+            for i_dasher, s_dasher_id in enumerate(config.l_dashers)
+            for i_arc, (s_arc_orig, s_arc_dest) in enumerate(config.l_arcs)
+        }
+        self.d_var_t, self.d_var_w, self.d_var_u = (
+            {
+                (s_dasher_id, s_node): int(fn_idx(i_dasher, i_node))
+                for i_dasher, s_dasher_id in enumerate(config.l_dashers)
+                for i_node, s_node in enumerate(config.l_nodes)
+            }
+            for fn_idx in (self.t_idx, self.w_idx, self.u_idx)
+        )
+
+    def get_start(self, d_start, f_unset):
+
+        ### d_start as in mip_model.MIP.set_warm_start, columns it leaves
+        ### out are f_unset
+        arr_start = np.full(self.i_num_vars, f_unset, dtype = np.float64)
+        for s_name, d_var in [
+            ('x', self.d_var_x),
+            ('t', self.d_var_t),
+            ('w', self.d_var_w),
+            ('u', self.d_var_u)
+        ]:
+            for var_key, f_value in d_start[s_name].items():
+                arr_start[d_var[var_key]] = f_value
+
+        return arr_start
+
+    def _create_columns(self, config):
+
+        self.arr_lb = np.zeros(self.i_num_vars)
+        self.arr_ub = np.full(self.i_num_vars, np.inf)
+        self.arr_vtype = np.full(self.i_num_vars, S_CONTINUOUS)
+        self.arr_obj = np.zeros(self.i_num_vars)
+
+        arr_dasher = np.arange(self.i_num_dashers)[:, np.newaxis]
+
+        # x is binary
+        self.arr_ub[self.i_x_start : self.i_t_start] = 1
+        self.arr_vtype[self.i_x_start : self.i_t_start] = S_BINARY
+
+        # arcs ruled out by time are only kept to share a template, never used
+        self.arr_ub[
+            self.x_idx(
+                arr_dasher, np.nonzero(self.arr_arc_time_infeasible)[0][np.newaxis, :]
+            ).ravel()
+        ] = 0
+
+        # time and stop order bounds per node, see Config._create_time_bounds
+        arr_node = np.arange(self.i_num_nodes)[np.newaxis, :]
+        for fn_idx, arr_lb, arr_ub in [
+            (self.t_idx, config.arr_t_lb, config.arr_t_ub),
+            (self.w_idx, None, config.arr_w_ub),
+            (self.u_idx, None, config.arr_u_ub)
+        ]:
+            arr_col = fn_idx(arr_dasher, arr_node).ravel()
+            if arr_lb is not None:
+                self.arr_lb[arr_col] = np.tile(arr_lb, self.i_num_dashers)
+            self.arr_ub[arr_col] = np.tile(arr_ub, self.i_num_dashers)
+
+        # objective: sum of t - created_at over every dasher and customer
+        self.arr_obj[
+            self.t_idx(arr_dasher, self.arr_customer[np.newaxis, :]).ravel()
+        ] = 1
+        self.f_obj_constant = (
+            - self.i_num_dashers * float(config.arr_created_sec.sum())
+        )
+
+    def _add_rows(self, s_family, l_row, l_col, l_coef, i_num_rows, s_sense, arr_rhs):
+
+        A = sparse.csr_matrix(
+            (
+                np.concatenate(l_coef).astype(np.float64),
+                (np.concatenate(l_row), np.concatenate(l_col))
+            ),
+            shape = (i_num_rows, self.i_num_vars)
+        )
+        self.l_blocks.append(
+            (s_family, A, s_sense, np.asarray(arr_rhs, dtype = np.float64))
+        )
+
+    def _add_rows_switched(
+        self, config, s_family, arr_x, l_row, l_col, l_coef, i_num_rows,
+        arr_big_m, arr_rhs
+    ):
+
+        ### lhs <= rhs whenever x is 1, as big-M rows or indicators
+        if self.b_indicator_constraints:
+            self._add_rows(
+                s_family, l_row, l_col, l_coef, i_num_rows, S_LESS_EQUAL, arr_rhs
+            )
+            (s_family, A, s_sense, arr_rhs) = self.l_blocks.pop()
+            self.l_indicator_blocks.append((s_family, arr_x, A, s_sense, arr_rhs))
+            return
+
+        arr_row = np.arange(i_num_rows)
+        self._add_rows(
+            s_family,
+            l_row + [arr_row],
+            l_col + [arr_x],
+            l_coef + [arr_big_m],
+            i_num_rows,
+            S_LESS_EQUAL,
+            arr_big_m + arr_rhs
+        )
+
+    def _add_rows_flow(self, config):
+
+        arr_dasher_arc = np.repeat(np.arange(self.i_num_dashers), self.i_num_arcs)
+        arr_arc        = np.tile(np.arange(self.i_num_arcs), self.i_num_dashers)
+        arr_orig = self.arr_arc_orig[arr_arc]
+        arr_dest = self.arr_arc_dest[arr_arc]
+        arr_x = self.x_idx(arr_dasher_arc, arr_arc)
+
+        # every dasher leaves source once and reaches target once
+        for i_node, arr_mask in [
+            (self.i_source, arr_orig == self.i_source),
+            (self.i_target, arr_dest == self.i_target)
+        ]:
+            self._add_rows(
+                'flow',
+                [arr_dasher_arc[arr_mask]],
+                [arr_x[arr_mask]],
+                [np.ones(arr_mask.sum())],
+                self.i_num_dashers,
+                S_EQUAL,
+                np.ones(self.i_num_dashers)
+            )
+
+        # flow balance at each location, row per (dasher, location)
+        i_num_locations = 2 * self.i_num_orders
+        arr_out = arr_orig < i_num_locations
+        arr_in  = arr_dest < i_num_locations
+        self._add_rows(
+            'flow',
+            [
+                arr_dasher_arc[arr_out] * i_num_locations + arr_orig[arr_out],
+                arr_dasher_arc[arr_in] * i_num_locations + arr_dest[arr_in]
+            ],
+            [arr_x[arr_out], arr_x[arr_in]],
+            [np.ones(arr_out.sum()), - np.ones(arr_in.sum())],
+            self.i_num_dashers * i_num_locations,
+            S_EQUAL,
+            np.zeros(self.i_num_dashers * i_num_locations)
+        )
+
+        # respect order: u_orig - u_dest + M x <= M - 1
+        i_num_rows = len(arr_x)
+        arr_row = np.arange(i_num_rows)
+        self._add_rows_switched(
+            config,
+            'flow',
+            arr_x,
+            [arr_row, arr_row],
+            [
+                self.u_idx(arr_dasher_arc, arr_orig),
+                self.u_idx(arr_dasher_arc, arr_dest)
+            ],
+            [np.ones(i_num_rows), - np.ones(i_num_rows)],
+            i_num_rows,
+            config.arr_arc_order_big_m[arr_arc],
+            np.full(i_num_rows, -1.0)
+        )
+
+        # include travel time: t_orig + w_orig - t_dest + M x <= M - time
+        self._add_rows_switched(
+            config,
+            'flow',
+            arr_x,
+            [arr_row, arr_row, arr_row],
+            [
+                self.t_idx(arr_dasher_arc, arr_orig),
+                self.w_idx(arr_dasher_arc, arr_orig),
+                self.t_idx(arr_dasher_arc, arr_dest)
+            ],
+            [np.ones(i_num_rows), np.ones(i_num_rows), - np.ones(i_num_rows)],
+            i_num_rows,
+            config.arr_arc_travel_big_m[arr_arc],
+            - self.arr_arc_time_sec[arr_arc]
+        )
+
+    def _add_rows_visit_once(self, s_family, arr_nodes):
+
+        ### row per node: sum of every dasher's arcs into it is 1
+        arr_dasher_arc = np.repeat(np.arange(self.i_num_dashers), self.i_num_arcs)
+        arr_arc        = np.tile(np.arange(self.i_num_arcs), self.i_num_dashers)
+        arr_row_of_node = np.full(self.i_num_nodes, -1)
+        arr_row_of_node[arr_nodes] = np.arange(len(arr_nodes))
+
+        arr_row  = arr_row_of_node[self.arr_arc_dest[arr_arc]]
+        arr_mask = arr_row >= 0
+        self._add_rows(
+            s_family,
+            [arr_row[arr_mask]],
+            [self.x_idx(arr_dasher_arc, arr_arc)[arr_mask]],
+            [np.ones(arr_mask.sum())],
+            len(arr_nodes),
+            S_EQUAL,
+            np.ones(len(arr_nodes))
+        )
+
+    def _add_rows_order_must_be_picked_by_1(self):
+        self._add_rows_visit_once('order_must_be_picked_by_1', self.arr_restaurant)
+
+    def _add_rows_customer_must_be_served_by_1(self):
+        self._add_rows_visit_once('customer_must_be_served_by_1', self.arr_customer)
+
+    def _add_rows_enforce_stop_order(self, config):
+
+        arr_dasher = np.repeat(np.arange(self.i_num_dashers), self.i_num_orders)
+        arr_order  = np.tile(np.arange(self.i_num_orders), self.i_num_dashers)
+        i_num_rows = len(arr_dasher)
+        arr_row = np.arange(i_num_rows)
+        arr_t_restaurant = self.t_idx(arr_dasher, self.arr_restaurant[arr_order])
+        arr_w_restaurant = self.w_idx(arr_dasher, self.arr_restaurant[arr_order])
+
+        # wait at restaurant if a dasher arrives early
+        self._add_rows(
+            'enforce_stop_order',
+            [arr_row, arr_row],
+            [arr_t_restaurant, arr_w_restaurant],
+            [np.ones(i_num_rows), np.ones(i_num_rows)],
+            i_num_rows,
+            S_GREATER_EQUAL,
+            config.arr_food_ready_sec[arr_order]
+        )
+
+        # must pick-up first then deliver to customer
+        self._add_rows(
+            'enforce_stop_order',
+            [arr_row, arr_row, arr_row],
+            [
+                arr_t_restaurant,
+                arr_w_restaurant,
+                self.t_idx(arr_dasher, self.arr_customer[arr_order])
+            ],
+            [np.ones(i_num_rows), np.ones(i_num_rows), - np.ones(i_num_rows)],
+            i_num_rows,
+            S_LESS_EQUAL,
+            np.full(i_num_rows, -1.0)
+        )
+
+        # must pick-up and deliver by the same dasher, row per (dasher, order)
+        arr_dasher_arc = np.repeat(np.arange(self.i_num_dashers), self.i_num_arcs)
+        arr_arc        = np.tile(np.arange(self.i_num_arcs), self.i_num_dashers)
+        arr_dest = self.arr_arc_dest[arr_arc]
+        arr_x = self.x_idx(arr_dasher_arc, arr_arc)
+        arr_into_restaurant = arr_dest < self.i_num_orders
+        arr_into_customer = (
+            (arr_dest >= self.i_num_orders) & (arr_dest < 2 * self.i_num_orders)
+        )
+        self._add_rows(
+            'enforce_stop_order',
+            [
+                arr_dasher_arc[arr_into_restaurant] * self.i_num_orders
+                + arr_dest[arr_into_restaurant],
+                arr_dasher_arc[arr_into_customer] * self.i_num_orders
+                + arr_dest[arr_into_customer] - self.i_num_orders
+            ],
+            [arr_x[arr_into_restaurant], arr_x[arr_into_customer]],
+            [
+                np.ones(arr_into_restaurant.sum()),
+                - np.ones(arr_into_customer.sum())
+            ],
+            i_num_rows,
+            S_EQUAL,
+            np.zeros(i_num_rows)
+        )
+
+
+    def _get_order_assigned(self, i_dasher, i_order):
+
+        ### x columns of the arcs a dasher takes into an order's restaurant
+        arr_arc = np.nonzero(self.arr_arc_dest == self.arr_restaurant[i_order])[0]
+        return self.x_idx(i_dasher, arr_arc)
+
+    def _add_rows_symmetry_dasher_usage(self, config):
+
+        # a dasher only works if the one before it does
+        i_arc = config.l_arcs.index(('source', 'target'))
+        i_num_rows = self.i_num_dashers - 1
+        arr_row = np.arange(i_num_rows)
+        self._add_rows(
+            'symmetry_dasher_usage',
+            [arr_row, arr_row],
+            [self.x_idx(arr_row, i_arc), self.x_idx(arr_row + 1, i_arc)],
+            [np.ones(i_num_rows), - np.ones(i_num_rows)],
+            i_num_rows,
+            S_LESS_EQUAL,
+            np.zeros(i_num_rows)
+        )
+
+    def _add_rows_symmetry_order_assignment(self, config):
+
+        l_order = config.arr_order_by_ready.tolist()
+
+        # the earliest order goes to the first dasher
+        arr_col = self._get_order_assigned(0, l_order[0])
+        self._add_rows(
+            'symmetry_order_assignment',
+            [np.zeros(len(arr_col), dtype = np.int64)],
+            [arr_col],
+            [np.ones(len(arr_col))],
+            1,
+            S_EQUAL,
+            np.ones(1)
+        )
+
+        # a dasher takes an order only if the dasher before it took an earlier one
+        l_row, l_col, l_coef = [], [], []
+        i_row = 0
+        for i_dasher in range(1, self.i_num_dashers):
+            for i_rank, i_order in enumerate(l_order):
+                arr_col = self._get_order_assigned(i_dasher, i_order)
+                l_row.append(np.full(len(arr_col), i_row))
+                l_col.append(arr_col)
+                l_coef.append(np.ones(len(arr_col)))
+                for i_earlier_order in l_order[: i_rank]:
+                    arr_col = self._get_order_assigned(i_dasher - 1, i_earlier_order)
+                    l_row.append(np.full(len(arr_col), i_row))
+                    l_col.append(arr_col)
+                    l_coef.append(- np.ones(len(arr_col)))
+                i_row += 1
+
+        self._add_rows(
+            'symmetry_order_assignment',
+            l_row, l_col, l_coef, i_row, S_LESS_EQUAL, np.zeros(i_row)
+        )
+
+    def _add_rows_two_cycle_cuts(self, config):
+
+        # between two stops at most one direction is driven, by anyone
+        d_arc_idx = {t_arc: i for i, t_arc in enumerate(config.l_arcs)}
+        set_locations = set(config.l_physical_locations)
+        l_pairs = [
+            (i_arc, d_arc_idx[s_arc_dest, s_arc_orig])
+            for i_arc, (s_arc_orig, s_arc_dest) in enumerate(config.l_arcs)
+            if (
+                s_arc_orig < s_arc_dest
+                and
+                s_arc_orig in set_locations
+                and
+                s_arc_dest in set_locations
+                and
+                (s_arc_dest, s_arc_orig) in d_arc_idx
+            )
+        ]
+        i_num_rows = len(l_pairs)
+        arr_pair = np.array(l_pairs, dtype = np.int64).reshape(-1, 2)
+        arr_dasher = np.arange(self.i_num_dashers)[:, np.newaxis]
+        arr_row = np.tile(np.arange(i_num_rows), self.i_num_dashers)
+        self._add_rows(
+            'two_cycle_cuts',
+            [arr_row, arr_row],
+            [
+                self.x_idx(arr_dasher, arr_pair[:, 0][np.newaxis, :]).ravel(),
+                self.x_idx(arr_dasher, arr_pair[:, 1][np.newaxis, :]).ravel()
+            ],
+            [np.ones(len(arr_row)), np.ones(len(arr_row))],
+            i_num_rows,
+            S_LESS_EQUAL,
+            np.ones(i_num_rows)
+        )
+
+    def _add_rows_precedence_cuts(self, config):
+
+        # a drop-off is at least the shortest trip after its pickup
+        arr_dasher = np.repeat(np.arange(self.i_num_dashers), self.i_num_orders)
+        arr_order  = np.tile(np.arange(self.i_num_orders), self.i_num_dashers)
+        i_num_rows = len(arr_dasher)
+        arr_row = np.arange(i_num_rows)
+        self._add_rows(
+            'precedence_cuts',
+            [arr_row, arr_row, arr_row],
+            [
+                self.t_idx(arr_dasher, self.arr_restaurant[arr_order]),
+                self.w_idx(arr_dasher, self.arr_restaurant[arr_order]),
+                self.t_idx(arr_dasher, self.arr_customer[arr_order])
+            ],
+            [np.ones(i_num_rows), np.ones(i_num_rows), - np.ones(i_num_rows)],
+            i_num_rows,
+            S_LESS_EQUAL,
+            - config.arr_min_pickup_to_dropoff_sec[arr_order].astype(np.float64)
+        )
\ No newline at end of file
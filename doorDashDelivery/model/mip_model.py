@@ -1,8 +1,12 @@
-import os
+import time
+import numpy as np
+from multiprocessing import util
+from scipy import sparse
 
-from doorDashDelivery.utils import data_utils
+from doorDashDelivery.model import build_stats, solution
+from doorDashDelivery.utils import artifact_writer, run_metrics
 
-from gurobipy import GRB, Model, quicksum
+from gurobipy import Env, GRB, Model, quicksum
 
 class MIP():
 
@@ -14,25 +18,173 @@ class MIP():
 
     def _construct_MIP(self, config):
 
-        print('Start to construct MIP {}'.format(self.i_batch_idx))
-        self.model = Model('DoorDash')
+        run_metrics.log(2, 'Start to construct MIP {}'.format(self.i_batch_idx))
+        self.model = Model('DoorDash', env = get_env())
         self.model.modelSense = GRB.MINIMIZE
+        self._load_solve_settings(config)
+
+        ### time and size of every construction step
+        self.build_stats = build_stats.MIPBuildStats(self.i_batch_idx)
+        self.b_check_duplicate_constraints = config.b_check_duplicate_constraints
+        self.set_row_keys = set()
+
+        self._build_model(config)
+        self.model.update()
+
+        self._write_build_artifacts(config)
+
+    def _load_solve_settings(self, config):
+
         self.f_solving_sec = config.f_solving_sec
-        self._create_variables(config)
-        self._set_objective(config)
+        self.i_solver_threads = config.i_solver_threads
+        self.f_mip_gap = config.f_mip_gap
+        self.f_stall_sec = config.f_stall_sec
+        self.b_solver_log = config.i_verbosity >= 2
+
+    def _write_build_artifacts(self, config):
+
+        self.writer = artifact_writer.get_writer(config)
+        self.writer.write_model(
+            self.model, 'mip_{:03d}'.format(self.i_batch_idx)
+        )
+        self.writer.write_json(
+            self.build_stats.to_dict,
+            'mip_build_stats_{:03d}'.format(self.i_batch_idx)
+        )
+
+    def release(self):
+
+        ### called once the batch solution is out
+        self.dispose()
+
+    def dispose(self):
+
+        if self.model is not None:
+            self.model.dispose()
+            self.model = None
+
+    def _build_model(self, config):
+
+        self._record_family('variables', self._create_variables, config)
+        self._record_family('objective', self._set_objective, config)
         self._write_constraints(config)
+
+    def _record_family(self, s_family, fn_build, config):
+
+        self.model.update()
+        i_num_vars_before   = self.model.NumVars
+        i_num_constrs_before = self.model.NumConstrs
+        i_num_gen_constrs_before = self.model.NumGenConstrs
+
+        f_start_sec = time.perf_counter()
+        fn_build(config)
         self.model.update()
-        self.model.write(
-            os.path.join(
-                config.l_solution_dir,
-                'mip_{:03d}.lp'.format(self.i_batch_idx)
+        f_build_sec = time.perf_counter() - f_start_sec
+
+        i_num_duplicate_rows = None
+        if self.b_check_duplicate_constraints:
+            i_num_duplicate_rows = self._count_duplicate_rows(
+                *self._get_family_rows(s_family, i_num_constrs_before)
             )
+
+        self.build_stats.add_family(
+            s_family,
+            f_build_sec,
+            self.model.NumVars - i_num_vars_before,
+            self.model.NumConstrs - i_num_constrs_before
+            + self.model.NumGenConstrs - i_num_gen_constrs_before,
+            i_num_duplicate_rows
         )
 
+    def _get_family_rows(self, s_family, i_num_constrs_before):
+
+        ### the family's linear rows as (A, senses, rhs), in one bulk query
+        l_constrs = self.model.getConstrs()[i_num_constrs_before :]
+        return (
+            self.model.getA()[i_num_constrs_before :],
+            self.model.getAttr('Sense', l_constrs),
+            self.model.getAttr('RHS', l_constrs)
+        )
+
+    def _count_duplicate_rows(self, A, l_senses, l_rhs):
+
+        ### a row is a duplicate if the same coefficients, sense and rhs
+        ### were already added by this or an earlier family
+        A = sparse.csr_matrix(A)
+        A.sum_duplicates()
+        A.eliminate_zeros()
+        i_num_duplicate_rows = 0
+        for i_row in range(A.shape[0]):
+            i_start, i_end = A.indptr[i_row], A.indptr[i_row + 1]
+            t_row_key = (
+                A.indices[i_start : i_end].tobytes(),
+                A.data[i_start : i_end].tobytes(),
+                l_senses[i_row],
+                float(l_rhs[i_row])
+            )
+            if t_row_key in self.set_row_keys:
+                i_num_duplicate_rows += 1
+            else:
+                self.set_row_keys.add(t_row_key)
+
+        return i_num_duplicate_rows
+
+    def set_warm_start(self, d_start):
+
+        ### d_start maps 'x', 't', 'w', 'u' to values keyed like the variables
+        for s_name, d_var in [
+            ('x', self.d_var_x),
+            ('t', self.d_var_t),
+            ('w', self.d_var_w),
+            ('u', self.d_var_u)
+        ]:
+            for var_key, f_value in d_start[s_name].items():
+                d_var[var_key].Start = f_value
+
     def solve(self):
+        self.model.setParam(GRB.Param.OutputFlag, int(self.b_solver_log))
         self.model.setParam(GRB.Param.TimeLimit, self.f_solving_sec)
-        self.model.setParam(GRB.Param.Threads, 8)
-        self.model.optimize()
+        self.model.setParam(GRB.Param.Threads, self.i_solver_threads)
+        self.model.setParam(GRB.Param.MIPGap, self.f_mip_gap)
+
+        if self.f_stall_sec is None:
+            self.model.optimize()
+        else:
+            self.f_best_obj = GRB.INFINITY
+            self.f_last_improvement_sec = 0
+            self.model.optimize(self._stop_on_stall)
+
+    def get_solve_stats(self):
+
+        ### size and search effort of the last solve
+        d_stats = {
+            'num_vars': self.model.NumVars,
+            'num_constrs': self.model.NumConstrs + self.model.NumGenConstrs,
+            'node_count': self.model.NodeCount,
+            'runtime_sec': self.model.Runtime
+        }
+        if self.model.SolCount > 0:
+            d_stats['mip_gap'] = self.model.MIPGap
+
+        return d_stats
+
+    def _stop_on_stall(self, model, where):
+
+        ### stop once the incumbent has not improved for f_stall_sec
+        if where != GRB.Callback.MIP:
+            return
+
+        f_runtime_sec = model.cbGet(GRB.Callback.RUNTIME)
+        f_obj = model.cbGet(GRB.Callback.MIP_OBJBST)
+        if f_obj < self.f_best_obj - 1e-6:
+            self.f_best_obj = f_obj
+            self.f_last_improvement_sec = f_runtime_sec
+        elif (
+            f_obj < GRB.INFINITY
+            and
+            f_runtime_sec - self.f_last_improvement_sec > self.f_stall_sec
+        ):
+            model.terminate()
 
     def _create_variables(self, config):
 
@@ -50,35 +202,36 @@ class MIP():
 
             for s_arc_orig in config.l_nodes:
 
-                # construct t variables
-                if s_arc_orig in config.l_customers:
-                    f_lb = config.d_pickup_time_for_customers[s_arc_orig]
-                else:
-                    f_lb = 0
+                # bounds from the batch's time windows
+                i_node = config.d_node_idx[s_arc_orig]
 
+                # construct t variables
                 self.d_var_t[s_dasher_id, s_arc_orig] = self.model.addVar(
                     vtype = GRB.CONTINUOUS,
                     name  = 't_{}_{}'.format(s_dasher_id, s_arc_orig),
-                    lb    = f_lb
+                    lb    = config.arr_t_lb[i_node],
+                    ub    = config.arr_t_ub[i_node]
                 )
 
                 # construct w variables
                 self.d_var_w[s_dasher_id, s_arc_orig] = self.model.addVar(
                     vtype = GRB.CONTINUOUS,
                     name  = 'w_{}_{}'.format(s_dasher_id, s_arc_orig),
-                    lb    = 0
+                    lb    = 0,
+                    ub    = config.arr_w_ub[i_node]
                 )
 
                 # construct u variables
                 self.d_var_u[s_dasher_id, s_arc_orig] = self.model.addVar(
                     vtype = GRB.CONTINUOUS,
-                    name  = 'u_{}'.format(s_dasher_id, s_arc_orig),
-                    lb    = 0
+                    name  = 'u_{}_{}'.format(s_dasher_id, s_arc_orig),
+                    lb    = 0,
+                    ub    = config.arr_u_ub[i_node]
                 )
 
-                for s_arc_dest in config.l_nodes:
+                for s_arc_dest in config.d_arcs_out[s_arc_orig]:
 
-                    # construct x variables
+                    # construct x variables, only for feasible arcs
                     self.d_var_x[s_dasher_id, s_arc_orig, s_arc_dest] = self.model.addVar(
                         vtype = GRB.BINARY,
                         name  = 'x_{}_{}_{}'.format(s_dasher_id, s_arc_orig, s_arc_dest)
@@ -95,60 +248,31 @@ class MIP():
 
         self.model.addConstr(
             quicksum(
-                self.d_var_t[s_dasher_id, i_customer] - config.d_order_create_time_for_customers[i_customer]
+                self.d_var_t[s_dasher_id, s_customer_id] - config.arr_created_sec[i_order]
                 for s_dasher_id in config.l_dashers
-                for i_customer in config.l_customers
+                for i_order, s_customer_id in enumerate(config.l_customers)
             ) == obj
         )
 
 
     def _write_constraints(self, config):
 
-        self._add_constraint_useless_arcs(config)
-        self._add_constraint_flow(config)
-        self._add_constraint_order_must_be_picked_by_1(config)
-        self._add_constraint_customer_must_be_served_by_1(config)
-        self._add_constraint_enforce_stop_order(config)
-
-
-    def _add_constraint_useless_arcs(self, config):
-
-        set_useless_arcs = set()
-
-        for s_node in config.l_nodes:
-            set_useless_arcs.add(
-                (s_node, s_node)
-            )
-            set_useless_arcs.add(
-                (s_node, 'source')
-            )
-            set_useless_arcs.add(
-                ('target', s_node)
+        for fn_add_constraint in [
+            self._add_constraint_flow,
+            self._add_constraint_order_must_be_picked_by_1,
+            self._add_constraint_customer_must_be_served_by_1,
+            self._add_constraint_enforce_stop_order
+        ] + [
+            getattr(self, '_add_constraint_' + s_family)
+            for s_family in config.get_strengthening_families()
+        ]:
+            self._record_family(
+                fn_add_constraint.__name__[len('_add_constraint_') :],
+                fn_add_constraint,
+                config
             )
 
 
-        for s_restaurtant_id in config.l_restaurants:
-            set_useless_arcs.add(
-                (s_restaurtant_id, 'target')
-            )
-
-        for s_customer_id in config.l_customers:
-            set_useless_arcs.add(
-                ('source', s_customer_id)
-            )
-
-        for d in config.l_input_data:
-            set_useless_arcs.add(
-                ('c{:03d}'.format(d['delivery_id']),
-                'r{:03d}'.format(d['delivery_id']))
-            )
-
-        self.model.addConstrs(
-            self.d_var_x[s_dasher_id, s_arc_orig, s_arc_dest] == 0
-            for s_dasher_id in config.l_dashers
-            for (s_arc_orig, s_arc_dest) in set_useless_arcs
-        )
-
     def _add_constraint_flow(self, config):
 
         self.model.addConstrs(
@@ -156,7 +280,7 @@ class MIP():
                 self.d_var_x[
                     s_dasher_id, 'source', s_node
                 ]
-                for s_node in config.l_nodes
+                for s_node in config.d_arcs_out['source']
             ) == 1
             for s_dasher_id in config.l_dashers
         )
@@ -165,7 +289,7 @@ class MIP():
                 self.d_var_x[
                     s_dasher_id, s_node, 'target'
                 ]
-                for s_node in config.l_nodes
+                for s_node in config.d_arcs_in['target']
             ) == 1
             for s_dasher_id in config.l_dashers
         )
@@ -174,19 +298,21 @@ class MIP():
         self.model.addConstrs(
             quicksum(
                 self.d_var_x[s_dasher_id, s_node, s_next]
-                for s_next in config.l_nodes
-                if s_next != s_node
+                for s_next in config.d_arcs_out[s_node]
             )
             ==
             quicksum(
                 self.d_var_x[s_dasher_id, s_prev, s_node]
-                for s_prev in config.l_nodes
-                if s_prev != s_node
+                for s_prev in config.d_arcs_in[s_node]
             )
             for s_dasher_id in config.l_dashers
             for s_node in config.l_physical_locations
         )
 
+        if config.b_indicator_constraints:
+            self._add_constraint_flow_indicators(config)
+            return
+
         # respect order
         self.model.addConstrs(
             self.d_var_u[s_dasher_id, s_arc_orig] + 1
@@ -194,13 +320,12 @@ class MIP():
             (
                 self.d_var_u[s_dasher_id, s_arc_dest]
                 +
-                len(config.l_nodes)
+                float(config.arr_arc_order_big_m[i_arc])
                 *
                 (1 - self.d_var_x[s_dasher_id, s_arc_orig, s_arc_dest])
             )
             for s_dasher_id in config.l_dashers
-            for s_arc_orig in config.l_nodes
-            for s_arc_dest in config.l_nodes
+            for i_arc, (s_arc_orig, s_arc_dest) in enumerate(config.l_arcs)
         )
 
         # include travel time
@@ -209,18 +334,52 @@ class MIP():
             +
             self.d_var_w[s_dasher_id, s_arc_orig]
             +
-            config.d_time_sec[s_arc_orig, s_arc_dest]
+            float(config.arr_time_sec[
+                config.d_node_idx[s_arc_orig], config.d_node_idx[s_arc_dest]
+            ])
             <=
             (
                 self.d_var_t[s_dasher_id, s_arc_dest]
                 +
-                1000000
+                float(config.arr_arc_travel_big_m[i_arc])
                 *
                 (1 - self.d_var_x[s_dasher_id, s_arc_orig, s_arc_dest])
             )
             for s_dasher_id in config.l_dashers
-            for s_arc_orig in config.l_nodes
-            for s_arc_dest in config.l_nodes
+            for i_arc, (s_arc_orig, s_arc_dest) in enumerate(config.l_arcs)
+        )
+
+    def _add_constraint_flow_indicators(self, config):
+
+        ### the same order and travel rows, only enforced on used arcs
+        self.model.addConstrs(
+            (self.d_var_x[s_dasher_id, s_arc_orig, s_arc_dest] == 1)
+            >>
+            (
+                self.d_var_u[s_dasher_id, s_arc_orig] + 1
+                <=
+                self.d_var_u[s_dasher_id, s_arc_dest]
+            )
+            for s_dasher_id in config.l_dashers
+            for (s_arc_orig, s_arc_dest) in config.l_arcs
+        )
+
+        self.model.addConstrs(
+            (self.d_var_x[s_dasher_id, s_arc_orig, s_arc_dest] == 1)
+            >>
+            (
+                self.d_var_t[s_dasher_id, s_arc_orig]
+                +
+                self.d_var_w[s_dasher_id, s_arc_orig]
+                +
+                float(config.arr_time_sec[
+                    config.d_node_idx[s_arc_orig], config.d_node_idx[s_arc_dest]
+                ])
+                <=
+                self.d_var_t[s_dasher_id, s_arc_dest]
+            )
+            for s_dasher_id in config.l_dashers
+            for (s_arc_orig, s_arc_dest) in config.l_arcs
         )
 
 
@@ -232,7 +391,7 @@ class MIP():
                     s_dasher_id, s_arc_orig, s_restaurant_id
                 ]
                 for s_dasher_id in config.l_dashers
-                for s_arc_orig in config.l_nodes
+                for s_arc_orig in config.d_arcs_in[s_restaurant_id]
             ) == 1
             for s_restaurant_id in config.l_restaurants
         )
@@ -244,7 +403,7 @@ class MIP():
                     s_dasher_id, s_arc_orig, s_customer_id
                 ]
                 for s_dasher_id in config.l_dashers
-                for s_arc_orig in config.l_nodes
+                for s_arc_orig in config.d_arcs_in[s_customer_id]
             ) == 1
             for s_customer_id in config.l_customers
         )
@@ -254,10 +413,10 @@ class MIP():
 
         for s_dasher_id in config.l_dashers:
 
-            for d in config.l_input_data:
+            for i_order in range(len(config.l_restaurants)):
 
-                s_restaurtant_id = 'r{:03d}'.format(d['delivery_id'])
-                s_customer_id    = 'c{:03d}'.format(d['delivery_id'])
+                s_restaurtant_id = config.l_restaurants[i_order]
+                s_customer_id    = config.l_customers[i_order]
 
                 # wait at restaurant if a dasher arrives early
                 self.model.addConstr(
@@ -269,7 +428,7 @@ class MIP():
                         s_dasher_id, s_restaurtant_id
                     ]
                     >=
-                    d['food_ready_time']
+                    config.arr_food_ready_sec[i_order]
                 )
 
                 # must pick-up first then deliver to customer
@@ -284,44 +443,158 @@ class MIP():
                 )
 
                 # must pick-up and deliver by the same dasher
-                self.model.addConstrs(
+                self.model.addConstr(
                     quicksum(
                         self.d_var_x[s_dasher_id, s_node, s_restaurtant_id]
-                        for s_node in config.l_nodes
+                        for s_node in config.d_arcs_in[s_restaurtant_id]
                     )
                     ==
                     quicksum(
                         self.d_var_x[s_dasher_id, s_node, s_customer_id]
-                        for s_node in config.l_nodes
+                        for s_node in config.d_arcs_in[s_customer_id]
                     )
-                    for s_dasher_id in config.l_dashers
                 )
 
 
-    def produce_solution_file(self, config):
+    def _get_order_assigned(self, config, s_dasher_id, i_order):
 
-        d_all_sol = {
-            'obj': self.model.ObjVal,
-            'dashers': config.l_dashers,
-            'arrival': self._get_1_var_group_sol('t', self.d_var_t, i_round = 5),
-            'waiting': self._get_1_var_group_sol('w', self.d_var_w),
-            'visit_order': self._get_1_var_group_sol('u', self.d_var_u),
-            'used_arc': self._get_1_var_group_sol('x', self.d_var_x)
-        }
+        s_restaurant_id = config.l_restaurants[i_order]
+        return quicksum(
+            self.d_var_x[s_dasher_id, s_node, s_restaurant_id]
+            for s_node in config.d_arcs_in[s_restaurant_id]
+        )
+
+    def _add_constraint_symmetry_dasher_usage(self, config):
+
+        # a dasher only works if the one before it does
+        self.model.addConstrs(
+            self.d_var_x[s_dasher_id, 'source', 'target']
+            <=
+            self.d_var_x[s_next_dasher_id, 'source', 'target']
+            for s_dasher_id, s_next_dasher_id in zip(
+                config.l_dashers[: -1], config.l_dashers[1 :]
+            )
+        )
+
+    def _add_constraint_symmetry_order_assignment(self, config):
+
+        l_order = config.arr_order_by_ready.tolist()
+
+        # the earliest order goes to the first dasher
+        self.model.addConstr(
+            self._get_order_assigned(config, config.l_dashers[0], l_order[0]) == 1
+        )
+
+        # a dasher takes an order only if the dasher before it took an earlier one
+        self.model.addConstrs(
+            self._get_order_assigned(config, s_dasher_id, l_order[i_rank])
+            <=
+            quicksum(
+                self._get_order_assigned(config, s_prev_dasher_id, i_order)
+                for i_order in l_order[: i_rank]
+            )
+            for s_prev_dasher_id, s_dasher_id in zip(
+                config.l_dashers[: -1], config.l_dashers[1 :]
+            )
+            for i_rank in range(len(l_order))
+        )
 
-        data_utils.saveJson(
-            d_all_sol,
-            os.path.join(
-                config.l_solution_dir,
-                'mip_solution_batch_{:03d}.json'.format(self.i_batch_idx)
+    def _add_constraint_two_cycle_cuts(self, config):
+
+        # between two stops at most one direction is driven, by anyone
+        set_arcs = set(config.l_arcs)
+        self.model.addConstrs(
+            quicksum(
+                self.d_var_x[s_dasher_id, s_arc_orig, s_arc_dest]
+                +
+                self.d_var_x[s_dasher_id, s_arc_dest, s_arc_orig]
+                for s_dasher_id in config.l_dashers
+            ) <= 1
+            for (s_arc_orig, s_arc_dest) in config.l_arcs
+            if (
+                s_arc_orig < s_arc_dest
+                and
+                s_arc_orig in config.l_physical_locations
+                and
+                s_arc_dest in config.l_physical_locations
+                and
+                (s_arc_dest, s_arc_orig) in set_arcs
+            )
+        )
+
+    def _add_constraint_precedence_cuts(self, config):
+
+        # a drop-off is at least the shortest trip after its pickup
+        self.model.addConstrs(
+            self.d_var_t[s_dasher_id, s_restaurant_id]
+            +
+            self.d_var_w[s_dasher_id, s_restaurant_id]
+            +
+            float(config.arr_min_pickup_to_dropoff_sec[i_order])
+            <=
+            self.d_var_t[s_dasher_id, s_customer_id]
+            for s_dasher_id in config.l_dashers
+            for i_order, (s_restaurant_id, s_customer_id) in enumerate(
+                zip(config.l_restaurants, config.l_customers)
             )
         )
 
-        return d_all_sol
+    def produce_solution_file(self, config):
+
+        solution_batch = self.get_solution(config)
+
+        self.writer.write_json(
+            solution_batch.to_dict,
+            'mip_solution_batch_{:03d}'.format(self.i_batch_idx)
+        )
+
+        return solution_batch
+
+    def get_solution(self, config):
+
+        l_node_keys = [
+            (s_dasher_id, s_node)
+            for s_dasher_id in config.l_dashers
+            for s_node in config.l_nodes
+        ]
+        l_arc_keys = [
+            (s_dasher_id, s_arc_orig, s_arc_dest)
+            for s_dasher_id in config.l_dashers
+            for (s_arc_orig, s_arc_dest) in config.l_arcs
+        ]
+
+        return solution.BatchSolution(
+            config,
+            self.model.ObjVal,
+            self._get_group_values(self.d_var_t, l_node_keys, len(config.l_dashers)),
+            self._get_group_values(self.d_var_w, l_node_keys, len(config.l_dashers)),
+            self._get_group_values(self.d_var_u, l_node_keys, len(config.l_dashers)),
+            self._get_group_values(self.d_var_x, l_arc_keys, len(config.l_dashers))
+        )
+
+    def _get_group_values(self, d_var, l_keys, i_num_dashers):
+
+        ### one bulk attribute query per variable group
+        return np.array(
+            self.model.getAttr('X', [d_var[var_key] for var_key in l_keys])
+        ).reshape(i_num_dashers, -1)
+
+
+### one gurobi environment per process, pool workers dispose theirs when they exit
+_env = None
+
+def get_env():
+
+    global _env
+    if _env is None:
+        _env = Env()
+        util.Finalize(None, dispose_env, exitpriority = 5)
+
+    return _env
 
-    def _get_1_var_group_sol(self, s_name, d_var, i_round = 0):
+def dispose_env():
 
-        return {
-            s_name + '_' + '_'.join(var_key) : round(d_var[var_key].x, i_round)
-            for var_key in d_var.keys()
-        }
\ No newline at end of file
+    global _env
+    if _env is not None:
+        env, _env = _env, None
+        env.dispose()
\ No newline at end of file
@@ -0,0 +1,419 @@
+import time
+import numpy as np
+from scipy.optimize import LinearConstraint, linprog, milp
+
+from doorDashDelivery.model import heuristic, heuristic_model
+from doorDashDelivery.utils import artifact_writer
+
+### seconds the master MILP gets even when the batch is out of time
+F_MIN_MASTER_SEC = 0.1
+
+
+class SetPartitioningSolver():
+    """
+    Route-based engine for a batch: feasible routes with their earliest
+    schedules are the columns of a set-partitioning master with at most
+    one route per dasher. Small batches get the cheapest route of every
+    order subset and solve the master exactly over subsets, or keep the
+    greedy routes if that runs past f_solving_sec, larger batches and
+    small ones without greedy routes past it price routes against the
+    master LP duals. Same interface as mip_model.MIP
+    """
+
+    def __init__(self, config, i_batch_idx):
+
+        self.i_batch_idx = i_batch_idx
+        self.config = config
+        self.f_solving_sec = config.f_solving_sec
+        self.i_num_orders  = len(config.l_restaurants)
+        self.i_num_dashers = len(config.l_dashers)
+        self.arr_arc_exists = heuristic.get_arc_exists(config)
+        self.i_source = config.d_node_idx['source']
+        self.i_target = config.d_node_idx['target']
+        self.d_on_board_orders = {}
+
+    def solve(self):
+
+        f_deadline = time.perf_counter() + self.f_solving_sec
+        self.b_greedy_fallback = False
+
+        l_routes = None
+        if self.i_num_orders <= self.config.i_sp_max_enumeration_orders:
+            l_routes = self._enumerate_routes(f_deadline)
+        if l_routes is None:
+            d_columns = self._generate_columns(f_deadline)
+            self.i_num_columns = len(d_columns)
+            l_routes = [
+                d_columns[i_mask][1]
+                for i_mask in self._solve_master_milp(d_columns, f_deadline)
+            ]
+
+        l_routes += [[] for _ in range(self.i_num_dashers - len(l_routes))]
+        self.l_routes = heuristic.sort_routes_by_earliest_order(self.config, l_routes)
+
+    def _enumerate_routes(self, f_deadline):
+
+        ### the greedy routes bound the search and stand in for it past the
+        ### deadline, without them None is returned past the deadline
+        l_greedy_routes = heuristic.greedy_insertion(self.config)
+        if l_greedy_routes is None:
+            f_cost_bound = None
+        else:
+            f_cost_bound = sum(
+                heuristic.schedule_route(self.config, l_route)[2]
+                for l_route in l_greedy_routes
+            )
+
+        d_columns = self._label_routes(f_cost_bound = f_cost_bound, f_deadline = f_deadline)
+        l_masks = None
+        if d_columns is not None:
+            l_masks = self._solve_master_by_subsets(d_columns, f_deadline)
+
+        self.i_num_columns = 0 if d_columns is None else len(d_columns)
+        if l_masks is None:
+            self.b_greedy_fallback = l_greedy_routes is not None
+            return l_greedy_routes
+
+        return [d_columns[i_mask][1] for i_mask in l_masks]
+
+    def _label_routes(
+        self, arr_order_dual = None, i_max_labels = None, f_cost_bound = None,
+        f_deadline = None
+    ):
+        """
+        Labeling over partial routes from source, a state is (delivered
+        orders, orders on board, last stop). Returns the cheapest complete
+        route of every delivered order set as {mask: (cost, route)}, costs
+        are reduced by arr_order_dual when given. Labels that cannot be
+        part of a set of routes cheaper than f_cost_bound are dropped.
+        Returns None once time.perf_counter() passes f_deadline
+        """
+        config = self.config
+        i_num_orders = self.i_num_orders
+        if arr_order_dual is None:
+            arr_order_dual = np.zeros(i_num_orders)
+        arr_cost_offset = config.arr_created_sec + arr_order_dual
+
+        # every order left is delivered no earlier than its lower bound
+        arr_min_cost = (
+            config.arr_t_lb[i_num_orders : 2 * i_num_orders] - arr_cost_offset
+        )
+        d_min_cost_left = {}
+
+        ### label: (cost, departure, pickup departures, route)
+        d_layer = {
+            (0, 0, self.i_source): [(0.0, config.f_start_sec, (0.0,) * i_num_orders, [])]
+        }
+        d_columns = {}
+        for _ in range(2 * i_num_orders):
+
+            d_next_layer = {}
+            for (i_delivered, i_on_board, i_last), l_labels in d_layer.items():
+
+                if f_deadline is not None and time.perf_counter() > f_deadline:
+                    return None
+                for i_order in range(i_num_orders):
+                    i_bit = 1 << i_order
+                    if i_delivered & i_bit:
+                        continue
+
+                    # pick up an order not yet on board, else drop it off
+                    b_pickup = not (i_on_board & i_bit)
+                    i_node = i_order if b_pickup else i_order + i_num_orders
+                    if not self.arr_arc_exists[i_last, i_node]:
+                        continue
+
+                    f_travel_sec = config.arr_time_sec[i_last, i_node]
+                    if b_pickup:
+                        t_state = (i_delivered, i_on_board | i_bit, i_node)
+                    else:
+                        t_state = (i_delivered | i_bit, i_on_board ^ i_bit, i_node)
+
+                    if t_state[0] not in d_min_cost_left:
+                        d_min_cost_left[t_state[0]] = sum(
+                            arr_min_cost[i] for i in range(i_num_orders)
+                            if not t_state[0] >> i & 1
+                        )
+                    f_min_cost_left = d_min_cost_left[t_state[0]]
+
+                    for (f_cost, f_departure_sec, t_pickup_sec, l_route) in l_labels:
+                        f_arrival_sec = f_departure_sec + f_travel_sec
+                        if b_pickup:
+                            f_departure_sec_next = max(
+                                f_arrival_sec, config.arr_food_ready_sec[i_order]
+                            )
+                            t_pickup_sec_next = (
+                                t_pickup_sec[: i_order]
+                                + (f_departure_sec_next,)
+                                + t_pickup_sec[i_order + 1 :]
+                            )
+                            f_cost_next = f_cost
+                        else:
+                            f_departure_sec_next = max(
+                                f_arrival_sec,
+                                t_pickup_sec[i_order] + 1,
+                                config.arr_food_ready_sec[i_order]
+                            )
+                            t_pickup_sec_next = t_pickup_sec
+                            f_cost_next = (
+                                f_cost + f_departure_sec_next - arr_cost_offset[i_order]
+                            )
+
+                        if f_cost_bound is not None and (
+                            f_cost_next + f_min_cost_left > f_cost_bound + 1e-6
+                        ):
+                            continue
+                        self._add_label(
+                            d_next_layer, t_state,
+                            (f_cost_next, f_departure_sec_next, t_pickup_sec_next, l_route + [i_node])
+                        )
+
+            if i_max_labels is not None:
+                self._keep_cheapest_labels(d_next_layer, i_max_labels)
+
+            # a route ends once nothing is on board
+            for (i_delivered, i_on_board, i_last), l_labels in d_next_layer.items():
+                if i_on_board or not self.arr_arc_exists[i_last, self.i_target]:
+                    continue
+                for (f_cost, _, _, l_route) in l_labels:
+                    if i_delivered not in d_columns or f_cost < d_columns[i_delivered][0]:
+                        d_columns[i_delivered] = (f_cost, l_route)
+
+            d_layer = d_next_layer
+
+        return d_columns
+
+    def _add_label(self, d_layer, t_state, t_label):
+
+        ### later departures delay every later arrival by at most the
+        ### difference, so a label is dropped if another one stays no worse
+        ### after paying that delay on each order still to deliver
+        (i_delivered, i_on_board, _) = t_state
+        i_num_left = self.i_num_orders - bin(i_delivered).count('1')
+        l_on_board = self.d_on_board_orders.get(i_on_board)
+        if l_on_board is None:
+            l_on_board = [i for i in range(self.i_num_orders) if i_on_board >> i & 1]
+            self.d_on_board_orders[i_on_board] = l_on_board
+
+        def dominates(t_a, t_b):
+            f_delay_sec = max(0.0, t_a[1] - t_b[1])
+            if t_a[0] + f_delay_sec * i_num_left > t_b[0]:
+                return False
+            for i in l_on_board:
+                if t_a[2][i] > t_b[2][i] + f_delay_sec:
+                    return False
+            return True
+
+        l_labels = d_layer.setdefault(t_state, [])
+        for t_other in l_labels:
+            if dominates(t_other, t_label):
+                return
+        l_labels[:] = [t_other for t_other in l_labels if not dominates(t_label, t_other)]
+        l_labels.append(t_label)
+
+    def _keep_cheapest_labels(self, d_layer, i_max_labels):
+
+        ### beam over the whole layer, the cheapest labels of any state with
+        ### earlier departures first among equal costs, as before drop-offs
+        l_labels = sorted(
+            (
+                (t_label[0], t_label[1], t_state, t_label)
+                for t_state, l_state_labels in d_layer.items()
+                for t_label in l_state_labels
+            ),
+            key = lambda t: t[: 2]
+        )
+        if len(l_labels) <= i_max_labels:
+            return
+
+        d_layer.clear()
+        for (_, _, t_state, t_label) in l_labels[: i_max_labels]:
+            d_layer.setdefault(t_state, []).append(t_label)
+
+    def _solve_master_by_subsets(self, d_columns, f_deadline = None):
+
+        ### cheapest partition of every order set into at most k routes,
+        ### the route holding the lowest order of a set is chosen first,
+        ### None once f_deadline passes
+        i_all = (1 << self.i_num_orders) - 1
+        arr_best = np.full(i_all + 1, np.inf)
+        arr_best[0] = 0.0
+        l_choice = [dict() for _ in range(self.i_num_dashers + 1)]
+
+        for i_dasher in range(1, self.i_num_dashers + 1):
+            arr_prev = arr_best
+            arr_best = arr_prev.copy()
+            for i_mask in range(1, i_all + 1):
+                if f_deadline is not None and time.perf_counter() > f_deadline:
+                    return None
+                i_low = i_mask & - i_mask
+                i_sub = i_mask
+                while i_sub:
+                    if i_sub & i_low and i_sub in d_columns:
+                        f_cost = d_columns[i_sub][0] + arr_prev[i_mask ^ i_sub]
+                        if f_cost < arr_best[i_mask]:
+                            arr_best[i_mask] = f_cost
+                            l_choice[i_dasher][i_mask] = i_sub
+                    i_sub = (i_sub - 1) & i_mask
+
+        if not np.isfinite(arr_best[i_all]):
+            raise ValueError(
+                'batch {} has no feasible set of routes'.format(self.i_batch_idx)
+            )
+
+        l_masks = []
+        i_mask = i_all
+        for i_dasher in range(self.i_num_dashers, 0, -1):
+            if i_mask == 0:
+                break
+            if i_mask in l_choice[i_dasher]:
+                i_sub = l_choice[i_dasher][i_mask]
+                l_masks.append(i_sub)
+                i_mask ^= i_sub
+
+        return l_masks
+
+    def _generate_columns(self, f_deadline):
+
+        ### start from single order routes and the local search routes, so
+        ### the master is never worse than the heuristic backend
+        config = self.config
+        d_columns = {}
+        for i_order in range(self.i_num_orders):
+            self._add_route_column(d_columns, [i_order, i_order + self.i_num_orders])
+        if heuristic.greedy_insertion(config) is not None:
+            heuristic_solver = heuristic_model.HeuristicSolver(config, self.i_batch_idx)
+            heuristic_solver.solve()
+            for l_route in heuristic_solver.l_routes:
+                if l_route:
+                    self._add_route_column(d_columns, l_route)
+        else:
+            ### without them one pass of the beam, even past the deadline,
+            ### gives the master routes longer than one order to start from
+            d_beam = self._label_routes(i_max_labels = config.i_sp_max_labels_per_layer)
+            for (_, l_route) in d_beam.values():
+                self._add_route_column(d_columns, l_route)
+
+        for _ in range(config.i_sp_max_iterations):
+            if time.perf_counter() > f_deadline:
+                break
+
+            t_duals = self._solve_master_lp(d_columns)
+            if t_duals is None:
+                break
+            (arr_order_dual, f_fleet_dual) = t_duals
+
+            # routes whose reduced cost is negative enter the master
+            d_priced = self._label_routes(
+                arr_order_dual, config.i_sp_max_labels_per_layer,
+                f_deadline = f_deadline
+            )
+            if d_priced is None:
+                break
+            l_new = sorted(
+                (f_reduced_cost - f_fleet_dual, i_mask, l_route)
+                for i_mask, (f_reduced_cost, l_route) in d_priced.items()
+                if f_reduced_cost - f_fleet_dual < -1e-6
+            )[: config.i_sp_max_columns_per_pricing]
+            if not l_new:
+                break
+            for (_, _, l_route) in l_new:
+                self._add_route_column(d_columns, l_route)
+
+        return d_columns
+
+    def _add_route_column(self, d_columns, l_route):
+
+        f_cost = heuristic.schedule_route(self.config, l_route)[2]
+        i_mask = 0
+        for i_node in l_route:
+            if i_node < self.i_num_orders:
+                i_mask |= 1 << i_node
+        if i_mask not in d_columns or f_cost < d_columns[i_mask][0]:
+            d_columns[i_mask] = (f_cost, l_route)
+
+    def _get_master_arrays(self, d_columns):
+
+        l_masks = list(d_columns)
+        arr_cost = np.array([d_columns[i_mask][0] for i_mask in l_masks])
+        arr_cover = np.array(
+            [
+                [(i_mask >> i_order) & 1 for i_mask in l_masks]
+                for i_order in range(self.i_num_orders)
+            ],
+            dtype = np.float64
+        )
+        return l_masks, arr_cost, arr_cover
+
+    def _solve_master_lp(self, d_columns):
+
+        ### every order covered once, at most one route per dasher
+        l_masks, arr_cost, arr_cover = self._get_master_arrays(d_columns)
+        result = linprog(
+            arr_cost,
+            A_ub = np.ones((1, len(l_masks))),
+            b_ub = [self.i_num_dashers],
+            A_eq = arr_cover,
+            b_eq = np.ones(self.i_num_orders),
+            bounds = (0, None),
+            method = 'highs'
+        )
+        if result.status != 0:
+            return None
+
+        return result.eqlin.marginals, float(result.ineqlin.marginals[0])
+
+    def _solve_master_milp(self, d_columns, f_deadline):
+
+        ### the time left of the batch, a past deadline still leaves the
+        ### master F_MIN_MASTER_SEC to find a first set of routes
+        f_time_limit_sec = max(F_MIN_MASTER_SEC, f_deadline - time.perf_counter())
+        l_masks, arr_cost, arr_cover = self._get_master_arrays(d_columns)
+        result = milp(
+            arr_cost,
+            constraints = [
+                LinearConstraint(arr_cover, 1, 1),
+                LinearConstraint(np.ones((1, len(l_masks))), 0, self.i_num_dashers)
+            ],
+            integrality = np.ones(len(l_masks)),
+            bounds = (0, 1),
+            options = {'time_limit': f_time_limit_sec}
+        )
+        if result.x is None and result.status == 1:
+            raise ValueError(
+                'batch {} found no set of routes in {:.1f} sec'.format(
+                    self.i_batch_idx, f_time_limit_sec
+                )
+            )
+        if result.x is None:
+            raise ValueError(
+                'batch {} has no feasible set of routes'.format(self.i_batch_idx)
+            )
+
+        return [
+            i_mask for i_mask, f_value in zip(l_masks, result.x) if f_value > 0.5
+        ]
+
+    def get_solve_stats(self):
+        return {
+            'num_columns': self.i_num_columns,
+            'num_routes': sum(1 for l_route in self.l_routes if l_route),
+            'greedy_fallback': int(self.b_greedy_fallback)
+        }
+
+    def release(self):
+        pass
+
+    def produce_solution_file(self, config):
+
+        solution_batch = self.get_solution(config)
+
+        artifact_writer.get_writer(config).write_json(
+            solution_batch.to_dict,
+            'set_partitioning_solution_batch_{:03d}'.format(self.i_batch_idx)
+        )
+
+        return solution_batch
+
+    def get_solution(self, config):
+        return heuristic.routes_to_solution(config, self.l_routes)
\ No newline at end of file
@@ -0,0 +1,113 @@
+import numpy as np
+
+
+class BatchSolution():
+    """
+    Solution of one batch as arrays indexed by (dasher, node) and
+    (dasher, arc), node and arc order as in the batch config
+    """
+
+    def __init__(
+        self, config, f_obj, arr_arrival_sec, arr_wait_sec, arr_visit_order,
+        arr_arc_used
+    ):
+
+        self.f_obj = f_obj
+        self.l_dashers = list(config.l_dashers)
+        self.l_nodes = list(config.l_nodes)
+        self.l_arcs = list(config.l_arcs)
+        self.i_num_orders = len(config.l_restaurants)
+        self.arr_delivery_id = config.arr_delivery_id
+        self.i_0_time_unix = int(config.df_0_time_unix[0])
+
+        self.arr_arrival_sec = arr_arrival_sec
+        self.arr_wait_sec    = arr_wait_sec
+        self.arr_visit_order = arr_visit_order
+        self.arr_arc_used    = arr_arc_used
+
+        ### successor of every node on each dasher's route, -1 if none
+        self.i_source = config.d_node_idx['source']
+        self.i_target = config.d_node_idx['target']
+        arr_arc_orig = np.array(
+            [config.d_node_idx[s_arc_orig] for (s_arc_orig, _) in self.l_arcs],
+            dtype = np.int64
+        )
+        arr_arc_dest = np.array(
+            [config.d_node_idx[s_arc_dest] for (_, s_arc_dest) in self.l_arcs],
+            dtype = np.int64
+        )
+        self.arr_successor = np.full(
+            (len(self.l_dashers), len(self.l_nodes)), -1, dtype = np.int64
+        )
+        arr_dasher, arr_arc = np.nonzero(arr_arc_used > 0.5)
+        self.arr_successor[arr_dasher, arr_arc_orig[arr_arc]] = arr_arc_dest[arr_arc]
+
+    def get_route(self, i_dasher):
+        """
+        Stops of a dasher between source and target, as node indices
+        """
+        l_route = []
+        i_node = self.arr_successor[i_dasher, self.i_source]
+        while i_node != self.i_target:
+            if i_node < 0 or len(l_route) >= len(self.l_nodes):
+                raise ValueError(
+                    'route of dasher {} does not reach target'.format(
+                        self.l_dashers[i_dasher]
+                    )
+                )
+            l_route.append(int(i_node))
+            i_node = self.arr_successor[i_dasher, i_node]
+
+        return l_route
+
+    def to_result_rows(self):
+
+        l_result_batch = []
+        for i_dasher, s_dasher_id in enumerate(self.l_dashers):
+            for i, i_node in enumerate(self.get_route(i_dasher)):
+
+                f_arrival_sec = round(float(self.arr_arrival_sec[i_dasher, i_node]), 5)
+                if i_node < self.i_num_orders:
+                    s_type = 'Pickup'
+                    i_delivery_id = self.arr_delivery_id[i_node]
+                    f_time_sec = f_arrival_sec + round(
+                        float(self.arr_wait_sec[i_dasher, i_node]), 0
+                    )
+                else:
+                    s_type = 'DropOff'
+                    i_delivery_id = self.arr_delivery_id[i_node - self.i_num_orders]
+                    f_time_sec = f_arrival_sec
+
+                l_result_batch.append([
+                    # route ID
+                    int(s_dasher_id[1:]),
+                    i,
+                    int(i_delivery_id),
+                    s_type,
+                    int(self.i_0_time_unix + f_time_sec)
+                ])
+
+        return l_result_batch
+
+    def to_dict(self):
+        """
+        Every variable value keyed by its formatted name, for saving as JSON
+        """
+        def group_to_dict(s_name, arr_value, l_keys, i_round):
+            return {
+                s_name + '_' + s_dasher_id + '_' + '_'.join(t_key) : round(
+                    float(arr_value[i_dasher, i_key]), i_round
+                )
+                for i_dasher, s_dasher_id in enumerate(self.l_dashers)
+                for i_key, t_key in enumerate(l_keys)
+            }
+
+        l_node_keys = [(s_node,) for s_node in self.l_nodes]
+        return {
+            'obj': self.f_obj,
+            'dashers': self.l_dashers,
+            'arrival': group_to_dict('t', self.arr_arrival_sec, l_node_keys, 5),
+            'waiting': group_to_dict('w', self.arr_wait_sec, l_node_keys, 0),
+            'visit_order': group_to_dict('u', self.arr_visit_order, l_node_keys, 0),
+            'used_arc': group_to_dict('x', self.arr_arc_used, self.l_arcs, 0)
+        }
@@ -1,171 +1,402 @@
 import time
+import numpy as np
 import pandas as pd
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from sklearn.cluster import KMeans
 
 from doorDashDelivery.configuration import configuration
-from doorDashDelivery.model import mip_model
-from doorDashDelivery.utils import data_utils as du
+from doorDashDelivery.model import heuristic
+from doorDashDelivery.utils import (
+    artifact_writer, batching, order_store, result_writer, route_chaining, run_metrics,
+    time_budget, travel_time, validator
+)
 
-def run_pipeline(s_input_csv_path, s_output_csv_path):
+def run_pipeline(s_input_csv_path, s_output_csv_path, d_config_overrides = None):
 
     f_start_time = time.time()
 
-
     ### initalize configuration
-    config = configuration.Config(
-        s_input_csv_path, s_output_csv_path
+    config = create_config(
+        s_input_csv_path, s_output_csv_path, d_config_overrides
     )
+    metrics = run_metrics.configure_metrics(config)
 
-    ### parse input files
-    l_input_data = parse_input(config)
-    config.get_solving_time_each_batch(len(l_input_data))
+    with run_metrics.profile(config.s_profile_path), metrics.stage('run_pipeline'):
+        df_results = _run_pipeline(config, metrics)
 
-    ### solve a mip for each batch
-    l_results = []
-    i_batch_idx = 1
-    for i_batch_idx_start in range(0, len(l_input_data), config.i_num_order_each_batch):
+    f_end_time = time.time()
+    metrics.log(1, '---------------------------------------------')
+    metrics.log(1, 'The program takes {} second to run'.format(
+        round(f_end_time - f_start_time, 0)
+    ))
+    if config.s_trace_path is not None:
+        metrics.write_trace(config.s_trace_path)
 
-        print('============= Batch {}'.format(i_batch_idx))
-        i_batch_idx_end = min(
-            i_batch_idx_start + config.i_num_order_each_batch, len(l_input_data)
-        )
-        l_input_data_batch = l_input_data[i_batch_idx_start : i_batch_idx_end]
+    validate_results(config, df_results)
 
-        config.create_important_data(l_input_data_batch, i_batch_idx)
-        optimization_model = mip_model.MIP(config, i_batch_idx)
-        optimization_model.solve()
-        d_solution_batch = optimization_model.produce_solution_file(config)
+    # None unless route chaining had the output in memory anyway
+    return df_results
 
-        l_batch_results = raw_solution_to_result(config, d_solution_batch)
 
-        l_results += l_batch_results
-        i_batch_idx += 1
+def _run_pipeline(config, metrics):
 
-    f_end_time = time.time()
-    print('---------------------------------------------')
-    print('The program takes {} second to run'.format(
-        round(f_end_time - f_start_time, 0)
-    ))
+    ### parse input files
+    with metrics.stage('parse_input'):
+        orders = parse_input(config)
+    config.get_solving_time_each_batch(len(orders))
+    with metrics.stage('create_travel_time_matrix'):
+        config.create_travel_time_matrix(orders)
+
+    ### split into batches, each batch is solved independently
+    with metrics.stage('split_batches'):
+        l_batches = split_batches(config, orders)
+    config.get_parallel_plan(len(l_batches))
+
+    ### solve a mip for each batch, rows go to the output as each
+    ### batch finishes, batches a resumed run already has are skipped
+    writer = result_writer.ResultWriter(
+        config.s_output_csv_path, config.s_input_csv_path, config.b_resume
+    )
+    l_batch_indices = list(range(1, len(l_batches) + 1))
+    l_todo = writer.open(l_batches, l_batch_indices)
+    l_batches = [l_batches[i_batch_pos] for i_batch_pos in l_todo]
+    l_batch_indices = [l_batch_indices[i_batch_pos] for i_batch_pos in l_todo]
+    try:
+        with metrics.stage('solve_batches'):
+            for i_batch_pos, l_batch_results in enumerate(
+                solve_batches(config, l_batches, l_batch_indices)
+            ):
+                with metrics.stage('save_results'):
+                    writer.write_batch(
+                        l_batch_indices[i_batch_pos], l_batches[i_batch_pos],
+                        l_batch_results
+                    )
+    finally:
+        writer.close()
+    dispose_solver_resources(config)
+    artifact_writer.close_writer()
+
+    # the rows are only read back when chaining rewrites them
+    if not config.b_chain_routes:
+        return None
+
+    df_results = chain_results(config, pd.read_csv(config.s_output_csv_path), orders)
+    result_writer.replace_results(config.s_output_csv_path, df_results)
+
+    return df_results
+
+
+def create_config(s_input_csv_path, s_output_csv_path, d_config_overrides = None):
+
+    ### overrides replace hard-coded parameters by attribute name
+    config = configuration.Config(
+        s_input_csv_path, s_output_csv_path
+    )
+    for s_name, value in (d_config_overrides or {}).items():
+        if not hasattr(config, s_name):
+            raise AttributeError('unknown config parameter {}'.format(s_name))
+        setattr(config, s_name, value)
+
+    return config
+
+
+def save_results(l_results, s_output_csv_path):
 
     df_results = pd.DataFrame(
         l_results,
-        columns = [
-            'Route ID',
-            'Route Point Index',
-            'Delivery ID',
-            'Route Point Type',
-            'Route Point Time'
-        ]
+        columns = result_writer.L_RESULT_COLUMNS
     )
     df_results.to_csv(
         s_output_csv_path,
         index = False
     )
 
+    return df_results
 
 
+def chain_results(config, df_results, orders):
+
+    ### routes of different batches go to one dasher where times allow
+    metrics = run_metrics.get_metrics()
+    with metrics.stage('chain_routes'):
+        df_results, d_stats = route_chaining.chain_routes(config, df_results, orders)
+    metrics.add_counters('chaining', d_stats)
+    metrics.log(1, '{} of {} routes chained after another route'.format(
+        d_stats['num_chained_routes'], d_stats['num_routes']
+    ))
+
+    return df_results
+
+
+def validate_results(config, df_results = None):
+
+    if not config.b_validate_solution:
+        return None
+
+    ### without rows in memory the saved output is validated
+    with run_metrics.get_metrics().stage('validate'):
+        if df_results is None:
+            df_results = pd.read_csv(config.s_output_csv_path)
+        d_report = validator.validate_solution(
+            df_results,
+            pd.read_csv(config.s_input_csv_path),
+            f_drive_speed_mps = travel_time.create_provider(config).get_max_speed_mps(),
+            i_day_start_sec   = int(config.df_0_time_unix[0])
+        )
+    run_metrics.log(1, '---------------------------------------------')
+    run_metrics.log(1, validator.format_report(d_report))
+
+    return d_report
+
+
+def split_batches(config, orders):
+
+    if config.s_batching != 'spatio_temporal':
+        return slice_batches(config, orders)
+
+    ### orders arrive sorted by batch, every run of equal ids is a batch
+    return orders.split_runs('batch')
 
-def parse_input(config):
 
-    ### parse data, convert the raw data to a list of dictionary
-    df_input_data = pd.read_csv(
-        config.s_input_csv_path
+def slice_batches(config, orders, i_capacity = None):
+
+    if i_capacity is None:
+        i_capacity = config.get_batch_capacity(len(orders))
+
+    return [
+        orders[i_batch_idx_start : i_batch_idx_start + i_capacity]
+        for i_batch_idx_start in range(0, len(orders), i_capacity)
+    ]
+
+
+def solve_batches(config, l_batches, l_batch_indices = None):
+
+    ### batch indices start at 1, dasher ids are derived from them
+    if l_batch_indices is None:
+        l_batch_indices = list(range(1, len(l_batches) + 1))
+
+    ### solve time is handed out when a batch starts, so time that
+    ### earlier batches did not use goes to the ones still waiting
+    scheduler = time_budget.TimeBudgetScheduler(
+        config.f_total_solving_sec,
+        [config.get_batch_hardness(orders_batch) for orders_batch in l_batches],
+        i_num_workers = config.i_num_workers,
+        f_min_sec     = config.f_min_solving_sec,
+        b_adaptive    = config.b_adaptive_time_budget,
+        f_fixed_sec   = config.f_solving_sec
     )
 
-    df_input_data = basic_k_means(config, df_input_data)
+    if config.i_num_workers == 1:
+        for i_batch_pos, orders_batch in enumerate(l_batches):
+            f_solving_sec = scheduler.allocate(i_batch_pos)
+            yield solve_batch(
+                config, orders_batch, l_batch_indices[i_batch_pos],
+                f_solving_sec = f_solving_sec
+            )
+            scheduler.release(i_batch_pos)
+        return
+
+    ### the config is shipped once per worker, only the batch goes with each task
+    with ProcessPoolExecutor(
+        max_workers = config.i_num_workers,
+        initializer = _init_worker,
+        initargs    = (config,)
+    ) as executor:
+
+        d_running = {}
+        d_finished = {}
+        i_next_pos = 0
+        i_yield_pos = 0
+        while i_yield_pos < len(l_batches):
+
+            # keep one batch per worker in flight
+            while i_next_pos < len(l_batches) and len(d_running) < config.i_num_workers:
+                future = executor.submit(
+                    _solve_batch_in_worker,
+                    l_batches[i_next_pos],
+                    l_batch_indices[i_next_pos],
+                    scheduler.allocate(i_next_pos)
+                )
+                d_running[future] = i_next_pos
+                i_next_pos += 1
+
+            set_done, _ = wait(d_running, return_when = FIRST_COMPLETED)
+            for future in set_done:
+                i_batch_pos = d_running.pop(future)
+                scheduler.release(i_batch_pos)
+                l_batch_results, d_worker_metrics = future.result()
+                run_metrics.get_metrics().merge(d_worker_metrics)
+                d_finished[i_batch_pos] = l_batch_results
+
+            # results are yielded in batch order, so the merge is deterministic
+            while i_yield_pos in d_finished:
+                yield d_finished.pop(i_yield_pos)
+                i_yield_pos += 1
+
+
+def solve_batch(
+    config, orders_batch, i_batch_idx, f_start_sec = 0, f_solving_sec = None
+):
+
+    metrics = run_metrics.get_metrics()
+    metrics.log(2, '============= Batch {}'.format(i_batch_idx))
+    with metrics.stage('batch', batch = i_batch_idx, num_orders = len(orders_batch)):
+        return _solve_batch(config, orders_batch, i_batch_idx, f_start_sec, f_solving_sec)
+
+
+def _solve_batch(config, orders_batch, i_batch_idx, f_start_sec, f_solving_sec):
+
+    metrics = run_metrics.get_metrics()
+    if f_solving_sec is not None:
+        config.f_solving_sec = f_solving_sec
+    with metrics.stage('create_important_data'):
+        config.create_important_data(orders_batch, i_batch_idx, f_start_sec)
+    with metrics.stage('build_model'):
+        optimization_model = create_optimization_model(config, i_batch_idx)
+
+    if config.b_warm_start and config.s_solver_backend in ('gurobi', 'highs'):
+        with metrics.stage('warm_start'):
+            l_routes = heuristic.greedy_insertion(config)
+            if l_routes is not None:
+                l_routes = heuristic.sort_routes_by_earliest_order(config, l_routes)
+                optimization_model.set_warm_start(
+                    heuristic.routes_to_start_values(config, l_routes)
+                )
 
-    df_input_data = df_input_data.sort_values(
-        ['region_id', 'cluster', 'created_at'],
-        ascending =[True, True, True]
+    with metrics.stage('solve'):
+        optimization_model.solve()
+    metrics.add_counters(
+        'solver', optimization_model.get_solve_stats(), t_max_names = ('mip_gap',)
     )
+    with metrics.stage('produce_solution'):
+        solution_batch = optimization_model.produce_solution_file(config)
+        optimization_model.release()
+    metrics.add_value('objective', solution_batch.f_obj)
 
-    # convert to unix time
-    df_input_data['created_at'] = pd.to_datetime(
-        df_input_data['created_at'],
-        format = "%m/%d/%y %H:%M"
-    ).astype(int) // 10 ** 9 - config.df_0_time_unix
-    df_input_data['food_ready_time'] = pd.to_datetime(
-        df_input_data['food_ready_time'],
-        format = "%m/%d/%y %H:%M"
-    ).astype(int) // 10 ** 9 - config.df_0_time_unix
+    with metrics.stage('raw_solution_to_result'):
+        return raw_solution_to_result(config, solution_batch)
 
-    l_input_data = df_input_data.to_dict('records')
 
-    return l_input_data
+def create_optimization_model(config, i_batch_idx):
 
+    ### gurobipy is only imported when a MIP backend is asked for
+    if config.s_solver_backend == 'heuristic':
+        from doorDashDelivery.model import heuristic_model
+        return heuristic_model.HeuristicSolver(config, i_batch_idx)
+    if config.s_solver_backend == 'set_partitioning':
+        from doorDashDelivery.model import set_partitioning_model
+        return set_partitioning_model.SetPartitioningSolver(config, i_batch_idx)
+    if config.s_solver_backend == 'highs':
+        from doorDashDelivery.model import highs_model
+        return highs_model.HighsMIP(config, i_batch_idx)
 
-def raw_solution_to_result(config, d_solution_batch):
+    if config.s_model_build == 'matrix':
+        from doorDashDelivery.model import matrix_model
+        if config.b_template_model and not config.b_indicator_constraints:
+            return matrix_model.get_template_mip(config, i_batch_idx)
+        return matrix_model.MatrixMIP(config, i_batch_idx)
 
-    l_result_batch = []
-    for s_dasher_id in d_solution_batch['dashers']:
+    from doorDashDelivery.model import mip_model
+    return mip_model.MIP(config, i_batch_idx)
 
-        l_dasher_used_arcs = [
-            s_key.split('_')[2 :]
-            for s_key in d_solution_batch['used_arc']
-            if (
-                d_solution_batch['used_arc'][s_key] == 1.0
-                and
-                s_dasher_id in s_key
-            )
-        ]
 
-        ### Form route
-        s_current_stop = 'source'
-        l_dasher_route = []
-        b_while_continue  = True
-        while b_while_continue:
-            for l_arc in l_dasher_used_arcs:
+def dispose_solver_resources(config):
 
-                if s_current_stop == l_arc[0]:
-                    s_current_stop = l_arc[1]
+    ### template models and the gurobi environment of this process
+    if config.s_solver_backend != 'gurobi':
+        return
 
-                    if s_current_stop == 'target':
-                        b_while_continue = False
-                        break
-                    else:
-                        l_dasher_route.append(l_arc[1])
+    if config.s_model_build == 'matrix':
+        from doorDashDelivery.model import matrix_model
+        matrix_model.dispose_templates()
 
+    from doorDashDelivery.model import mip_model
+    mip_model.dispose_env()
 
 
-        ### Form result details
-        l_dasher_route_details = [
-            [
-                # route ID
-                int(s_dasher_id[1:]),
+_worker_config = None
 
-                i,
+def _init_worker(config):
 
-                int(l_dasher_route[i][1:]),
+    global _worker_config
+    _worker_config = config
 
-                {
-                    "r": "Pickup",
-                    "c": "DropOff"
-                }[l_dasher_route[i][0]],
 
-                du.get_unix_time(
-                    config,
-                    d_solution_batch,
-                    s_dasher_id,
-                    l_dasher_route[i]
-                )
-            ]
+def _solve_batch_in_worker(orders_batch, i_batch_idx, f_solving_sec):
+
+    ### the metrics of this batch go back with its rows
+    metrics = run_metrics.reset_metrics(
+        _worker_config.s_trace_path is not None, _worker_config.i_verbosity
+    )
+    l_batch_results = solve_batch(
+        _worker_config, orders_batch, i_batch_idx,
+        f_solving_sec = f_solving_sec
+    )
 
-            for i in range(len(l_dasher_route))
-        ]
-        print('-----------')
-        print(s_dasher_id)
-        print(l_dasher_route_details)
-        l_result_batch += l_dasher_route_details
+    return l_batch_results, metrics.to_dict()
 
-    return l_result_batch
 
+def parse_input(config):
+
+    ### parse data into a column store of orders, times in seconds
+    metrics = run_metrics.get_metrics()
+    with metrics.stage('read_orders'):
+        orders = order_store.read_orders(
+            config.s_input_csv_path,
+            int(config.df_0_time_unix[0]),
+            config.i_input_chunk_rows
+        )
+
+    with metrics.stage('clustering'):
+        orders = cluster_orders(config, orders)
+
+    # travel time locations follow the parsed order
+    orders.assign('position', np.arange(len(orders), dtype = np.int64))
+
+    return orders
+
+
+def cluster_orders(config, orders):
+
+    ### sorted so that split_batches can cut batches off the store
+    if config.s_batching != 'spatio_temporal':
+        orders.assign('cluster', basic_k_means(config, orders))
+        orders = orders.sort_by(['region_id', 'cluster', 'created_at'])
+    else:
+        df_batching = batching.assign_spatio_temporal_batches(
+            config,
+            orders.to_frame([
+                'region_id', 'pickup_lat', 'pickup_long',
+                'dropoff_lat', 'dropoff_long', 'food_ready_time'
+            ])
+        )
+        orders.assign('batch', df_batching['batch'].to_numpy())
+        orders = orders.sort_by(['batch', 'food_ready_time', 'delivery_id'])
 
+    return orders
 
-def basic_k_means(config, df_input_data):
+
+def raw_solution_to_result(config, solution_batch):
+
+    l_result_batch = solution_batch.to_result_rows()
+
+    metrics = run_metrics.get_metrics()
+    if metrics.i_verbosity >= 3:
+        for s_dasher_id in solution_batch.l_dashers:
+            metrics.log(3, '-----------')
+            metrics.log(3, s_dasher_id)
+            metrics.log(3, str([
+                l_row for l_row in l_result_batch
+                if l_row[0] == int(s_dasher_id[1:])
+            ]))
+
+    return l_result_batch
+
+
+def basic_k_means(config, orders):
 
     kmeans = KMeans(n_clusters = config.i_num_clusters, random_state=42)
-    df_input_data['cluster'] = kmeans.fit_predict(
-        df_input_data[['pickup_lat', 'pickup_long']]
-    )
 
-    return df_input_data
\ No newline at end of file
+    return kmeans.fit_predict(
+        orders.to_frame(['pickup_lat', 'pickup_long'])
+    )
\ No newline at end of file
@@ -0,0 +1,168 @@
+import itertools
+import os
+import traceback
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from doorDashDelivery import benchmark, pipeline
+from doorDashDelivery.utils import run_metrics
+
+### grid of run_sweep when none is given. Solvers mostly run until their
+### time limit, so the time budget is swept too, at one budget wall_sec
+### would differ little between runs
+D_DEFAULT_GRID = {
+    'i_num_order_each_batch': [4, 6, 8],
+    'i_available_dasher_each_batch': [1, 2, 3],
+    'f_total_solving_sec': [15, 60]
+}
+
+### (column, sign) of what the frontier minimizes, quality is scored
+### by the validator
+L_PARETO_OBJECTIVES = [
+    ('wall_sec', 1),
+    ('efficiency', -1),
+    ('average_delivery_min', 1)
+]
+
+
+def run_sweep(
+    s_input_csv_path, s_result_dir, d_grid = None, d_config_overrides = None,
+    i_num_workers = 0
+):
+    """
+    Runs the pipeline once for every combination of the d_grid values,
+    i_num_workers runs at a time in separate processes, each writing its
+    output, artifacts and benchmark json under its own directory. Returns
+    one row per run, the pareto column marks the passed runs no other
+    passed run beats on runtime, efficiency and average delivery time
+    """
+    d_grid = dict(D_DEFAULT_GRID if d_grid is None else d_grid)
+    d_config_overrides = dict(d_config_overrides or {})
+    l_runs = get_grid_overrides(d_grid)
+
+    # i_num_clusters only changes the 'kmeans_slice' batching
+    if 'i_num_clusters' in d_grid and 's_batching' not in d_grid:
+        d_config_overrides.setdefault('s_batching', 'kmeans_slice')
+
+    ### unknown parameters fail here rather than in every worker
+    for d_run_overrides in l_runs:
+        pipeline.create_config(
+            s_input_csv_path, '', dict(d_config_overrides, **d_run_overrides)
+        )
+
+    i_num_cores = get_num_cores()
+    if i_num_workers <= 0:
+        i_num_workers = i_num_cores
+    i_num_workers = max(1, min(i_num_workers, len(l_runs)))
+
+    # concurrent runs split the cores instead of each taking all of them
+    d_config_overrides.setdefault('i_num_cores', max(1, i_num_cores // i_num_workers))
+    d_config_overrides.setdefault('i_verbosity', 0)
+
+    os.makedirs(s_result_dir, exist_ok = True)
+    l_results = []
+    ### one process per run, gurobi environments and template models
+    ### of one run never leak into the next
+    with ProcessPoolExecutor(
+        max_workers = i_num_workers, max_tasks_per_child = 1
+    ) as executor:
+
+        d_futures = {}
+        for i_run, d_run_overrides in enumerate(l_runs, 1):
+            s_label = 'run_{:03d}'.format(i_run)
+            s_run_dir = os.path.join(s_result_dir, s_label)
+            future = executor.submit(
+                _run_one, s_input_csv_path, s_run_dir, s_label,
+                dict(
+                    d_config_overrides,
+                    l_solution_dir = os.path.join(s_run_dir, 'raw_solutions'),
+                    **d_run_overrides
+                )
+            )
+            d_futures[future] = (s_label, d_run_overrides)
+
+        for future in as_completed(d_futures):
+            s_label, d_run_overrides = d_futures[future]
+            d_result = future.result()
+            d_result.update(d_run_overrides)
+            l_results.append(d_result)
+            run_metrics.log(1, 'Sweep {} done, {} of {} runs'.format(
+                s_label, len(l_results), len(l_runs)
+            ))
+
+    # nested fields become dotted columns, as in benchmark.load_results
+    df_results = pd.json_normalize(l_results).sort_values('label', kind = 'stable')
+    df_results = df_results.reset_index(drop = True)
+    df_results['pareto'] = get_pareto_mask(df_results)
+
+    s_summary_path = os.path.join(s_result_dir, 'sweep_summary.csv')
+    df_results.to_csv(s_summary_path, index = False)
+    run_metrics.log(1, 'Sweep summary saved to {}'.format(s_summary_path))
+
+    return df_results
+
+
+def get_grid_overrides(d_grid):
+
+    ### the cartesian product, the last parameter varies fastest
+    l_names = list(d_grid)
+    return [
+        dict(zip(l_names, t_values))
+        for t_values in itertools.product(*[d_grid[s_name] for s_name in l_names])
+    ]
+
+
+def get_pareto_mask(df_results):
+
+    ### a failed run is never on the frontier and never dominates
+    arr_pareto = np.zeros(len(df_results), dtype = bool)
+    if df_results.empty or any(
+        s_column not in df_results for s_column, _ in L_PARETO_OBJECTIVES
+    ):
+        return arr_pareto
+
+    arr_passed = df_results['passed'].fillna(False).to_numpy(dtype = bool)
+    arr_costs = np.column_stack([
+        i_sign * df_results[s_column].to_numpy(dtype = np.float64)
+        for s_column, i_sign in L_PARETO_OBJECTIVES
+    ])
+    arr_passed &= ~np.isnan(arr_costs).any(axis = 1)
+
+    arr_candidates = np.flatnonzero(arr_passed)
+    for i in arr_candidates:
+        arr_other = arr_costs[arr_candidates]
+        b_dominated = np.any(
+            np.all(arr_other <= arr_costs[i], axis = 1)
+            &
+            np.any(arr_other < arr_costs[i], axis = 1)
+        )
+        arr_pareto[i] = not b_dominated
+
+    return arr_pareto
+
+
+def get_num_cores():
+
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+def _run_one(s_input_csv_path, s_run_dir, s_label, d_config_overrides):
+
+    ### a run that raises is reported as a failed row, the sweep goes on
+    try:
+        return benchmark.run_benchmark(
+            s_input_csv_path, s_run_dir, s_label, d_config_overrides,
+            b_trace_memory = False
+        )
+    except Exception:
+        return {
+            'label': s_label,
+            'input': s_input_csv_path,
+            'config_overrides': d_config_overrides,
+            'passed': False,
+            'error': traceback.format_exc()
+        }
\ No newline at end of file
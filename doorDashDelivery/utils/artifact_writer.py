@@ -0,0 +1,160 @@
+import bz2
+import gzip
+import json
+import shutil
+import os
+import queue
+import threading
+from multiprocessing import util
+
+from doorDashDelivery.utils import data_utils
+
+
+class ArtifactWriter():
+    """
+    Writes per-batch solver artifacts following Config.s_artifact_mode:
+    'off' writes nothing, 'plain' writes .lp / .json, 'compressed'
+    writes .mps.bz2 / .json.gz. With Config.b_artifact_async the JSON
+    files are serialized and written by a background thread fed through
+    a bounded queue. A gurobipy model can not be used from another
+    thread, so the solve path still writes it, uncompressed to a
+    temporary file, and the thread compresses it and moves it in place
+    """
+
+    def __init__(self, s_artifact_mode, s_solution_dir, b_async, i_queue_size):
+
+        if s_artifact_mode not in ('off', 'plain', 'compressed'):
+            raise ValueError(
+                'unknown artifact mode {}'.format(s_artifact_mode)
+            )
+
+        self.s_artifact_mode = s_artifact_mode
+        self.s_solution_dir  = s_solution_dir
+        # the settings as asked, b_async below is what is actually used
+        self.t_key = (s_artifact_mode, s_solution_dir, b_async)
+        self.b_async = b_async and s_artifact_mode != 'off'
+        self.exception = None
+
+        if s_artifact_mode != 'off':
+            os.makedirs(s_solution_dir, exist_ok = True)
+
+        if self.b_async:
+            # a full queue blocks the solver loop instead of growing memory
+            self.queue = queue.Queue(maxsize = i_queue_size)
+            self.thread = threading.Thread(target = self._run, daemon = True)
+            self.thread.start()
+
+    def get_key(self):
+        return self.t_key
+
+    def write_model(self, model, s_file_name):
+
+        if self.s_artifact_mode == 'off':
+            return
+
+        s_path = os.path.join(self.s_solution_dir, s_file_name)
+        if not self.b_async:
+            model.write(
+                s_path + ('.lp' if self.s_artifact_mode == 'plain' else '.mps.bz2')
+            )
+            return
+
+        # the uncompressed write is the least the solve path can do
+        s_extension = '.lp' if self.s_artifact_mode == 'plain' else '.mps'
+        s_tmp_path = s_path + '.tmp' + s_extension
+        model.write(s_tmp_path)
+        self._put(self._finish_model, s_tmp_path, s_path + s_extension)
+
+    def _finish_model(self, s_tmp_path, s_path):
+
+        ### compressed mode compresses here, off the solve path
+        if self.s_artifact_mode == 'plain':
+            os.replace(s_tmp_path, s_path)
+            return
+
+        with open(s_tmp_path, 'rb') as file, bz2.open(s_path + '.bz2', 'wb') as bz2_file:
+            shutil.copyfileobj(file, bz2_file)
+        os.remove(s_tmp_path)
+
+    def write_json(self, fn_get_data, s_file_name):
+
+        ### the data is only built when it is written
+        if self.s_artifact_mode == 'off':
+            return
+
+        if self.b_async:
+            self._put(self._write_json, fn_get_data, s_file_name)
+        else:
+            self._write_json(fn_get_data, s_file_name)
+
+    def _put(self, fn_write, *t_args):
+
+        self._raise_pending_exception()
+        self.queue.put((fn_write, t_args))
+
+    def _write_json(self, fn_get_data, s_file_name):
+
+        s_path = os.path.join(self.s_solution_dir, s_file_name)
+        if self.s_artifact_mode == 'plain':
+            data_utils.saveJson(fn_get_data(), s_path + '.json')
+        else:
+            with gzip.open(s_path + '.json.gz', 'wt') as file:
+                json.dump(fn_get_data(), file)
+
+    def _run(self):
+
+        while True:
+            t_item = self.queue.get()
+            try:
+                if t_item is None:
+                    return
+                if self.exception is None:
+                    (fn_write, t_args) = t_item
+                    fn_write(*t_args)
+            except Exception as exception:
+                self.exception = exception
+            finally:
+                self.queue.task_done()
+
+    def _raise_pending_exception(self):
+
+        if self.exception is not None:
+            exception, self.exception = self.exception, None
+            raise exception
+
+    def close(self):
+
+        if self.b_async:
+            self.queue.put(None)
+            self.thread.join()
+            self.b_async = False
+        self._raise_pending_exception()
+
+
+### one writer per process, pool workers flush theirs when they exit
+_writer = None
+
+def get_writer(config):
+
+    global _writer
+    t_key = (config.s_artifact_mode, config.l_solution_dir, config.b_artifact_async)
+    if _writer is not None and _writer.get_key() != t_key:
+        close_writer()
+
+    if _writer is None:
+        _writer = ArtifactWriter(
+            config.s_artifact_mode,
+            config.l_solution_dir,
+            config.b_artifact_async,
+            config.i_artifact_queue_size
+        )
+        util.Finalize(_writer, _writer.close, exitpriority = 10)
+
+    return _writer
+
+def close_writer():
+
+    global _writer
+    if _writer is not None:
+        writer, _writer = _writer, None
+        writer.close()
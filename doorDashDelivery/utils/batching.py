@@ -0,0 +1,117 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from sklearn.cluster import KMeans
+
+# meters per degree of latitude, and of longitude at the equator
+F_METERS_PER_DEGREE_LAT  = 110540
+F_METERS_PER_DEGREE_LONG = 111320
+
+
+def assign_spatio_temporal_batches(config, df_input_data):
+    """
+    Adds a 'batch' column grouping orders by pickup location, drop-off
+    location and food ready time together, no batch holds more than
+    Config.get_batch_capacity() orders and batches never cross regions
+    """
+    i_capacity = config.get_batch_capacity(len(df_input_data))
+
+    arr_batch = np.zeros(len(df_input_data), dtype = np.int64)
+    i_next_batch = 0
+    for _, df_region in df_input_data.groupby('region_id', sort = True):
+
+        arr_features = get_features(config, df_region)
+        arr_region_batch = np.zeros(len(df_region), dtype = np.int64)
+
+        # a grid index keeps every clustering problem small
+        for arr_cell in split_into_cells(arr_features[:, :2], config.i_batching_cell_orders):
+            arr_cell_batch = capacitated_clusters(
+                arr_features[arr_cell], i_capacity
+            )
+            arr_region_batch[arr_cell] = arr_cell_batch + i_next_batch
+            i_next_batch += arr_cell_batch.max() + 1
+
+        arr_batch[df_input_data.index.get_indexer(df_region.index)] = arr_region_batch
+
+    df_input_data['batch'] = arr_batch
+
+    return df_input_data
+
+
+def get_features(config, df_input_data):
+
+    ### everything in meters, food ready seconds at driving speed
+    f_cos_lat = np.cos(np.radians(df_input_data['pickup_lat'].mean()))
+
+    return np.column_stack([
+        df_input_data['pickup_long'].to_numpy() * F_METERS_PER_DEGREE_LONG * f_cos_lat,
+        df_input_data['pickup_lat'].to_numpy() * F_METERS_PER_DEGREE_LAT,
+        df_input_data['dropoff_long'].to_numpy() * F_METERS_PER_DEGREE_LONG * f_cos_lat,
+        df_input_data['dropoff_lat'].to_numpy() * F_METERS_PER_DEGREE_LAT,
+        df_input_data['food_ready_time'].to_numpy()
+        * config.f_drive_speed_mps
+        * config.f_batching_time_weight
+    ])
+
+
+def split_into_cells(arr_xy, i_max_cell_orders):
+    """
+    Recursive median split on the wider axis until every cell holds at
+    most i_max_cell_orders rows, returns row indices of each cell
+    """
+    l_cells = []
+    l_stack = [np.arange(len(arr_xy))]
+    while l_stack:
+        arr_cell = l_stack.pop()
+        if len(arr_cell) <= i_max_cell_orders:
+            l_cells.append(arr_cell)
+            continue
+
+        arr_cell_xy = arr_xy[arr_cell]
+        i_axis = int(np.argmax(np.ptp(arr_cell_xy, axis = 0)))
+        arr_order = np.argsort(arr_cell_xy[:, i_axis], kind = 'stable')
+        i_half = len(arr_cell) // 2
+        l_stack += [arr_cell[arr_order[: i_half]], arr_cell[arr_order[i_half :]]]
+
+    return l_cells
+
+
+def capacitated_clusters(arr_features, i_capacity):
+    """
+    KMeans with one center per capacity-sized group, then every order
+    goes to its nearest center that still has room
+    """
+    i_num_orders = len(arr_features)
+    i_num_clusters = int(np.ceil(i_num_orders / i_capacity))
+    if i_num_clusters <= 1:
+        return np.zeros(i_num_orders, dtype = np.int64)
+
+    kmeans = KMeans(n_clusters = i_num_clusters, n_init = 1, random_state = 42)
+    kmeans.fit(arr_features)
+
+    i_num_candidates = min(i_num_clusters, 8)
+    arr_distance, arr_candidate = cKDTree(kmeans.cluster_centers_).query(
+        arr_features, k = i_num_candidates
+    )
+    arr_distance  = arr_distance.reshape(i_num_orders, -1)
+    arr_candidate = arr_candidate.reshape(i_num_orders, -1)
+
+    arr_cluster = np.full(i_num_orders, -1, dtype = np.int64)
+    arr_room = np.full(i_num_clusters, i_capacity)
+    for i_order in np.argsort(arr_distance[:, 0], kind = 'stable'):
+        for i_cluster in arr_candidate[i_order]:
+            if arr_room[i_cluster] > 0:
+                arr_cluster[i_order] = i_cluster
+                arr_room[i_cluster] -= 1
+                break
+
+    # orders whose nearby centers are full go to the nearest one with room
+    for i_order in np.nonzero(arr_cluster < 0)[0]:
+        arr_distance_all = np.linalg.norm(
+            kmeans.cluster_centers_ - arr_features[i_order], axis = 1
+        )
+        arr_distance_all[arr_room <= 0] = np.inf
+        i_cluster = int(np.argmin(arr_distance_all))
+        arr_cluster[i_order] = i_cluster
+        arr_room[i_cluster] -= 1
+
+    return arr_cluster
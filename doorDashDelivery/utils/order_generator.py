@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from doorDashDelivery.utils.batching import F_METERS_PER_DEGREE_LAT, F_METERS_PER_DEGREE_LONG
+
+S_TIME_FORMAT = '%m/%d/%y %H:%M'
+
+
+def generate_orders(
+    i_num_orders, i_num_regions = 3, f_time_span_hours = 1.0, i_seed = 42,
+    s_start_time = '2015-02-03 02:00:00', f_center_lat = 37.44, f_center_long = -122.16
+):
+    """
+    Seeded synthetic orders with the columns of optimization_take_home.csv.
+    Regions sit on a grid around the center, each with a pool of
+    restaurants of skewed popularity, drop-offs are a few kilometers
+    from the restaurant, food is ready about 27 minutes after creation
+    and orders peak in the middle of the time span
+    """
+    rng = np.random.default_rng(i_seed)
+    f_cos_lat = np.cos(np.radians(f_center_lat))
+
+    ### region centers on a grid about 15 km apart
+    i_grid = int(np.ceil(np.sqrt(i_num_regions)))
+    arr_region_row, arr_region_col = np.divmod(np.arange(i_num_regions), i_grid)
+    arr_region_lat = f_center_lat + (arr_region_row - (i_grid - 1) / 2) * 15000 / F_METERS_PER_DEGREE_LAT
+    arr_region_long = f_center_long + (arr_region_col - (i_grid - 1) / 2) * 15000 / (
+        F_METERS_PER_DEGREE_LONG * f_cos_lat
+    )
+    arr_region_id = rng.choice(np.arange(1, 10 * i_num_regions + 1), i_num_regions, replace = False)
+
+    # bigger regions get more orders
+    arr_region_weight = rng.gamma(2.0, 1.0, i_num_regions)
+    arr_region = rng.choice(
+        i_num_regions, i_num_orders, p = arr_region_weight / arr_region_weight.sum()
+    )
+
+    ### restaurants around each region center, popularity ~ 1 / rank
+    arr_pickup_lat = np.empty(i_num_orders)
+    arr_pickup_long = np.empty(i_num_orders)
+    for i_region in range(i_num_regions):
+        arr_mask = arr_region == i_region
+        i_num_region_orders = int(arr_mask.sum())
+        if i_num_region_orders == 0:
+            continue
+
+        i_num_restaurants = max(1, i_num_region_orders // 2)
+        arr_restaurant_lat = arr_region_lat[i_region] + rng.normal(
+            0, 3000, i_num_restaurants
+        ) / F_METERS_PER_DEGREE_LAT
+        arr_restaurant_long = arr_region_long[i_region] + rng.normal(
+            0, 3000, i_num_restaurants
+        ) / (F_METERS_PER_DEGREE_LONG * f_cos_lat)
+        arr_popularity = 1.0 / np.arange(1, i_num_restaurants + 1) ** 0.8
+        arr_restaurant = rng.choice(
+            i_num_restaurants, i_num_region_orders, p = arr_popularity / arr_popularity.sum()
+        )
+        arr_pickup_lat[arr_mask] = arr_restaurant_lat[arr_restaurant]
+        arr_pickup_long[arr_mask] = arr_restaurant_long[arr_restaurant]
+
+    # drop-off at a random bearing, about 3 km away
+    arr_distance_m = np.clip(rng.gamma(4.0, 750.0, i_num_orders), 200, 8000)
+    arr_bearing = rng.uniform(0, 2 * np.pi, i_num_orders)
+    arr_dropoff_lat = arr_pickup_lat + arr_distance_m * np.cos(arr_bearing) / F_METERS_PER_DEGREE_LAT
+    arr_dropoff_long = arr_pickup_long + arr_distance_m * np.sin(arr_bearing) / (
+        F_METERS_PER_DEGREE_LONG * f_cos_lat
+    )
+
+    ### minutes after the start, the input has minute resolution
+    f_span_min = f_time_span_hours * 60
+    arr_created_min = np.sort(np.floor(rng.beta(2.0, 2.0, i_num_orders) * f_span_min))
+    arr_ready_min = arr_created_min + np.round(
+        np.clip(rng.normal(27, 8.5, i_num_orders), 6, 60)
+    )
+
+    ts_start = pd.Timestamp(s_start_time)
+    df_orders = pd.DataFrame({
+        'delivery_id': np.arange(1, i_num_orders + 1),
+        'created_at': (
+            ts_start + pd.to_timedelta(arr_created_min, unit = 'min')
+        ).strftime(S_TIME_FORMAT),
+        'food_ready_time': (
+            ts_start + pd.to_timedelta(arr_ready_min, unit = 'min')
+        ).strftime(S_TIME_FORMAT),
+        'region_id': arr_region_id[arr_region],
+        'pickup_lat': arr_pickup_lat.round(7),
+        'pickup_long': arr_pickup_long.round(7),
+        'dropoff_lat': arr_dropoff_lat.round(7),
+        'dropoff_long': arr_dropoff_long.round(7)
+    })
+
+    return df_orders
\ No newline at end of file
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+S_TIME_FORMAT = '%m/%d/%y %H:%M'
+
+### column name and dtype of every array of an OrderStore, times are
+### seconds after Config.df_0_time_unix, position is the row of the order
+### in the store parse_input returned and indexes travel-time locations
+D_COLUMN_DTYPE = {
+    'delivery_id': np.int64,
+    'created_at': np.int64,
+    'food_ready_time': np.int64,
+    'region_id': np.int64,
+    'pickup_lat': np.float64,
+    'pickup_long': np.float64,
+    'dropoff_lat': np.float64,
+    'dropoff_long': np.float64,
+    'position': np.int64
+}
+
+
+class OrderStore():
+    """
+    Orders as one numpy array per column, row i of every array is one
+    order. store['column'] is a column array, store[i : j] a store whose
+    arrays are views into this one, store[arr_idx] a copy of those rows
+    """
+    __slots__ = ['d_columns']
+
+    def __init__(self, d_columns):
+        self.d_columns = d_columns
+
+    def __len__(self):
+        return len(self.d_columns['delivery_id'])
+
+    def __getitem__(self, key):
+
+        if isinstance(key, str):
+            return self.d_columns[key]
+
+        return OrderStore({
+            s_column: arr[key] for s_column, arr in self.d_columns.items()
+        })
+
+    def __getstate__(self):
+        return self.d_columns
+
+    def __setstate__(self, d_columns):
+        self.d_columns = d_columns
+
+    def assign(self, s_column, arr):
+        self.d_columns[s_column] = np.asarray(arr)
+
+    def sort_by(self, l_columns):
+
+        ### stable, the first column is the primary key
+        arr_order = np.lexsort([self.d_columns[s] for s in l_columns[:: -1]])
+        return self[arr_order]
+
+    def split_runs(self, s_column):
+
+        ### every run of equal values becomes one zero-copy slice
+        arr_values = self.d_columns[s_column]
+        arr_start = np.flatnonzero(
+            np.concatenate([[True], arr_values[1 :] != arr_values[: -1]])
+        ) if len(self) else np.empty(0, dtype = np.int64)
+        arr_end = np.append(arr_start[1 :], len(self))
+        return [self[i_start : i_end] for i_start, i_end in zip(arr_start, arr_end)]
+
+    def to_frame(self, l_columns = None):
+        return pd.DataFrame({
+            s_column: self.d_columns[s_column]
+            for s_column in (l_columns or list(self.d_columns))
+        })
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for arr in self.d_columns.values())
+
+
+def read_orders(s_path, i_day_start_sec, i_chunk_rows = 100000):
+    """
+    Reads the orders csv, or parquet when the path ends with .parquet,
+    chunk by chunk into an OrderStore, no chunk is kept as a DataFrame
+    """
+    d_chunks = {s_column: [] for s_column in D_COLUMN_DTYPE}
+    i_num_orders = 0
+    for df_chunk in _iter_chunks(s_path, i_chunk_rows):
+
+        for s_column in ['created_at', 'food_ready_time']:
+            df_chunk[s_column] = pd.to_datetime(
+                df_chunk[s_column], format = S_TIME_FORMAT
+            ).astype(np.int64) // 10 ** 9 - i_day_start_sec
+        df_chunk['position'] = np.arange(i_num_orders, i_num_orders + len(df_chunk))
+        i_num_orders += len(df_chunk)
+
+        for s_column, dtype in D_COLUMN_DTYPE.items():
+            d_chunks[s_column].append(df_chunk[s_column].to_numpy(dtype = dtype))
+
+    return OrderStore({
+        s_column: (
+            np.concatenate(l_arrays) if l_arrays
+            else np.empty(0, dtype = D_COLUMN_DTYPE[s_column])
+        )
+        for s_column, l_arrays in d_chunks.items()
+    })
+
+
+def _iter_chunks(s_path, i_chunk_rows):
+
+    l_columns = [s_column for s_column in D_COLUMN_DTYPE if s_column != 'position']
+
+    ### pyarrow is only needed for parquet input
+    if s_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(s_path).iter_batches(
+            batch_size = i_chunk_rows, columns = l_columns
+        ):
+            yield batch.to_pandas()
+        return
+
+    yield from pd.read_csv(s_path, usecols = l_columns, chunksize = i_chunk_rows)
\ No newline at end of file
@@ -0,0 +1,153 @@
+import csv
+import hashlib
+import json
+import os
+
+from doorDashDelivery.utils import run_metrics
+
+L_RESULT_COLUMNS = [
+    'Route ID',
+    'Route Point Index',
+    'Delivery ID',
+    'Route Point Type',
+    'Route Point Time'
+]
+
+
+class ResultWriter():
+    """
+    Appends the result rows of each batch to the output csv as soon as
+    the batch is solved, then records the batch in a manifest of json
+    lines next to it, so a batch is in the manifest only once its rows
+    are on disk. With b_resume a rerun on the same input keeps the
+    batches the manifest lists, drops rows written after the last of
+    them and solves only the rest
+    """
+
+    def __init__(self, s_output_csv_path, s_input_csv_path, b_resume = False):
+
+        self.s_output_csv_path = s_output_csv_path
+        self.s_manifest_path = s_output_csv_path + '.manifest'
+        self.b_resume = b_resume
+        self.d_input = {
+            'input': os.path.abspath(s_input_csv_path),
+            'size': os.path.getsize(s_input_csv_path),
+            'mtime_ns': os.stat(s_input_csv_path).st_mtime_ns
+        }
+        self.file = None
+        self.manifest_file = None
+
+    def open(self, l_batches, l_batch_indices):
+        """
+        Returns the positions in l_batches still to solve, a manifest of
+        another input or of different batches starts the output over
+        """
+        d_done = self._read_manifest() if self.b_resume else None
+        d_batch_hash = {
+            i_batch_idx: get_batch_hash(orders_batch)
+            for i_batch_idx, orders_batch in zip(l_batch_indices, l_batches)
+        }
+        if d_done and all(
+            d_batch_hash.get(i_batch_idx) == d_entry['orders_hash']
+            for i_batch_idx, d_entry in d_done.items()
+        ):
+            i_offset = max(d_entry['offset'] for d_entry in d_done.values())
+            with open(self.s_output_csv_path, 'r+b') as file:
+                file.truncate(i_offset)
+            self.file = open(self.s_output_csv_path, 'a', newline = '')
+            # rewritten, an entry cut short must not precede new ones
+            self.manifest_file = open(self.s_manifest_path, 'w')
+            for d_entry in [self.d_input] + list(d_done.values()):
+                self._write_manifest_line(d_entry)
+            run_metrics.log(1, 'Resuming {}, {} of {} batches already solved'.format(
+                self.s_output_csv_path, len(d_done), len(l_batches)
+            ))
+        else:
+            if d_done:
+                run_metrics.log(1, 'Manifest {} does not match this run, starting over'.format(
+                    self.s_manifest_path
+                ))
+            d_done = {}
+            self.file = open(self.s_output_csv_path, 'w', newline = '')
+            csv.writer(self.file, lineterminator = '\n').writerow(L_RESULT_COLUMNS)
+            self._sync(self.file)
+            self.manifest_file = open(self.s_manifest_path, 'w')
+            self._write_manifest_line(self.d_input)
+
+        return [
+            i_batch_pos for i_batch_pos, i_batch_idx in enumerate(l_batch_indices)
+            if i_batch_idx not in d_done
+        ]
+
+    def write_batch(self, i_batch_idx, orders_batch, l_batch_results):
+
+        csv.writer(self.file, lineterminator = '\n').writerows(l_batch_results)
+        self._sync(self.file)
+        self._write_manifest_line({
+            'batch': i_batch_idx,
+            'orders_hash': get_batch_hash(orders_batch),
+            'num_rows': len(l_batch_results),
+            'offset': self.file.tell()
+        })
+
+    def close(self):
+
+        for file in (self.file, self.manifest_file):
+            if file is not None:
+                file.close()
+        self.file = self.manifest_file = None
+
+    def _read_manifest(self):
+
+        ### batch index -> entry, None when there is nothing to resume
+        if not (
+            os.path.exists(self.s_manifest_path)
+            and
+            os.path.exists(self.s_output_csv_path)
+        ):
+            return None
+
+        d_done = {}
+        with open(self.s_manifest_path) as file:
+            l_lines = file.read().splitlines()
+        if not l_lines or json.loads(l_lines[0]) != self.d_input:
+            return None
+
+        # a line cut short by the interruption is not a finished batch
+        for s_line in l_lines[1 :]:
+            try:
+                d_entry = json.loads(s_line)
+            except ValueError:
+                break
+            d_done[d_entry['batch']] = d_entry
+
+        if d_done and max(
+            d_entry['offset'] for d_entry in d_done.values()
+        ) > os.path.getsize(self.s_output_csv_path):
+            return None
+
+        return d_done
+
+    def _write_manifest_line(self, d_entry):
+
+        self.manifest_file.write(json.dumps(d_entry) + '\n')
+        self._sync(self.manifest_file)
+
+    def _sync(self, file):
+
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def replace_results(s_output_csv_path, df_results):
+
+    ### the rows no longer follow the batches, so the manifest goes too
+    s_tmp_path = s_output_csv_path + '.tmp'
+    df_results.to_csv(s_tmp_path, index = False)
+    os.replace(s_tmp_path, s_output_csv_path)
+    if os.path.exists(s_output_csv_path + '.manifest'):
+        os.remove(s_output_csv_path + '.manifest')
+
+
+def get_batch_hash(orders_batch):
+    return hashlib.md5(orders_batch['delivery_id'].tobytes()).hexdigest()
\ No newline at end of file
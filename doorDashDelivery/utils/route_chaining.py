@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+
+from doorDashDelivery.utils import data_utils as du, travel_time
+
+### meters along a meridian per degree, on the sphere of data_utils.haversine_pairs
+F_METERS_PER_DEGREE_LAT = np.pi / 180 * 6371000
+
+
+def chain_routes(config, df_results, orders):
+    """
+    Hands routes of different batches to one dasher: route b follows
+    route a when the dasher of a, leaving a's last drop-off, reaches b's
+    first pickup by its planned time and b starts after a. Every route
+    is kept as planned, so delivery times do not change. The evaluator
+    charges each route from the start of the day to its last point, so
+    the chains are a matching of route ends to route starts that
+    maximizes the end times saved, solved as a sparse assignment
+    """
+    if df_results.empty:
+        return df_results, {'num_routes': 0, 'num_chained_routes': 0}
+
+    df_results = df_results.sort_values(
+        ['Route ID', 'Route Point Index'], kind = 'stable'
+    ).reset_index(drop = True)
+    arr_route_id = df_results['Route ID'].to_numpy(dtype = np.int64)
+    arr_time_unix = df_results['Route Point Time'].to_numpy(dtype = np.int64)
+
+    ### first and last point of every route
+    arr_first = np.flatnonzero(
+        np.concatenate([[True], arr_route_id[1 :] != arr_route_id[: -1]])
+    )
+    arr_last = np.append(arr_first[1 :], len(df_results)) - 1
+    i_num_routes = len(arr_first)
+
+    arr_order = pd.Index(orders['delivery_id']).get_indexer(
+        df_results['Delivery ID'].to_numpy()
+    )
+    arr_start_unix = arr_time_unix[arr_first]
+    arr_end_unix = arr_time_unix[arr_last]
+    arr_start_lat = orders['pickup_lat'][arr_order[arr_first]]
+    arr_start_long = orders['pickup_long'][arr_order[arr_first]]
+    arr_end_lat = orders['dropoff_lat'][arr_order[arr_last]]
+    arr_end_long = orders['dropoff_long'][arr_order[arr_last]]
+
+    arr_prev, arr_next = get_chain_arcs(
+        config, arr_start_unix, arr_end_unix,
+        arr_start_lat, arr_start_long, arr_end_lat, arr_end_long
+    )
+    arr_successor = match_route_ends(
+        i_num_routes, arr_prev, arr_next,
+        arr_end_unix - int(config.df_0_time_unix[0])
+    )
+
+    ### follow each chain from its head, the head's Route ID is kept
+    arr_has_prev = np.zeros(i_num_routes, dtype = bool)
+    arr_has_prev[arr_successor[arr_successor >= 0]] = True
+    l_route_order = []
+    l_new_route_id = []
+    for i_head in np.flatnonzero(~ arr_has_prev):
+        i_route = i_head
+        while i_route >= 0:
+            l_route_order.append(i_route)
+            l_new_route_id.append(arr_route_id[arr_first[i_head]])
+            i_route = arr_successor[i_route]
+
+    arr_route_order = np.array(l_route_order, dtype = np.int64)
+    arr_route_len = (arr_last - arr_first + 1)[arr_route_order]
+    arr_row = np.concatenate([
+        np.arange(arr_first[i_route], arr_last[i_route] + 1)
+        for i_route in arr_route_order
+    ])
+    df_chained = df_results.iloc[arr_row].reset_index(drop = True)
+    df_chained['Route ID'] = np.repeat(l_new_route_id, arr_route_len)
+    df_chained['Route Point Index'] = (
+        df_chained.groupby('Route ID', sort = False).cumcount()
+    )
+
+    return df_chained, {
+        'num_routes': i_num_routes,
+        'num_chained_routes': int((arr_successor >= 0).sum())
+    }
+
+
+def get_chain_arcs(
+    config, arr_start_unix, arr_end_unix,
+    arr_start_lat, arr_start_long, arr_end_lat, arr_end_long
+):
+    """
+    Pairs (a, b) where route b can follow route a. Only starts within
+    f_chain_max_idle_sec of an end are looked at, route ends a chunk at
+    a time, and a straight line at the provider's top speed rules out
+    most of them before the provider is asked for the rest. Each end
+    keeps its i_chain_max_candidates feasible starts of least idle time
+    """
+    arr_by_start = np.argsort(arr_start_unix, kind = 'stable')
+    arr_sorted_start = arr_start_unix[arr_by_start]
+    arr_lo = np.searchsorted(arr_sorted_start, arr_end_unix, side = 'left')
+    arr_hi = np.searchsorted(
+        arr_sorted_start, arr_end_unix + config.f_chain_max_idle_sec, side = 'right'
+    )
+    arr_count = arr_hi - arr_lo
+
+    ### chunks of about i_chain_chunk_pairs candidate pairs
+    arr_chunk = np.cumsum(arr_count) // config.i_chain_chunk_pairs
+    l_prev, l_next = [], []
+    for i_chunk in np.unique(arr_chunk):
+        arr_end = np.flatnonzero(arr_chunk == i_chunk)
+        arr_prev = np.repeat(arr_end, arr_count[arr_end])
+        arr_next = arr_by_start[
+            np.repeat(
+                arr_lo[arr_end] - np.cumsum(arr_count[arr_end]) + arr_count[arr_end],
+                arr_count[arr_end]
+            )
+            + np.arange(arr_count[arr_end].sum())
+        ]
+        arr_prev, arr_next = _get_feasible_arcs(
+            config, arr_prev, arr_next, arr_start_unix, arr_end_unix,
+            arr_start_lat, arr_start_long, arr_end_lat, arr_end_long
+        )
+
+        # pairs come sorted by end, then by start time, so by idle time
+        arr_rank = np.arange(len(arr_prev)) - np.searchsorted(arr_prev, arr_prev)
+        arr_keep = arr_rank < config.i_chain_max_candidates
+        l_prev.append(arr_prev[arr_keep])
+        l_next.append(arr_next[arr_keep])
+
+    if not l_prev:
+        return np.empty(0, dtype = np.int64), np.empty(0, dtype = np.int64)
+
+    return np.concatenate(l_prev), np.concatenate(l_next)
+
+
+def _get_feasible_arcs(
+    config, arr_prev, arr_next, arr_start_unix, arr_end_unix,
+    arr_start_lat, arr_start_long, arr_end_lat, arr_end_long
+):
+
+    # a later start keeps every chain free of cycles
+    arr_keep = arr_start_unix[arr_next] > arr_start_unix[arr_prev]
+    arr_prev, arr_next = arr_prev[arr_keep], arr_next[arr_keep]
+
+    arr_slack_sec = arr_start_unix[arr_next] - arr_end_unix[arr_prev]
+    provider = config.travel_time_provider
+    f_max_speed_mps = provider.get_max_speed_mps()
+
+    # the latitude difference alone bounds the straight line from below
+    arr_keep = np.round(
+        np.abs(arr_end_lat[arr_prev] - arr_start_lat[arr_next])
+        * F_METERS_PER_DEGREE_LAT / f_max_speed_mps
+    ) <= arr_slack_sec
+    arr_prev, arr_next = arr_prev[arr_keep], arr_next[arr_keep]
+    arr_slack_sec = arr_slack_sec[arr_keep]
+
+    arr_keep = np.round(
+        du.haversine_pairs(
+            arr_end_lat[arr_prev], arr_end_long[arr_prev],
+            arr_start_lat[arr_next], arr_start_long[arr_next]
+        ) / f_max_speed_mps
+    ) <= arr_slack_sec
+    arr_prev, arr_next = arr_prev[arr_keep], arr_next[arr_keep]
+    arr_slack_sec = arr_slack_sec[arr_keep]
+
+    ### time dependent providers answer once per time slot of departure,
+    ### pairs go through the run's travel time cache like batch blocks
+    arr_travel_sec = np.empty(len(arr_prev))
+    arr_slot = np.zeros(len(arr_prev), dtype = np.int64)
+    if provider.b_time_dependent:
+        arr_slot[:] = [
+            provider.get_time_slot(i_unix) for i_unix in arr_end_unix[arr_prev]
+        ]
+    for i_slot in np.unique(arr_slot):
+        arr_mask = arr_slot == i_slot
+        arr_travel_sec[arr_mask] = travel_time.get_pair_time_sec(
+            provider,
+            arr_end_lat[arr_prev[arr_mask]], arr_end_long[arr_prev[arr_mask]],
+            arr_start_lat[arr_next[arr_mask]], arr_start_long[arr_next[arr_mask]],
+            arr_end_unix[arr_prev[arr_mask]].min(),
+            config.travel_time_cache, config.i_travel_time_cache_decimals
+        )
+
+    # legs are rounded to the second like the batch travel times
+    arr_keep = np.round(arr_travel_sec) <= arr_slack_sec
+    return arr_prev[arr_keep], arr_next[arr_keep]
+
+
+def match_route_ends(i_num_routes, arr_prev, arr_next, arr_end_sec):
+    """
+    Successor of every route, -1 if none. Each route end is matched to
+    at most one route start, a matched end saves its arr_end_sec. Every
+    end also has a private dummy start so that a full matching exists
+    """
+    arr_successor = np.full(i_num_routes, -1, dtype = np.int64)
+    if len(arr_prev) == 0:
+        return arr_successor
+
+    # costs are kept positive, explicit zeros would read as missing edges
+    f_max_sec = float(arr_end_sec.max()) + 1
+    arr_dummy = np.arange(i_num_routes)
+    cost = sparse.csr_matrix(
+        (
+            np.concatenate([
+                f_max_sec - arr_end_sec[arr_prev].astype(np.float64) + 1,
+                np.full(i_num_routes, f_max_sec + 1)
+            ]),
+            (
+                np.concatenate([arr_prev, arr_dummy]),
+                np.concatenate([arr_next, i_num_routes + arr_dummy])
+            )
+        ),
+        shape = (i_num_routes, 2 * i_num_routes)
+    )
+    _, arr_match = min_weight_full_bipartite_matching(cost)
+
+    arr_real = arr_match < i_num_routes
+    arr_successor[arr_real] = arr_match[arr_real]
+    return arr_successor
\ No newline at end of file
@@ -0,0 +1,162 @@
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+
+
+class RunMetrics():
+    """
+    Wall-clock seconds and call counts per pipeline stage, plus summed
+    values such as the solver objective and largest values such as the
+    solver mip gap, for the batches of one process.
+    With b_trace every stage is also kept as a timed span, nested stages
+    nest in the Chrome trace of to_chrome_trace, and counters are kept
+    as trace counter events. i_verbosity gates log: 0 quiet, 1 run
+    summaries, 2 batch progress and solver logs, 3 every route
+    """
+
+    def __init__(self, b_trace = False, i_verbosity = 1):
+
+        self.d_stage_sec = {}
+        self.d_stage_count = {}
+        self.d_values = {}
+        self.d_max_values = {}
+        self.b_trace = b_trace
+        self.i_verbosity = i_verbosity
+        self.l_events = []
+
+    @contextlib.contextmanager
+    def stage(self, s_stage, **d_args):
+
+        f_start_unix_sec = time.time()
+        f_start_sec = time.perf_counter()
+        try:
+            yield
+        finally:
+            f_sec = time.perf_counter() - f_start_sec
+            self.add_stage(s_stage, f_sec)
+            if self.b_trace:
+                self.l_events.append(self._get_event(
+                    s_stage, 'X', f_start_unix_sec, d_args, f_dur_us = f_sec * 1e6
+                ))
+
+    def add_stage(self, s_stage, f_sec, i_count = 1):
+
+        self.d_stage_sec[s_stage] = self.d_stage_sec.get(s_stage, 0.0) + f_sec
+        self.d_stage_count[s_stage] = self.d_stage_count.get(s_stage, 0) + i_count
+
+    def add_value(self, s_name, f_value):
+        self.d_values[s_name] = self.d_values.get(s_name, 0.0) + f_value
+
+    def add_max_value(self, s_name, f_value):
+        self.d_max_values[s_name] = max(self.d_max_values.get(s_name, f_value), f_value)
+
+    def add_counters(self, s_group, d_counters, t_max_names = ()):
+
+        ### summed as '<group>.<name>' values, one trace counter event per
+        ### call. Ratios named in t_max_names, which do not add up across
+        ### batches, keep their largest value instead
+        for s_name, f_value in d_counters.items():
+            s_value_name = '{}.{}'.format(s_group, s_name)
+            if s_name in t_max_names:
+                self.add_max_value(s_value_name, f_value)
+            else:
+                self.add_value(s_value_name, f_value)
+        if self.b_trace and d_counters:
+            self.l_events.append(
+                self._get_event(s_group, 'C', time.time(), dict(d_counters))
+            )
+
+    def log(self, i_level, s_message):
+        if self.i_verbosity >= i_level:
+            print(s_message)
+
+    def _get_event(self, s_name, s_phase, f_start_unix_sec, d_args, f_dur_us = None):
+
+        ### wall clock timestamps so the spans of pool workers line up
+        d_event = {
+            'name': s_name,
+            'ph': s_phase,
+            'ts': f_start_unix_sec * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': d_args
+        }
+        if f_dur_us is not None:
+            d_event['dur'] = f_dur_us
+
+        return d_event
+
+    def merge(self, d_metrics):
+
+        ### adds what another process recorded, see to_dict
+        for s_stage, f_sec in d_metrics['stage_sec'].items():
+            self.add_stage(s_stage, f_sec, d_metrics['stage_count'][s_stage])
+        for s_name, f_value in d_metrics['values'].items():
+            self.add_value(s_name, f_value)
+        for s_name, f_value in d_metrics['max_values'].items():
+            self.add_max_value(s_name, f_value)
+        self.l_events += d_metrics.get('events', [])
+
+    def to_dict(self):
+
+        return {
+            'stage_sec': dict(self.d_stage_sec),
+            'stage_count': dict(self.d_stage_count),
+            'values': dict(self.d_values),
+            'max_values': dict(self.d_max_values),
+            'events': list(self.l_events)
+        }
+
+    def to_chrome_trace(self):
+        return {
+            'traceEvents': sorted(self.l_events, key = lambda d: d['ts']),
+            'displayTimeUnit': 'ms'
+        }
+
+    def write_trace(self, s_trace_path):
+
+        ### .json opens in chrome://tracing and Perfetto
+        with open(s_trace_path, 'w') as file:
+            json.dump(self.to_chrome_trace(), file)
+
+
+### one recorder per process, pool workers hand theirs back with each batch
+_metrics = RunMetrics()
+
+def get_metrics():
+    return _metrics
+
+def reset_metrics(b_trace = False, i_verbosity = 1):
+
+    global _metrics
+    _metrics = RunMetrics(b_trace, i_verbosity)
+    return _metrics
+
+def configure_metrics(config):
+
+    ### keeps what was recorded, takes tracing and verbosity from the config
+    _metrics.b_trace = config.s_trace_path is not None
+    _metrics.i_verbosity = config.i_verbosity
+    return _metrics
+
+def log(i_level, s_message):
+    _metrics.log(i_level, s_message)
+
+@contextlib.contextmanager
+def profile(s_profile_path):
+
+    ### cProfile of the calling process, stats load with pstats.Stats
+    if s_profile_path is None:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(s_profile_path)
\ No newline at end of file
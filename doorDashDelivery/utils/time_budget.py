@@ -0,0 +1,57 @@
+import time
+
+
+class TimeBudgetScheduler():
+    """
+    Hands out solve time to batches from one global wall-clock budget.
+    Every allocation is a share of what is left, weighted by batch
+    hardness, so time a batch does not use flows to later batches
+    """
+
+    def __init__(
+        self, f_total_sec, l_batch_weights, i_num_workers = 1,
+        f_min_sec = 0.05, b_adaptive = True, f_fixed_sec = None
+    ):
+
+        self.f_deadline = time.time() + f_total_sec
+        self.l_batch_weights = l_batch_weights
+        self.f_unallocated_weight = float(sum(l_batch_weights))
+        self.i_num_workers = i_num_workers
+        self.f_min_sec = f_min_sec
+        self.b_adaptive = b_adaptive
+        self.f_fixed_sec = f_fixed_sec
+
+        ### batch position -> (start time, allocated seconds) while solving
+        self.d_in_flight = {}
+
+    def allocate(self, i_batch_pos):
+
+        f_weight = self.l_batch_weights[i_batch_pos]
+        f_now = time.time()
+
+        if not self.b_adaptive:
+            f_sec = self.f_fixed_sec
+        else:
+            f_remaining_sec = max(0, self.f_deadline - f_now)
+
+            # worker-seconds left, minus what running batches may still use
+            f_capacity_sec = f_remaining_sec * self.i_num_workers - sum(
+                max(0, f_allocated_sec - (f_now - f_start))
+                for (f_start, f_allocated_sec) in self.d_in_flight.values()
+            )
+            f_sec = (
+                max(0, f_capacity_sec)
+                * f_weight
+                / max(self.f_unallocated_weight, f_weight, 1e-9)
+            )
+
+            # a single batch can never run past the deadline
+            f_sec = max(self.f_min_sec, min(f_sec, f_remaining_sec))
+
+        self.f_unallocated_weight -= f_weight
+        self.d_in_flight[i_batch_pos] = (f_now, f_sec)
+
+        return round(f_sec, 3)
+
+    def release(self, i_batch_pos):
+        self.d_in_flight.pop(i_batch_pos, None)
@@ -0,0 +1,445 @@
+import hashlib
+import os
+import tempfile
+from multiprocessing import util
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from doorDashDelivery.utils import data_utils as du
+from doorDashDelivery.utils.batching import F_METERS_PER_DEGREE_LAT, F_METERS_PER_DEGREE_LONG
+
+### a cached pair is the two rounded locations and the provider's time slot
+PAIR_KEY_DTYPE = np.dtype([('orig', '<i8'), ('dest', '<i8'), ('slot', '<i8')])
+### a cached pair as stored on disk, its key followed by its seconds
+PAIR_ENTRY_DTYPE = np.dtype(PAIR_KEY_DTYPE.descr + [('sec', '<f4')])
+
+
+class TravelTimeProvider():
+    """
+    Seconds to drive from each origin to the destination at the same
+    position, inputs broadcast like numpy. Time dependent providers may
+    answer differently by departure time, cached providers go through
+    a TravelTimeCache since each pair is expensive
+    """
+    b_time_dependent = False
+    b_cached = False
+
+    def get_pair_time_sec(
+        self, arr_orig_lat, arr_orig_long, arr_dest_lat, arr_dest_long,
+        f_depart_unix_sec = 0
+    ):
+        raise NotImplementedError
+
+    def get_time_slot(self, f_depart_unix_sec):
+        return 0
+
+    def get_cache_name(self):
+        raise NotImplementedError
+
+    def get_max_speed_mps(self):
+        raise NotImplementedError
+
+
+class HaversineProvider(TravelTimeProvider):
+    """
+    Straight line at a constant speed
+    """
+
+    def __init__(self, f_speed_mps):
+        self.f_speed_mps = f_speed_mps
+
+    def get_pair_time_sec(
+        self, arr_orig_lat, arr_orig_long, arr_dest_lat, arr_dest_long,
+        f_depart_unix_sec = 0
+    ):
+        return du.haversine_pairs(
+            arr_orig_lat, arr_orig_long, arr_dest_lat, arr_dest_long
+        ) / self.f_speed_mps
+
+    def get_cache_name(self):
+        return 'haversine_{}'.format(self.f_speed_mps)
+
+    def get_max_speed_mps(self):
+        return self.f_speed_mps
+
+
+class SpeedProfileProvider(TravelTimeProvider):
+    """
+    Straight line at the speed of the hour of day of the departure,
+    l_speed_mps holds the 24 hourly speeds from midnight UTC
+    """
+    b_time_dependent = True
+
+    def __init__(self, l_speed_mps):
+
+        if len(l_speed_mps) != 24:
+            raise ValueError(
+                'speed profile needs 24 hourly speeds, got {}'.format(len(l_speed_mps))
+            )
+        self.arr_speed_mps = np.asarray(l_speed_mps, dtype = np.float64)
+
+    def get_time_slot(self, f_depart_unix_sec):
+        return int(f_depart_unix_sec // 3600) % 24
+
+    def get_pair_time_sec(
+        self, arr_orig_lat, arr_orig_long, arr_dest_lat, arr_dest_long,
+        f_depart_unix_sec = 0
+    ):
+        return du.haversine_pairs(
+            arr_orig_lat, arr_orig_long, arr_dest_lat, arr_dest_long
+        ) / self.arr_speed_mps[self.get_time_slot(f_depart_unix_sec)]
+
+    def get_cache_name(self):
+        return 'speed_profile_{}'.format(
+            hashlib.md5(self.arr_speed_mps.tobytes()).hexdigest()[: 12]
+        )
+
+    def get_max_speed_mps(self):
+        return float(self.arr_speed_mps.max())
+
+
+class RoadGraphProvider(TravelTimeProvider):
+    """
+    Shortest paths over a road graph csv with columns from_lat, from_long,
+    to_lat, to_long and optionally length_m (straight line when missing),
+    speed_mps (f_speed_mps when missing) and oneway (two-way when missing).
+    Locations reach their nearest graph node in a straight line at
+    f_speed_mps, pairs with no path fall back to the straight line
+    """
+    b_cached = True
+
+    def __init__(self, s_graph_path, f_speed_mps):
+
+        self.s_graph_path = s_graph_path
+        self.f_speed_mps = f_speed_mps
+
+        df_edges = pd.read_csv(s_graph_path)
+        with open(s_graph_path, 'rb') as file:
+            self.s_graph_hash = hashlib.md5(file.read()).hexdigest()[: 12]
+
+        if 'length_m' not in df_edges:
+            df_edges['length_m'] = du.haversine_pairs(
+                df_edges['from_lat'], df_edges['from_long'],
+                df_edges['to_lat'], df_edges['to_long']
+            )
+        if 'speed_mps' not in df_edges:
+            df_edges['speed_mps'] = f_speed_mps
+        if 'oneway' not in df_edges:
+            df_edges['oneway'] = 0
+        self.f_max_speed_mps = max(f_speed_mps, float(df_edges['speed_mps'].max()))
+
+        ### graph nodes are the distinct edge end points
+        arr_end_points = np.concatenate([
+            df_edges[['from_lat', 'from_long']].to_numpy(dtype = np.float64),
+            df_edges[['to_lat', 'to_long']].to_numpy(dtype = np.float64)
+        ])
+        self.arr_node_location, arr_end_node = np.unique(
+            arr_end_points, axis = 0, return_inverse = True
+        )
+        arr_end_node = arr_end_node.reshape(-1)
+        i_num_edges = len(df_edges)
+        arr_from = arr_end_node[: i_num_edges]
+        arr_to   = arr_end_node[i_num_edges :]
+        arr_edge_sec = (df_edges['length_m'] / df_edges['speed_mps']).to_numpy()
+
+        arr_two_way = df_edges['oneway'].to_numpy() == 0
+        arr_from, arr_to = (
+            np.concatenate([arr_from, arr_to[arr_two_way]]),
+            np.concatenate([arr_to, arr_from[arr_two_way]])
+        )
+        arr_edge_sec = np.concatenate([arr_edge_sec, arr_edge_sec[arr_two_way]])
+
+        # parallel edges keep the fastest, csr_matrix would add them up
+        df_arcs = pd.DataFrame({'from': arr_from, 'to': arr_to, 'sec': arr_edge_sec})
+        df_arcs = df_arcs.groupby(['from', 'to'], as_index = False)['sec'].min()
+        i_num_nodes = len(self.arr_node_location)
+        self.graph = csr_matrix(
+            (df_arcs['sec'].to_numpy(), (df_arcs['from'].to_numpy(), df_arcs['to'].to_numpy())),
+            shape = (i_num_nodes, i_num_nodes)
+        )
+
+        self.f_cos_lat = np.cos(np.radians(self.arr_node_location[:, 0].mean()))
+        self.tree = cKDTree(self._to_meters(
+            self.arr_node_location[:, 0], self.arr_node_location[:, 1]
+        ))
+
+    def _to_meters(self, arr_lat, arr_long):
+
+        return np.column_stack([
+            np.asarray(arr_lat) * F_METERS_PER_DEGREE_LAT,
+            np.asarray(arr_long) * F_METERS_PER_DEGREE_LONG * self.f_cos_lat
+        ])
+
+    def _snap(self, arr_lat, arr_long):
+
+        ### nearest graph node and the straight line seconds to reach it
+        _, arr_node = self.tree.query(self._to_meters(arr_lat, arr_long))
+        arr_snap_sec = du.haversine_pairs(
+            arr_lat, arr_long,
+            self.arr_node_location[arr_node, 0], self.arr_node_location[arr_node, 1]
+        ) / self.f_speed_mps
+        return arr_node, arr_snap_sec
+
+    def get_pair_time_sec(
+        self, arr_orig_lat, arr_orig_long, arr_dest_lat, arr_dest_long,
+        f_depart_unix_sec = 0
+    ):
+        t_shape = np.broadcast_shapes(*(
+            np.shape(arr) for arr in (arr_orig_lat, arr_orig_long, arr_dest_lat, arr_dest_long)
+        ))
+        arr_orig_lat, arr_orig_long, arr_dest_lat, arr_dest_long = (
+            np.broadcast_to(np.asarray(arr, dtype = np.float64), t_shape).reshape(-1)
+            for arr in (arr_orig_lat, arr_orig_long, arr_dest_lat, arr_dest_long)
+        )
+
+        arr_orig_node, arr_orig_snap_sec = self._snap(arr_orig_lat, arr_orig_long)
+        arr_dest_node, arr_dest_snap_sec = self._snap(arr_dest_lat, arr_dest_long)
+
+        # one shortest path tree per distinct origin node
+        arr_source, arr_source_idx = np.unique(arr_orig_node, return_inverse = True)
+        arr_path_sec = dijkstra(self.graph, directed = True, indices = arr_source)[
+            arr_source_idx.reshape(-1), arr_dest_node
+        ]
+
+        arr_time_sec = arr_orig_snap_sec + arr_path_sec + arr_dest_snap_sec
+        arr_no_path = ~ np.isfinite(arr_time_sec)
+        arr_time_sec[arr_no_path] = du.haversine_pairs(
+            arr_orig_lat[arr_no_path], arr_orig_long[arr_no_path],
+            arr_dest_lat[arr_no_path], arr_dest_long[arr_no_path]
+        ) / self.f_speed_mps
+        arr_time_sec[
+            (arr_orig_lat == arr_dest_lat) & (arr_orig_long == arr_dest_long)
+        ] = 0
+
+        return arr_time_sec.reshape(t_shape)
+
+    def get_cache_name(self):
+        return 'road_graph_{}_{}'.format(self.s_graph_hash, self.f_speed_mps)
+
+    def get_max_speed_mps(self):
+        return self.f_max_speed_mps
+
+
+class TravelTimeCache():
+    """
+    Pair seconds kept on disk as one .npy file of PAIR_ENTRY_DTYPE rows
+    sorted by key and read memory-mapped, so every run and batch shares
+    the pairs computed before. New pairs are held in memory and written
+    at exit or every i_flush_pairs pairs, merged with whatever is on
+    disk by then. Keys and seconds are replaced together in one rename
+    """
+
+    def __init__(self, s_cache_dir, s_name, i_flush_pairs = 200000):
+
+        self.s_path = os.path.join(s_cache_dir, s_name + '_pairs.npy')
+        self.i_flush_pairs = i_flush_pairs
+        self.arr_new_keys = np.empty(0, dtype = PAIR_KEY_DTYPE)
+        self.arr_new_sec  = np.empty(0, dtype = np.float32)
+        self._open()
+        util.Finalize(None, self.flush, exitpriority = 4)
+
+    def _open(self):
+
+        # the key fields of the entries are searched in place
+        if os.path.exists(self.s_path):
+            arr_entries = np.load(self.s_path, mmap_mode = 'r')
+            self.arr_keys = arr_entries[list(PAIR_KEY_DTYPE.names)]
+            self.arr_sec  = arr_entries['sec']
+        else:
+            self.arr_keys = np.empty(0, dtype = PAIR_KEY_DTYPE)
+            self.arr_sec  = np.empty(0, dtype = np.float32)
+
+    def __getstate__(self):
+
+        ### pool workers open the files themselves
+        return {
+            's_path': self.s_path,
+            'i_flush_pairs': self.i_flush_pairs
+        }
+
+    def __setstate__(self, d_state):
+        self.__init__(
+            os.path.dirname(d_state['s_path']),
+            os.path.basename(d_state['s_path'])[: - len('_pairs.npy')],
+            d_state['i_flush_pairs']
+        )
+
+    def __len__(self):
+        return len(self.arr_keys) + len(self.arr_new_keys)
+
+    def lookup(self, arr_keys):
+
+        ### seconds of each key, NaN where the pair is not cached yet
+        arr_sec = np.full(len(arr_keys), np.nan, dtype = np.float32)
+        for (arr_cached_keys, arr_cached_sec) in [
+            (self.arr_keys, self.arr_sec), (self.arr_new_keys, self.arr_new_sec)
+        ]:
+            if len(arr_cached_keys) == 0:
+                continue
+            arr_pos = np.minimum(
+                np.searchsorted(arr_cached_keys, arr_keys), len(arr_cached_keys) - 1
+            )
+            arr_found = arr_cached_keys[arr_pos] == arr_keys
+            arr_sec[arr_found] = arr_cached_sec[arr_pos[arr_found]]
+
+        return arr_sec
+
+    def add(self, arr_keys, arr_sec):
+
+        self.arr_new_keys, self.arr_new_sec = _merge_sorted(
+            self.arr_new_keys, self.arr_new_sec, arr_keys, arr_sec
+        )
+        if len(self.arr_new_keys) >= self.i_flush_pairs:
+            self.flush()
+
+    def flush(self):
+
+        if len(self.arr_new_keys) == 0:
+            return
+
+        ### another run may have written since this one opened the files
+        s_dir = os.path.dirname(self.s_path) or '.'
+        os.makedirs(s_dir, exist_ok = True)
+        self._open()
+        arr_keys, arr_sec = _merge_sorted(
+            np.asarray(self.arr_keys).astype(PAIR_KEY_DTYPE), np.asarray(self.arr_sec),
+            self.arr_new_keys, self.arr_new_sec
+        )
+        arr_entries = np.empty(len(arr_keys), dtype = PAIR_ENTRY_DTYPE)
+        for s_field in PAIR_KEY_DTYPE.names:
+            arr_entries[s_field] = arr_keys[s_field]
+        arr_entries['sec'] = arr_sec
+
+        i_fd, s_tmp_path = tempfile.mkstemp(dir = s_dir, suffix = '.npy')
+        with os.fdopen(i_fd, 'wb') as file:
+            np.save(file, arr_entries)
+        os.chmod(s_tmp_path, 0o644)
+        os.replace(s_tmp_path, self.s_path)
+
+        self.arr_new_keys = np.empty(0, dtype = PAIR_KEY_DTYPE)
+        self.arr_new_sec  = np.empty(0, dtype = np.float32)
+        self._open()
+
+
+def _merge_sorted(arr_keys, arr_sec, arr_more_keys, arr_more_sec):
+
+    ### union sorted by key, the first seconds of a duplicate key are kept
+    arr_all_keys = np.concatenate([arr_keys, arr_more_keys])
+    arr_all_sec  = np.concatenate([arr_sec, arr_more_sec]).astype(np.float32)
+    arr_order = np.argsort(arr_all_keys, kind = 'stable')
+    arr_all_keys, arr_all_sec = arr_all_keys[arr_order], arr_all_sec[arr_order]
+
+    arr_first = np.ones(len(arr_all_keys), dtype = bool)
+    arr_first[1 :] = arr_all_keys[1 :] != arr_all_keys[: -1]
+    return arr_all_keys[arr_first], arr_all_sec[arr_first]
+
+
+def get_location_keys(arr_lat, arr_long, i_decimals):
+
+    ### one int64 per location rounded to i_decimals
+    i_scale = 10 ** i_decimals
+    arr_lat_int  = np.round(np.asarray(arr_lat) * i_scale).astype(np.int64) + 90 * i_scale
+    arr_long_int = np.round(np.asarray(arr_long) * i_scale).astype(np.int64) + 180 * i_scale
+    return arr_lat_int * (360 * i_scale + 1) + arr_long_int
+
+
+def get_time_matrix_sec(
+    provider, arr_lat, arr_long, f_depart_unix_sec = 0, cache = None, i_decimals = 5
+):
+    """
+    Seconds between every pair of the given locations, rows are origins.
+    With a cache, locations are rounded to i_decimals and only pairs
+    missing from the cache are asked from the provider
+    """
+    if cache is None:
+        return provider.get_pair_time_sec(
+            np.asarray(arr_lat)[:, np.newaxis], np.asarray(arr_long)[:, np.newaxis],
+            np.asarray(arr_lat)[np.newaxis, :], np.asarray(arr_long)[np.newaxis, :],
+            f_depart_unix_sec
+        )
+
+    ### repeated restaurants collapse to one rounded location
+    arr_location_key = get_location_keys(arr_lat, arr_long, i_decimals)
+    _, arr_first, arr_inverse = np.unique(
+        arr_location_key, return_index = True, return_inverse = True
+    )
+    i_num_keys = len(arr_first)
+    arr_orig, arr_dest = np.divmod(np.arange(i_num_keys * i_num_keys), i_num_keys)
+    arr_lat_key  = np.asarray(arr_lat)[arr_first]
+    arr_long_key = np.asarray(arr_long)[arr_first]
+    arr_sec = get_pair_time_sec(
+        provider,
+        arr_lat_key[arr_orig], arr_long_key[arr_orig],
+        arr_lat_key[arr_dest], arr_long_key[arr_dest],
+        f_depart_unix_sec, cache, i_decimals
+    )
+
+    arr_inverse = arr_inverse.reshape(-1)
+    return arr_sec.reshape(i_num_keys, i_num_keys)[np.ix_(arr_inverse, arr_inverse)]
+
+
+def get_pair_time_sec(
+    provider, arr_orig_lat, arr_orig_long, arr_dest_lat, arr_dest_long,
+    f_depart_unix_sec = 0, cache = None, i_decimals = 5
+):
+    """
+    Seconds from each origin to the destination at the same position.
+    With a cache, locations are rounded to i_decimals and only pairs
+    missing from the cache are asked from the provider, once each
+    """
+    if cache is None:
+        return provider.get_pair_time_sec(
+            arr_orig_lat, arr_orig_long, arr_dest_lat, arr_dest_long, f_depart_unix_sec
+        )
+
+    arr_pair_keys = np.empty(len(arr_orig_lat), dtype = PAIR_KEY_DTYPE)
+    arr_pair_keys['orig'] = get_location_keys(arr_orig_lat, arr_orig_long, i_decimals)
+    arr_pair_keys['dest'] = get_location_keys(arr_dest_lat, arr_dest_long, i_decimals)
+    arr_pair_keys['slot'] = provider.get_time_slot(f_depart_unix_sec)
+
+    arr_sec = cache.lookup(arr_pair_keys).astype(np.float64)
+    arr_sec[arr_pair_keys['orig'] == arr_pair_keys['dest']] = 0
+    arr_missing = np.flatnonzero(np.isnan(arr_sec))
+    if len(arr_missing):
+        arr_new_keys, arr_first, arr_inverse = np.unique(
+            arr_pair_keys[arr_missing], return_index = True, return_inverse = True
+        )
+        arr_first = arr_missing[arr_first]
+        arr_new_sec = np.asarray(provider.get_pair_time_sec(
+            np.asarray(arr_orig_lat)[arr_first], np.asarray(arr_orig_long)[arr_first],
+            np.asarray(arr_dest_lat)[arr_first], np.asarray(arr_dest_long)[arr_first],
+            f_depart_unix_sec
+        ), dtype = np.float64)
+        arr_sec[arr_missing] = arr_new_sec[arr_inverse.reshape(-1)]
+        cache.add(arr_new_keys, arr_new_sec)
+
+    return arr_sec
+
+
+def create_provider(config):
+
+    if config.s_travel_time_provider == 'haversine':
+        return HaversineProvider(config.f_drive_speed_mps)
+    if config.s_travel_time_provider == 'speed_profile':
+        return SpeedProfileProvider(config.l_speed_profile_mps)
+    if config.s_travel_time_provider == 'road_graph':
+        return RoadGraphProvider(config.s_road_graph_path, config.f_drive_speed_mps)
+
+    raise ValueError(
+        'unknown travel time provider {}'.format(config.s_travel_time_provider)
+    )
+
+
+def create_cache(config, provider):
+
+    ### only providers that are expensive per pair are cached
+    if not provider.b_cached or config.s_travel_time_cache_dir is None:
+        return None
+
+    return TravelTimeCache(
+        config.s_travel_time_cache_dir,
+        '{}_{}'.format(provider.get_cache_name(), config.i_travel_time_cache_decimals)
+    )
\ No newline at end of file
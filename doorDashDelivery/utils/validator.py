@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+
+from doorDashDelivery.utils import data_utils as du
+
+S_DAY_START = '2015-02-03 02:00:00'
+
+
+def validate_solution(
+    df_solution, df_orders, f_drive_speed_mps = 4.5, f_tolerance_sec = 3,
+    f_max_average_delivery_min = 45, i_day_start_sec = None,
+    s_time_format = '%m/%d/%y %H:%M'
+):
+    """
+    Checks a solution (the output.csv columns) against the orders in
+    vectorized form over route points sorted by Route ID and Route
+    Point Index, returns a report with every check and the metrics
+    """
+    if i_day_start_sec is None:
+        i_day_start_sec = int(pd.Timestamp(S_DAY_START).timestamp())
+
+    arr_route = df_solution['Route ID'].to_numpy(dtype = np.int64)
+    arr_point = df_solution['Route Point Index'].to_numpy(dtype = np.int64)
+    arr_sort = np.lexsort((arr_point, arr_route))
+    arr_route = arr_route[arr_sort]
+    arr_delivery = df_solution['Delivery ID'].to_numpy()[arr_sort]
+    arr_type = (
+        df_solution['Route Point Type'].astype(str).str.strip().to_numpy()[arr_sort]
+    )
+    arr_time_sec = _to_unix_sec(df_solution['Route Point Time'])[arr_sort]
+    arr_pickup  = arr_type == 'Pickup'
+    arr_dropoff = arr_type == 'DropOff'
+
+    ### every route point looks up its order
+    arr_order = pd.Index(df_orders['delivery_id']).get_indexer(arr_delivery)
+    arr_known = arr_order >= 0
+    arr_order = np.where(arr_known, arr_order, 0)
+    arr_created_sec = _to_unix_sec(df_orders['created_at'], s_time_format)[arr_order]
+    arr_ready_sec   = _to_unix_sec(df_orders['food_ready_time'], s_time_format)[arr_order]
+    arr_lat = np.where(
+        arr_pickup,
+        df_orders['pickup_lat'].to_numpy()[arr_order],
+        df_orders['dropoff_lat'].to_numpy()[arr_order]
+    )
+    arr_long = np.where(
+        arr_pickup,
+        df_orders['pickup_long'].to_numpy()[arr_order],
+        df_orders['dropoff_long'].to_numpy()[arr_order]
+    )
+
+    i_num_deliveries = len(df_orders)
+    d_checks = {}
+
+    # every delivery has exactly one pickup and one drop-off
+    i_num_unique_points = len(
+        df_solution[['Delivery ID', 'Route Point Type']].drop_duplicates()
+    )
+    d_checks['route_point_count'] = _check(
+        abs(2 * i_num_deliveries - len(df_solution))
+        + abs(2 * i_num_deliveries - i_num_unique_points),
+        'there are {} deliveries, expecting {} route points, got {} '
+        'route points of which {} are unique'.format(
+            i_num_deliveries, 2 * i_num_deliveries,
+            len(df_solution), i_num_unique_points
+        )
+    )
+
+    arr_missing = np.setdiff1d(df_orders['delivery_id'].unique(), arr_delivery)
+    d_checks['deliveries_covered'] = _check(
+        len(arr_missing) + int((~ arr_known).sum()),
+        'deliveries missing: {}, unknown route points: {}'.format(
+            arr_missing[: 10].tolist(), int((~ arr_known).sum())
+        )
+    )
+
+    d_checks['food_ready_time'] = _check(
+        int((arr_known & (arr_time_sec < arr_ready_sec)).sum()),
+        'route points before the food ready time'
+    )
+
+    d_checks['route_point_type'] = _check(
+        int((~ (arr_pickup | arr_dropoff)).sum()),
+        'route point types other than Pickup and DropOff'
+    )
+
+    # a drop-off follows the pickup of the same delivery on the same route
+    arr_position = np.arange(len(arr_route))
+    df_pickup = pd.DataFrame({
+        'delivery': arr_delivery[arr_pickup],
+        'pickup_route': arr_route[arr_pickup],
+        'pickup_position': arr_position[arr_pickup]
+    }).drop_duplicates('delivery')
+    df_dropoff = pd.DataFrame({
+        'delivery': arr_delivery[arr_dropoff],
+        'dropoff_route': arr_route[arr_dropoff],
+        'dropoff_position': arr_position[arr_dropoff]
+    }).drop_duplicates('delivery')
+    df_pair = df_pickup.merge(df_dropoff, on = 'delivery', how = 'outer')
+    d_checks['pickup_dropoff_pairing'] = _check(
+        int((
+            df_pair['pickup_route'].isna()
+            | df_pair['dropoff_route'].isna()
+            | (df_pair['pickup_route'] != df_pair['dropoff_route'])
+            | (df_pair['pickup_position'] >= df_pair['dropoff_position'])
+        ).sum()),
+        'deliveries not picked up before their drop-off on the same route'
+    )
+
+    # consecutive points of a route are at least the travel time apart
+    arr_same_route = arr_route[1 :] == arr_route[: -1]
+    arr_travel_sec = du.haversine_pairs(
+        arr_lat[: -1], arr_long[: -1], arr_lat[1 :], arr_long[1 :]
+    ) / f_drive_speed_mps
+    arr_short = arr_same_route & (
+        arr_time_sec[1 :] - arr_time_sec[: -1]
+        <
+        np.floor(arr_travel_sec) - f_tolerance_sec
+    )
+    d_checks['travel_time'] = _check(
+        int(arr_short.sum()),
+        'not enough travel time to (route, delivery, type) {}'.format(
+            _first_rows(np.nonzero(arr_short)[0] + 1, arr_route, arr_delivery, arr_type)
+        )
+    )
+
+    ### metrics, delivery time is created_at to the last point of a delivery
+    df_points = pd.DataFrame({
+        'delivery': arr_delivery[arr_known],
+        'route': arr_route[arr_known],
+        'time': arr_time_sec[arr_known],
+        'created': arr_created_sec[arr_known]
+    })
+    df_delivery = df_points.groupby('delivery').agg(
+        time = ('time', 'max'), created = ('created', 'min')
+    )
+    f_average_delivery_min = float(
+        (df_delivery['time'] - df_delivery['created']).mean() / 60.0
+    )
+    d_checks['average_delivery_time'] = _check(
+        int(not f_average_delivery_min <= f_max_average_delivery_min),
+        'average delivery time {} > {} min'.format(
+            f_average_delivery_min, f_max_average_delivery_min
+        )
+    )
+
+    f_dasher_hours = float(
+        (df_points.groupby('route')['time'].max() - i_day_start_sec).sum() / 3600.0
+    )
+
+    return {
+        'passed': all(d_check['passed'] for d_check in d_checks.values()),
+        'num_deliveries': i_num_deliveries,
+        'num_route_points': len(df_solution),
+        'num_routes': int(len(np.unique(arr_route))),
+        'average_delivery_min': f_average_delivery_min,
+        'efficiency': i_num_deliveries / f_dasher_hours if f_dasher_hours > 0 else 0.0,
+        'checks': d_checks
+    }
+
+
+def assert_valid(d_report):
+
+    l_messages = [
+        '{}: {} violations, {}'.format(
+            s_check, d_check['num_violations'], d_check['message']
+        )
+        for s_check, d_check in d_report['checks'].items()
+        if not d_check['passed']
+    ]
+    assert not l_messages, '\n'.join(l_messages)
+
+
+def format_report(d_report):
+
+    l_lines = [
+        '{}: {}'.format(s_check, 'ok' if d_check['passed'] else '{} violations, {}'.format(
+            d_check['num_violations'], d_check['message']
+        ))
+        for s_check, d_check in d_report['checks'].items()
+    ]
+    l_lines.append('average delivery time {} min, efficiency {}'.format(
+        round(d_report['average_delivery_min'], 2), round(d_report['efficiency'], 4)
+    ))
+
+    return '\n'.join(l_lines)
+
+
+def _check(i_num_violations, s_message):
+
+    return {
+        'passed': i_num_violations == 0,
+        'num_violations': i_num_violations,
+        'message': s_message
+    }
+
+
+def _first_rows(arr_rows, *l_arrays, i_num_rows = 10):
+    return list(zip(*(arr[arr_rows[: i_num_rows]].tolist() for arr in l_arrays)))
+
+
+def _to_unix_sec(sr_time, s_time_format = None):
+
+    ### numbers are already unix seconds, strings are parsed with the format
+    if pd.api.types.is_numeric_dtype(sr_time):
+        return sr_time.to_numpy(dtype = np.int64)
+
+    if pd.api.types.is_string_dtype(sr_time) or sr_time.dtype == object:
+        sr_time = pd.to_datetime(sr_time, format = s_time_format)
+
+    return sr_time.to_numpy().astype('datetime64[s]').astype(np.int64)
\ No newline at end of file
@@ -1,8 +1,28 @@
-from doorDashDelivery import pipeline
+import argparse
+import json
+
+from doorDashDelivery import dispatch, pipeline
 
 if __name__ == '__main__':
 
-    pipeline.run_pipeline(
-        s_input_csv_path  = 'optimization_take_home.csv',
-        s_output_csv_path = 'output.csv'
+    parser = argparse.ArgumentParser(
+        description = 'Assign the orders of the input to dashers'
+    )
+    parser.add_argument('--input', default = 'optimization_take_home.csv')
+    parser.add_argument('--output', default = 'output.csv')
+    parser.add_argument(
+        '--dispatch', action = 'store_true',
+        help = 'replay the orders as they are created and dispatch them in rolling epochs'
+    )
+    parser.add_argument(
+        '--config', default = '{}',
+        help = 'json object of Config parameters to override'
+    )
+    args = parser.parse_args()
+
+    fn_run = dispatch.run_rolling_horizon if args.dispatch else pipeline.run_pipeline
+    fn_run(
+        s_input_csv_path   = args.input,
+        s_output_csv_path  = args.output,
+        d_config_overrides = json.loads(args.config)
     )
\ No newline at end of file
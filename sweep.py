@@ -0,0 +1,47 @@
+import argparse
+import json
+
+from doorDashDelivery import sweep
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description = 'Run the pipeline over a grid of Config parameters in parallel'
+    )
+    parser.add_argument('--input', default = 'optimization_take_home.csv')
+    parser.add_argument('--result-dir', default = './sweeps')
+    parser.add_argument(
+        '--grid', default = None,
+        help = 'json object of Config parameter -> list of values, '
+        'defaults to batch size and dashers per batch'
+    )
+    parser.add_argument(
+        '--config', default = '{}',
+        help = 'json object of Config parameters to override in every run'
+    )
+    parser.add_argument(
+        '--workers', type = int, default = 0,
+        help = 'concurrent runs, 0 means one per available core'
+    )
+    args = parser.parse_args()
+
+    df_results = sweep.run_sweep(
+        s_input_csv_path   = args.input,
+        s_result_dir       = args.result_dir,
+        d_grid             = None if args.grid is None else json.loads(args.grid),
+        d_config_overrides = json.loads(args.config),
+        i_num_workers      = args.workers
+    )
+
+    l_columns = [
+        s_column for s_column in (
+            ['label'] + list(sweep.D_DEFAULT_GRID if args.grid is None else json.loads(args.grid))
+            + ['wall_sec', 'efficiency', 'average_delivery_min', 'passed', 'pareto']
+        )
+        if s_column in df_results
+    ]
+    print(df_results[l_columns].to_string(index = False))
+    print('Pareto frontier of runtime versus quality')
+    print(df_results.loc[df_results['pareto'], l_columns].sort_values(
+        'wall_sec'
+    ).to_string(index = False))
\ No newline at end of file
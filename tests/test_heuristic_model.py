@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pytest
+
+from doorDashDelivery import pipeline
+from doorDashDelivery.model import heuristic, heuristic_model
+
+S_INPUT_CSV_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'optimization_take_home.csv'
+)
+
+
+def get_batch_config(i_batch_pos = 0):
+
+    ### config of one batch of the sample input, as _solve_batch sets it up
+    config = pipeline.create_config(S_INPUT_CSV_PATH, '', {'i_verbosity': 0})
+    orders = pipeline.parse_input(config)
+    config.get_solving_time_each_batch(len(orders))
+    config.create_travel_time_matrix(orders)
+    config.create_important_data(
+        pipeline.split_batches(config, orders)[i_batch_pos], i_batch_pos + 1
+    )
+    return config
+
+
+def test_solve_without_greedy_routes(monkeypatch):
+
+    config = get_batch_config()
+    monkeypatch.setattr(heuristic, 'greedy_insertion', lambda config: None)
+
+    solver = heuristic_model.HeuristicSolver(config, 1)
+    solver.solve()
+
+    i_num_orders = len(config.l_restaurants)
+    assert sorted(
+        i_node for l_route in solver.l_routes for i_node in l_route
+    ) == list(range(2 * i_num_orders))
+    assert solver.l_route_cost_sec == [
+        heuristic.schedule_route(config, l_route)[2] for l_route in solver.l_routes
+    ]
+
+
+def test_solve_without_greedy_routes_past_deadline(monkeypatch):
+
+    ### out of time, the master over the routes found so far still routes all
+    config = get_batch_config()
+    config.f_solving_sec = 0
+    monkeypatch.setattr(heuristic, 'greedy_insertion', lambda config: None)
+
+    solver = heuristic_model.HeuristicSolver(config, 1)
+    solver.solve()
+
+    i_num_orders = len(config.l_restaurants)
+    assert sorted(
+        i_node for l_route in solver.l_routes for i_node in l_route
+    ) == list(range(2 * i_num_orders))
+
+
+def test_solve_infeasible_batch(monkeypatch):
+
+    config = get_batch_config()
+    monkeypatch.setattr(
+        heuristic, 'get_arc_exists',
+        lambda config: np.zeros((len(config.l_nodes), len(config.l_nodes)), dtype = bool)
+    )
+
+    solver = heuristic_model.HeuristicSolver(config, 1)
+    with pytest.raises(ValueError, match = 'no feasible set of routes'):
+        solver.solve()
+
+
+def test_route_schedule_matches_schedule_route():
+
+    config = get_batch_config()
+    arr_arc_exists = heuristic.get_arc_exists(config)
+    i_num_orders = len(config.l_restaurants)
+    l_route = max(heuristic.greedy_insertion(config), key = len)
+    schedule = heuristic.RouteSchedule(config, arr_arc_exists, l_route)
+    assert schedule.f_cost_sec == heuristic.schedule_route(config, l_route)[2]
+
+    ### every way to move one order of the route elsewhere in it
+    for i_order in set(l_route) & set(range(i_num_orders)):
+        l_removed = [
+            i_node for i_node in l_route if i_node not in (i_order, i_order + i_num_orders)
+        ]
+        for i_pickup_pos in range(len(l_removed) + 1):
+            for i_dropoff_pos in range(len(l_removed) + 2):
+
+                l_candidate = list(l_removed)
+                l_candidate.insert(i_pickup_pos, i_order)
+                l_candidate.insert(i_dropoff_pos, i_order + i_num_orders)
+
+                f_expected_sec = None
+                if (
+                    l_candidate.index(i_order) < l_candidate.index(i_order + i_num_orders)
+                    and all(
+                        arr_arc_exists[i_orig, i_dest]
+                        for i_orig, i_dest in zip(
+                            [config.d_node_idx['source']] + l_candidate,
+                            l_candidate + [config.d_node_idx['target']]
+                        )
+                    )
+                ):
+                    f_expected_sec = heuristic.schedule_route(config, l_candidate)[2]
+                assert schedule.get_cost(l_candidate) == f_expected_sec
\ No newline at end of file